@@ -0,0 +1,189 @@
+"""
+Admission control for expensive routes.
+
+Each `Limiter` admits at most ``concurrency`` requests at a time and lets at
+most ``queue`` more wait for a slot, first come first served. A request
+that finds the queue full is turned away at once (`Overloaded`, 429); one
+that waits longer than ``timeout`` seconds gives up (503). Both carry a
+``Retry-After`` estimate from the recent service time, so clients back off
+instead of piling on, and cheap routes keep their latency while the
+expensive ones are saturated.
+
+Limits come from the environment, e.g. ``ADMISSION_UPLOAD_CONCURRENCY``,
+``ADMISSION_UPLOAD_QUEUE`` and ``ADMISSION_UPLOAD_TIMEOUT`` for the
+``upload`` limiter. Limiters are used from the event loop only.
+"""
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+# Weight of the latest hold time in the service-time average
+EWMA_ALPHA = 0.2
+
+
+class Overloaded(Exception):
+    def __init__(self, status_code: int, detail: str, retry_after: int) -> None:
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class Limiter:
+    def __init__(self, name: str, concurrency: int, queue: int, timeout: float) -> None:
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.queue = max(0, queue)
+        self.timeout = timeout
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        # Background work waiting for a slot nobody queued for (acquire_idle)
+        self._idle_waiters: List[asyncio.Future] = []
+        self._service_s = 1.0
+        self.counters = {"admitted": 0, "rejected_full": 0, "rejected_timeout": 0, "degraded": 0}
+        self.max_wait_s = 0.0
+
+    @classmethod
+    def from_env(cls, name: str, concurrency: int, queue: int, timeout: float) -> "Limiter":
+        prefix = f"ADMISSION_{name.upper()}_"
+        return cls(
+            name,
+            int(os.getenv(prefix + "CONCURRENCY", concurrency)),
+            int(os.getenv(prefix + "QUEUE", queue)),
+            float(os.getenv(prefix + "TIMEOUT", timeout)),
+        )
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    @property
+    def saturated(self) -> bool:
+        """No free slot: a new request would have to queue."""
+        return self.in_flight >= self.concurrency
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely free, from the queue length and recent service time."""
+        ahead = self.queued + max(0, self.in_flight - self.concurrency + 1)
+        return max(1, math.ceil(self._service_s * ahead / self.concurrency))
+
+    def _overloaded(self, status_code: int, counter: str, detail: str) -> Overloaded:
+        self.counters[counter] += 1
+        return Overloaded(status_code, f"{self.name}: {detail}", self.retry_after())
+
+    def enter(self) -> "Ticket":
+        """
+        Take a free slot or a place in the queue, without waiting; raises
+        `Overloaded` (429) if neither is free. Use the ticket as
+        ``async with ticket:`` to wait for the slot (503 after the timeout,
+        counted from here) and hold it.
+        """
+        if not self.saturated and not self._waiters:
+            self.in_flight += 1
+            return Ticket(self, None)
+        if self.queued >= self.queue:
+            raise self._overloaded(429, "rejected_full", "too many requests in progress")
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        return Ticket(self, waiter)
+
+    def try_acquire(self) -> bool:
+        """Take a slot only if one is free and nobody is waiting for it (release() it afterwards)."""
+        if self.saturated or self._waiters:
+            return False
+        self.in_flight += 1
+        self.counters["admitted"] += 1
+        return True
+
+    async def acquire_idle(self) -> None:
+        """
+        Wait until try_acquire() succeeds, without taking a place in the
+        queue (release() the slot afterwards). For background work: it never
+        delays or displaces a request, and it is woken by release() instead
+        of polling.
+        """
+        while not self.try_acquire():
+            idle = asyncio.get_running_loop().create_future()
+            self._idle_waiters.append(idle)
+            try:
+                await idle
+            finally:
+                if idle in self._idle_waiters:
+                    self._idle_waiters.remove(idle)
+
+    def release(self, held_s: Optional[float] = None) -> None:
+        if held_s is not None:
+            self._service_s += EWMA_ALPHA * (held_s - self._service_s)
+        # Hand the slot straight to the next waiter, so it cannot be overtaken
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+        idle, self._idle_waiters = self._idle_waiters, []
+        for waiter in idle:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def _abandon(self, waiter: Optional[asyncio.Future]) -> None:
+        """Give back a ticket's slot, or its place in the queue."""
+        if waiter is None or (waiter.done() and not waiter.cancelled()):
+            self.release()
+            return
+        waiter.cancel()
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "concurrency": self.concurrency,
+            "queue": self.queue,
+            "timeout_s": self.timeout,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "idle_waiters": len(self._idle_waiters),
+            "service_time_s": round(self._service_s, 3),
+            "max_wait_s": round(self.max_wait_s, 3),
+            "retry_after_s": self.retry_after(),
+            **self.counters,
+        }
+
+
+class Ticket:
+    """A slot or queue place of a `Limiter`; ``async with`` waits for the slot and holds it."""
+
+    def __init__(self, limiter: Limiter, waiter: Optional[asyncio.Future]) -> None:
+        self.limiter = limiter
+        self.waiter = waiter
+        self.created = time.monotonic()
+        self.started: Optional[float] = None
+
+    async def __aenter__(self) -> "Ticket":
+        limiter = self.limiter
+        if self.waiter is not None:
+            remaining = limiter.timeout - (time.monotonic() - self.created)
+            try:
+                await asyncio.wait_for(asyncio.shield(self.waiter), max(0.0, remaining))
+            except asyncio.TimeoutError:
+                limiter._abandon(self.waiter)
+                raise limiter._overloaded(503, "rejected_timeout", "timed out waiting for capacity")
+            except asyncio.CancelledError:
+                limiter._abandon(self.waiter)
+                raise
+            limiter.max_wait_s = max(limiter.max_wait_s, time.monotonic() - self.created)
+        limiter.counters["admitted"] += 1
+        self.started = time.monotonic()
+        return self
+
+    async def __aexit__(self, *exc: Any) -> None:
+        self.limiter.release(time.monotonic() - self.started)
+
+    def cancel(self) -> None:
+        """Give the ticket back without using it."""
+        self.limiter._abandon(self.waiter)
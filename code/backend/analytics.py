@@ -0,0 +1,189 @@
+"""
+Incrementally maintained analytics over the document store.
+
+Every document contributes a fixed multiset of counter keys (its decision,
+model/human agreement, bucketed features per decision, upload/analysis days).
+A write applies the difference between the old and new version of the one
+document it touched, so aggregates never require scanning the archive. A full
+rebuild recomputes the same counters from scratch for consistency checks.
+"""
+import json
+import math
+import sys
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+# Bin width per numeric feature; values are bucketed to the bin's lower edge.
+NUMERIC_BINS = {
+    "age": 10,
+    "height_cm": 5,
+    "weight_kg": 10,
+    "bmi": 2.5,
+    "packs_per_week": 1,
+    "drug_frequency": 1,
+    "sports_activity_h_per_week": 2,
+    "earning_chf": 25_000,
+}
+CATEGORICAL_FEATURES = [
+    "gender", "marital_status", "smoking", "drug_use", "drug_type",
+    "staying_abroad", "abroad_type", "dangerous_sports", "sport_type",
+    "medical_issue", "medical_type", "doctor_visits", "visit_type",
+    "regular_medication", "medication_type",
+]
+
+PENDING = "pending"
+MISSING = "missing"
+
+
+def final_decision(doc: Dict[str, Any]) -> str:
+    """Human override wins over the model; undecided documents are pending."""
+    return doc.get("human_prediction") or doc.get("model_prediction") or PENDING
+
+
+def _day(timestamp: Optional[str]) -> Optional[str]:
+    # Timestamps are stored as "YYYY-MM-DD HH:MM:SS"
+    if not timestamp or not isinstance(timestamp, str) or len(timestamp) < 10:
+        return None
+    return timestamp[:10]
+
+
+def numeric_bucket(feature: str, value: Any) -> str:
+    if value is None or value == "":
+        return MISSING
+    try:
+        v = float(value)
+    except (TypeError, ValueError):
+        return "unknown"
+    if math.isnan(v):
+        return MISSING
+    width = NUMERIC_BINS[feature]
+    edge = math.floor(v / width) * width
+    return f"{edge:g}"
+
+
+def contributions(doc: Optional[Dict[str, Any]]) -> Counter:
+    """The counter keys one document adds to the aggregates."""
+    keys: Counter = Counter()
+    if not doc:
+        return keys
+    decision = final_decision(doc)
+    model = doc.get("model_prediction")
+    human = doc.get("human_prediction")
+
+    keys[("documents",)] += 1
+    keys[("decision", decision)] += 1
+    keys[("model", model or PENDING)] += 1
+    keys[("human", human or PENDING)] += 1
+    if model and human:
+        keys[("agreement", "agree" if model == human else "override")] += 1
+    elif human:
+        keys[("agreement", "human_only")] += 1
+    elif model:
+        keys[("agreement", "model_only")] += 1
+
+    for feature in NUMERIC_BINS:
+        keys[("feature", decision, feature, numeric_bucket(feature, doc.get(feature)))] += 1
+    for feature in CATEGORICAL_FEATURES:
+        value = doc.get(feature)
+        keys[("feature", decision, feature, MISSING if value is None or value == "" else str(value))] += 1
+
+    for kind, field in (("uploaded", "uploaded_at"), ("analyzed", "analyzed_at"), ("reviewed", "reviewed_at")):
+        day = _day(doc.get(field))
+        if day:
+            keys[("throughput", kind, day)] += 1
+    return keys
+
+
+class AnalyticsAggregator:
+    """Counters kept in step with every document write."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counts: Counter = Counter()
+
+    def apply(self, before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]) -> None:
+        """Account for one document changing from `before` to `after` (None = absent)."""
+        delta = contributions(after)
+        delta.subtract(contributions(before))
+        with self._lock:
+            for key, n in delta.items():
+                if n:
+                    self._counts[key] += n
+                    if self._counts[key] == 0:
+                        del self._counts[key]
+
+    def rebuild(self, documents: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+        """Recompute from scratch and report how far the incremental state had drifted."""
+        fresh: Counter = Counter()
+        for doc in documents:
+            fresh.update(contributions(doc))
+        with self._lock:
+            keys = set(fresh) | set(self._counts)
+            diff = {k: fresh.get(k, 0) - self._counts.get(k, 0) for k in keys}
+            diff = {k: v for k, v in diff.items() if v}
+            self._counts = fresh
+        return {
+            "consistent": not diff,
+            "keys_differing": len(diff),
+            "documents": fresh.get(("documents",), 0),
+        }
+
+    def _items(self, prefix: str) -> List[Tuple[tuple, int]]:
+        with self._lock:
+            return [(k, v) for k, v in self._counts.items() if k[0] == prefix]
+
+    def decision_mix(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self._counts.get(("documents",), 0)
+        def mix(prefix: str) -> Dict[str, int]:
+            return dict(sorted((k[1], v) for k, v in self._items(prefix)))
+        return {"total": total, "final": mix("decision"), "model": mix("model"), "human": mix("human")}
+
+    def agreement(self) -> Dict[str, Any]:
+        counts = {k[1]: v for k, v in self._items("agreement")}
+        both = counts.get("agree", 0) + counts.get("override", 0)
+        return {
+            **{k: counts.get(k, 0) for k in ("agree", "override", "human_only", "model_only")},
+            "agreement_rate": counts.get("agree", 0) / both if both else None,
+            "override_rate": counts.get("override", 0) / both if both else None,
+        }
+
+    def feature_distributions(self, feature: Optional[str] = None) -> Dict[str, Dict[str, Dict[str, int]]]:
+        """{feature: {decision: {bucket: count}}}"""
+        out: Dict[str, Dict[str, Dict[str, int]]] = {}
+        for (_, decision, feat, bucket), v in self._items("feature"):
+            if feature and feat != feature:
+                continue
+            out.setdefault(feat, {}).setdefault(decision, {})[bucket] = v
+        return out
+
+    def throughput(self) -> Dict[str, Dict[str, int]]:
+        """{uploaded|analyzed|reviewed: {day: count}}"""
+        out: Dict[str, Dict[str, int]] = {"uploaded": {}, "analyzed": {}, "reviewed": {}}
+        for (_, kind, day), v in self._items("throughput"):
+            out[kind][day] = v
+        return {kind: dict(sorted(days.items())) for kind, days in out.items()}
+
+
+if __name__ == "__main__":
+    # Offline full rebuild: python analytics.py [data_dir]
+    # Reads the snapshot plus the mutation log, so run it while the server is stopped
+    from document_store import DocumentStore
+
+    data_dir = Path(sys.argv[1]) if len(sys.argv) > 1 else Path(__file__).parent / "data"
+    aggregator = AnalyticsAggregator()
+    store = DocumentStore(data_dir)
+    store.open()
+    try:
+        report = aggregator.rebuild(store.iter_documents())
+    finally:
+        store.close()
+    print(json.dumps({
+        "documents": report["documents"],
+        "decision_mix": aggregator.decision_mix(),
+        "agreement": aggregator.agreement(),
+        "throughput": aggregator.throughput(),
+    }, indent=2))
@@ -0,0 +1,427 @@
+"""
+The applicant schema, declared once.
+
+`FIELDS` lists the applicant fields with their type, the description the
+extraction model is given and what counts as a plausible value. Everything
+that used to repeat that list is generated from it:
+
+- extraction (workflow_agent): `form_data_model()`, `tool_properties()` and
+  `normalize_field()`, which turns the model's strings into typed values
+  with one precompiled converter per field;
+- storage and API (main): `pydantic_fields()` for DocumentData and
+  PredictRequest, `FIELD_NAMES`, and `compile_validator()`, which checks
+  stored values against a model without a pydantic round trip when they
+  already have the right type;
+- scoring: `RowEncoder`, compiled against the loaded preprocessor, writes
+  the model's encoded row straight from the typed values instead of going
+  through a DataFrame and the ColumnTransformer;
+- `check_model()` lists where the model's feature_names.json and
+  preprocessor disagree with the schema (run at startup).
+
+`python applicant_schema.py [--rows N]` compares the per-record cost of the
+old and the compiled path from extracted strings to encoded rows.
+"""
+import math
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+
+import numpy as np
+from pydantic import BaseModel, Field, ValidationError, create_model
+
+CATEGORY, BOOL, INT, FLOAT, DATE = "category", "bool", "int", "float", "date"
+PYTHON_TYPES: Dict[str, type] = {CATEGORY: str, BOOL: bool, INT: int, FLOAT: float, DATE: str}
+
+RISK_TYPES = ("safe", "warning", "danger")
+
+
+class FieldSpec:
+    """One applicant field: its kind, the extraction description and what is plausible."""
+
+    def __init__(
+        self,
+        name: str,
+        kind: str,
+        description: str,
+        choices: Tuple[Any, ...] = (),
+        value_range: Optional[Tuple[float, float]] = None,
+        gated_by: Optional[str] = None,
+    ) -> None:
+        self.name = name
+        self.kind = kind
+        self.description = description
+        self.choices = choices
+        self.value_range = value_range
+        # Detail fields that only apply when this yes/no field is true
+        self.gated_by = gated_by
+
+    @property
+    def numeric(self) -> bool:
+        return self.kind in (INT, FLOAT)
+
+
+_RISK = "risk type: 'safe', 'warning', 'danger', 'unknown'"
+
+# In the order the extraction tool lists them
+FIELDS: List[FieldSpec] = [
+    FieldSpec("gender", CATEGORY, "Gender: 'm', 'f', or 'other'", choices=("m", "f", "other")),
+    FieldSpec("age", INT, "Age in years", value_range=(0, 120)),
+    FieldSpec("marital_status", CATEGORY, "Marital status: 'single', 'married', 'divorced', 'widowed'",
+              choices=("single", "married", "divorced", "widowed")),
+    FieldSpec("height_cm", FLOAT, "Height in centimeters", value_range=(50, 250)),
+    FieldSpec("weight_kg", FLOAT, "Weight in kilograms", value_range=(20, 350)),
+    FieldSpec("bmi", FLOAT, "BMI (Body Mass Index)", value_range=(10, 80)),
+    FieldSpec("smoking", BOOL, "Smoking status: 'true' or 'false'"),
+    FieldSpec("packs_per_week", FLOAT, "Number of cigarette packs per week", value_range=(0, 100), gated_by="smoking"),
+    FieldSpec("drug_use", BOOL, "Drug use: 'true' or 'false'"),
+    FieldSpec("drug_frequency", FLOAT, "Frequency of drug use", value_range=(0, 100), gated_by="drug_use"),
+    FieldSpec("drug_type", CATEGORY, f"Drug {_RISK}", choices=RISK_TYPES, gated_by="drug_use"),
+    FieldSpec("staying_abroad", BOOL, "Staying abroad: 'true' or 'false'"),
+    FieldSpec("abroad_type", CATEGORY, f"Abroad {_RISK}", choices=RISK_TYPES, gated_by="staying_abroad"),
+    FieldSpec("dangerous_sports", BOOL, "Dangerous sports: 'true' or 'false'"),
+    FieldSpec("sport_type", CATEGORY, f"Sport {_RISK}", choices=RISK_TYPES, gated_by="dangerous_sports"),
+    FieldSpec("medical_issue", BOOL, "Medical issues: 'true' or 'false'"),
+    FieldSpec("medical_type", CATEGORY, f"Medical {_RISK}", choices=RISK_TYPES, gated_by="medical_issue"),
+    FieldSpec("doctor_visits", BOOL, "Doctor visits: 'true' or 'false'"),
+    FieldSpec("visit_type", CATEGORY, "Visit type: 'physician', 'specialist', 'hospital'",
+              choices=("physician", "specialist", "hospital"), gated_by="doctor_visits"),
+    FieldSpec("regular_medication", BOOL, "Regular medication: 'true' or 'false'"),
+    FieldSpec("medication_type", CATEGORY, f"Medication {_RISK}", choices=RISK_TYPES, gated_by="regular_medication"),
+    FieldSpec("sports_activity_h_per_week", FLOAT, "Sports activity hours per week", value_range=(0, 80)),
+    FieldSpec("earning_chf", INT, "Annual earning in CHF", value_range=(0, 10_000_000)),
+    FieldSpec("birthdate", DATE, "Birthdate in YYYY-MM-DD format"),
+]
+SPECS: Dict[str, FieldSpec] = {spec.name: spec for spec in FIELDS}
+
+FIELD_NAMES = [spec.name for spec in FIELDS]
+NUMERIC_FIELDS = [spec.name for spec in FIELDS if spec.numeric]
+BOOLEAN_FIELDS = [spec.name for spec in FIELDS if spec.kind == BOOL]
+CATEGORICAL_FIELDS = [spec.name for spec in FIELDS if spec.kind in (BOOL, CATEGORY)]
+FIELD_CHOICES = {spec.name: set(spec.choices) for spec in FIELDS if spec.choices}
+# Plausible ranges; values outside them are more likely misreads than facts
+FIELD_RANGES = {spec.name: spec.value_range for spec in FIELDS if spec.value_range}
+GATED_BY = {spec.name: spec.gated_by for spec in FIELDS if spec.gated_by}
+
+
+def form_data_model() -> Type[BaseModel]:
+    """The extraction output as a pydantic model: every field an optional string."""
+    return create_model(
+        "FormDataSchema",
+        __doc__="Schema for the extracted form data matching the agent's output schema.",
+        **{spec.name: (Optional[str], Field(None, description=spec.description)) for spec in FIELDS},
+    )
+
+
+def tool_properties() -> Dict[str, Dict[str, str]]:
+    """JSON-schema properties of the extraction tool (the model answers with strings)."""
+    return {spec.name: {"type": "string", "description": spec.description} for spec in FIELDS}
+
+
+def pydantic_fields() -> Dict[str, Any]:
+    """Typed, optional pydantic field definitions for create_model (DocumentData, PredictRequest)."""
+    return {spec.name: (Optional[PYTHON_TYPES[spec.kind]], None) for spec in FIELDS}
+
+
+# --- Extracted strings -> typed values ---
+
+# Answers with the same meaning in every field
+_CONSTANTS = {"true": True, "false": False, "": None, "unknown": "unknown"}
+
+
+def _identity(value: Any) -> Any:
+    return value
+
+
+def _number(value: Any) -> Any:
+    try:
+        return float(value) if "." in str(value) else int(value)
+    except (ValueError, TypeError):
+        return value
+
+
+_CONVERTERS: Dict[str, Callable[[Any], Any]] = {spec.name: _number if spec.numeric else _identity for spec in FIELDS}
+
+
+def normalize_field(key: str, value: Any) -> Any:
+    """Convert one extracted value for our backend (string booleans, numeric strings, empty strings)."""
+    if isinstance(value, str) and value in _CONSTANTS:
+        return _CONSTANTS[value]
+    return _CONVERTERS.get(key, _identity)(value)
+
+
+def normalize_fields(arguments: Dict[str, Any]) -> Dict[str, Any]:
+    """normalize_field over one extraction answer."""
+    return {key: normalize_field(key, value) for key, value in arguments.items()}
+
+
+# --- Typed values -> validated model inputs ---
+
+def compile_validator(model: Type[BaseModel]) -> Callable[[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """
+    `validate(data)`: the schema fields of `data` as `model(...).model_dump()`
+    would return them, or None where the model rejects them. Values that
+    already have their field's type (the usual case for stored documents)
+    are taken as they are; only the others go through pydantic.
+    """
+    exact = {spec.name: PYTHON_TYPES[spec.kind] for spec in FIELDS if spec.name in model.model_fields}
+    floats = {name for name, kind in exact.items() if kind is float}
+
+    def validate(data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        out: Dict[str, Any] = {}
+        for name, kind in exact.items():
+            value = data.get(name)
+            if value is None or type(value) is kind:
+                out[name] = value
+            elif name in floats and type(value) is int:
+                out[name] = float(value)
+            else:
+                try:
+                    return model.model_validate({name: data.get(name) for name in exact}).model_dump(include=set(exact))
+                except ValidationError:
+                    return None
+        return out
+
+    return validate
+
+
+# --- Typed values -> encoded model row ---
+
+def _python_value(category: Any) -> Any:
+    """A preprocessor category as the Python value documents hold (np.True_ -> True)."""
+    return category.item() if isinstance(category, np.generic) else category
+
+
+def _model_categories(feature_meta: Dict[str, Any], preprocessor: Any) -> Dict[str, List[Any]]:
+    """Categories per categorical column, from the fitted one-hot encoder if there is one."""
+    categorical_cols: List[str] = feature_meta.get("categorical_cols", [])
+    encoder = getattr(preprocessor, "named_transformers_", {}).get("cat") if preprocessor is not None else None
+    categories = getattr(encoder, "categories_", None)
+    if categories is not None and len(categories) == len(categorical_cols):
+        return {col: [_python_value(c) for c in cats] for col, cats in zip(categorical_cols, categories)}
+    # Without the encoder, recover the categories from the one-hot column names
+    out: Dict[str, List[Any]] = {col: [] for col in categorical_cols}
+    literals = {"True": True, "False": False}
+    for name in feature_meta.get("onehot_feature_names", []):
+        for col in sorted(categorical_cols, key=len, reverse=True):
+            if name.startswith(f"{col}_"):
+                value = name[len(col) + 1:]
+                out[col].append(literals.get(value, value))
+                break
+    return out
+
+
+class RowEncoder:
+    """
+    The preprocessor's encoding (one-hot categoricals, numerics passed
+    through) compiled into lookups: for each categorical column a dict from
+    value to output column, for each numeric its output column. Unseen
+    categories encode as all zeros like OneHotEncoder(handle_unknown='ignore');
+    missing or non-numeric numerics as NaN, which the booster treats as missing.
+    """
+
+    def __init__(self, feature_meta: Dict[str, Any], preprocessor: Any = None) -> None:
+        names: List[str] = feature_meta.get("all_feature_names_after_pre", [])
+        position = {name: i for i, name in enumerate(names)}
+        self.width = len(names)
+        self.categorical: List[Tuple[str, Dict[Any, int]]] = []
+        for col, categories in _model_categories(feature_meta, preprocessor).items():
+            lookup = {c: position[f"{col}_{c}"] for c in categories if f"{col}_{c}" in position}
+            self.categorical.append((col, lookup))
+        self.numeric: List[Tuple[str, int]] = [
+            (col, position[col]) for col in feature_meta.get("numeric_cols", []) if col in position
+        ]
+
+    def encode(self, payloads: List[Dict[str, Any]]) -> np.ndarray:
+        """Encoded rows (float64, one per payload) in all_feature_names_after_pre order."""
+        out = np.zeros((len(payloads), self.width), dtype=np.float64)
+        for i, payload in enumerate(payloads):
+            row = out[i]
+            for col, lookup in self.categorical:
+                value = payload.get(col)
+                try:
+                    j = lookup.get(value)
+                except TypeError:  # unhashable, e.g. a list in an imported document
+                    j = None
+                if j is not None:
+                    row[j] = 1.0
+            for col, j in self.numeric:
+                value = payload.get(col)
+                row[j] = value if isinstance(value, (int, float)) and not isinstance(value, bool) else math.nan
+        return out
+
+    def verify(self, feature_meta: Dict[str, Any], preprocessor: Any, rows: int = 200, seed: int = 0) -> bool:
+        """Whether encode() matches preprocessor.transform() on sample payloads over every category."""
+        import model_artifacts
+
+        payloads = sample_payloads(rows, seed, extra_categories=_model_categories(feature_meta, preprocessor))
+        expected = np.asarray(preprocessor.transform(model_artifacts.build_input_frame(feature_meta, payloads)), dtype=np.float64)
+        actual = self.encode(payloads)
+        return expected.shape == actual.shape and bool(np.array_equal(expected, actual, equal_nan=True))
+
+
+def check_model(feature_meta: Dict[str, Any], preprocessor: Any = None) -> List[str]:
+    """Where the model's inputs (feature_names.json, the fitted encoder) disagree with the schema."""
+    problems: List[str] = []
+    categorical_cols: List[str] = feature_meta.get("categorical_cols", [])
+    numeric_cols: List[str] = feature_meta.get("numeric_cols", [])
+    for col in categorical_cols + numeric_cols:
+        spec = SPECS.get(col)
+        if spec is None:
+            problems.append(f"{col}: model input is not an applicant field (always missing)")
+        elif col in numeric_cols and not spec.numeric:
+            problems.append(f"{col}: numeric model input, but a {spec.kind} field")
+        elif col in categorical_cols and spec.kind not in (BOOL, CATEGORY):
+            problems.append(f"{col}: categorical model input, but a {spec.kind} field")
+    for spec in FIELDS:
+        if spec.kind != DATE and spec.name not in categorical_cols + numeric_cols:
+            problems.append(f"{spec.name}: applicant field is not a model input (ignored by scoring)")
+
+    for col, categories in _model_categories(feature_meta, preprocessor).items():
+        spec = SPECS.get(col)
+        if spec is None:
+            continue
+        expected = [False, True] if spec.kind == BOOL else list(spec.choices)
+        unseen = [c for c in expected if c not in categories]
+        unreachable = [c for c in categories if c not in expected]
+        if unseen:
+            problems.append(f"{col}: {', '.join(map(repr, unseen))} not seen in training (encoded as all zeros)")
+        if unreachable:
+            problems.append(f"{col}: model categories {', '.join(map(repr, unreachable))} are never extracted")
+
+    names: List[str] = feature_meta.get("all_feature_names_after_pre", [])
+    expected_names = list(feature_meta.get("onehot_feature_names", [])) + numeric_cols
+    if names != expected_names:
+        problems.append("all_feature_names_after_pre is not the one-hot columns followed by numeric_cols")
+    if preprocessor is not None and hasattr(preprocessor, "get_feature_names_out"):
+        fitted = [name.split("__", 1)[-1] for name in preprocessor.get_feature_names_out()]
+        if fitted != names:
+            problems.append("preprocessor output columns differ from all_feature_names_after_pre")
+    return problems
+
+
+# --- Sample data and benchmark ---
+
+def sample_payloads(rows: int, seed: int = 0, extra_categories: Optional[Dict[str, List[Any]]] = None) -> List[Dict[str, Any]]:
+    """Typed applicant payloads covering every choice, None and unseen values."""
+    import random
+
+    rng = random.Random(seed)
+    payloads = []
+    for _ in range(rows):
+        payload: Dict[str, Any] = {}
+        for spec in FIELDS:
+            if spec.kind == BOOL:
+                options: List[Any] = [True, False, None]
+            elif spec.kind == CATEGORY:
+                options = list(spec.choices) + list((extra_categories or {}).get(spec.name, [])) + ["unknown", None]
+            elif spec.numeric:
+                low, high = spec.value_range or (0, 100)
+                value = rng.randint(int(low), int(high)) if spec.kind == INT else round(rng.uniform(low, high), 1)
+                options = [value, value, value, None]
+            else:
+                options = [f"{rng.randint(1940, 2005)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}", None]
+            payload[spec.name] = rng.choice(options)
+        payloads.append(payload)
+    return payloads
+
+
+def _extracted_strings(payload: Dict[str, Any], rng: Any) -> Dict[str, str]:
+    """An extraction answer as the model gives it (everything a string; sometimes "unknown" or empty)."""
+    answer = {}
+    for key, value in payload.items():
+        if value is None:
+            answer[key] = rng.choice(["", "unknown"]) if SPECS[key].kind in (CATEGORY, DATE) else ""
+        elif isinstance(value, bool):
+            answer[key] = "true" if value else "false"
+        else:
+            answer[key] = str(value)
+    return answer
+
+
+def _legacy_normalize_field(key: str, value: Any) -> Any:
+    """workflow_agent.normalize_field before the registry, for the comparison."""
+    if value in ["true", "false"]:
+        return value == "true"
+    elif value == "":
+        return None
+    elif value == "unknown":
+        return "unknown"
+    if key in NUMERIC_FIELDS:
+        try:
+            if "." in str(value):
+                return float(value)
+            else:
+                return int(value)
+        except (ValueError, TypeError):
+            return value
+    return value
+
+
+def _benchmark(rows: int, repeat: int) -> None:
+    import random
+    import time
+    from pathlib import Path
+
+    import model_artifacts
+
+    artifacts = model_artifacts.load_artifacts(Path(__file__).parent / "data" / "model")
+    feature_meta = artifacts.get("feature_meta")
+    preprocessor = artifacts.get("preprocessor")
+    if not feature_meta or preprocessor is None:
+        raise SystemExit("Needs the model artifacts in data/model/")
+
+    for problem in check_model(feature_meta, preprocessor):
+        print("schema mismatch:", problem)
+    encoder = RowEncoder(feature_meta, preprocessor)
+    print("compiled encoder matches the preprocessor:", encoder.verify(feature_meta, preprocessor))
+
+    rng = random.Random(1)
+    # Extracted numerics that are "unknown" cannot be scored by the old path; keep the batch scorable
+    answers = [_extracted_strings(p, rng) for p in sample_payloads(rows, seed=1)]
+    PredictRequest = create_model("PredictRequest", **pydantic_fields())
+    validate = compile_validator(PredictRequest)
+
+    def before_single(answer: Dict[str, str]) -> np.ndarray:
+        fields = {k: _legacy_normalize_field(k, v) for k, v in answer.items()}
+        payload = PredictRequest.model_validate(fields).model_dump()
+        return preprocessor.transform(model_artifacts.build_input_frame(feature_meta, [payload]))
+
+    def after_single(answer: Dict[str, str]) -> np.ndarray:
+        return encoder.encode([validate(normalize_fields(answer))])
+
+    def before_batch() -> np.ndarray:
+        docs = [{k: _legacy_normalize_field(k, v) for k, v in a.items()} for a in answers]
+        payloads = [PredictRequest.model_validate(d).model_dump() for d in docs]
+        return preprocessor.transform(model_artifacts.build_input_frame(feature_meta, payloads))
+
+    def after_batch() -> np.ndarray:
+        return encoder.encode([validate(normalize_fields(a)) for a in answers])
+
+    expected = np.asarray(before_batch(), dtype=np.float64)
+    assert np.array_equal(expected, after_batch(), equal_nan=True), "compiled path disagrees with the preprocessor"
+    single = answers[: min(rows, 2000)]
+    assert all(np.array_equal(np.asarray(before_single(a), dtype=np.float64), after_single(a), equal_nan=True) for a in single[:50])
+
+    def best_us(fn: Callable[[], Any], n: int) -> float:
+        best = math.inf
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - started)
+        return best / n * 1e6
+
+    print(f"{rows} extracted records, best of {repeat}, per record:")
+    for label, before, after, n in (
+        ("one at a time (upload, explanation)", lambda: [before_single(a) for a in single], lambda: [after_single(a) for a in single], len(single)),
+        ("batched (bulk, import, rescoring)", before_batch, after_batch, rows),
+    ):
+        b, a = best_us(before, n), best_us(after, n)
+        print(f"  {label:38s} before {b:9.1f} us  after {a:7.1f} us  ({b / a:.0f}x)")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Per-record cost from extracted strings to encoded model rows, before and after the compiled schema")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    _benchmark(args.rows, args.repeat)
@@ -0,0 +1,168 @@
+"""
+Extraction benchmarks against the local stub model (no API key needed).
+
+    python bench/extraction.py               # time-to-first-field, buffered vs streaming
+    python bench/extraction.py --transfer 3  # bytes sent per extraction, inline vs by file ID
+    python bench/extraction.py --reextract   # full re-run vs targeted re-extraction
+
+Stub pacing is set with --first-token-delay, --delta-delay and --delta-chars.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import stub_openai  # noqa: E402
+from workflow_agent import (  # noqa: E402
+    CONFIDENT,
+    PdfFiles,
+    extract_from_pdf_bytes,
+    field_confidence,
+    low_confidence_fields,
+    reextract_fields,
+    relevant_pages,
+    stream_from_pdf_bytes,
+)
+
+
+async def benchmark_streaming(client: Any, pdf_content: bytes = b"%PDF-1.4 stub") -> Dict[str, Any]:
+    """Time-to-first-field and total latency of the buffered and streaming modes."""
+    t0 = time.perf_counter()
+    buffered = await extract_from_pdf_bytes(client, pdf_content)
+    buffered_total = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    first = None
+    streamed: Dict[str, Any] = {}
+    async for key, value in stream_from_pdf_bytes(client, pdf_content):
+        if first is None:
+            first = time.perf_counter() - t0
+        streamed[key] = value
+    streamed_total = time.perf_counter() - t0
+
+    return {
+        "fields": len(streamed),
+        "same_result": streamed == buffered,
+        "buffered": {"time_to_first_field_s": round(buffered_total, 3), "total_s": round(buffered_total, 3)},
+        "streaming": {"time_to_first_field_s": round(first or streamed_total, 3), "total_s": round(streamed_total, 3)},
+    }
+
+
+async def benchmark_transfer(client: Any, pdf_content: bytes, extractions: int = 3) -> Dict[str, Any]:
+    """Bytes sent for `extractions` extractions of one PDF, inline and by file reference."""
+    results: Dict[str, Any] = {"pdf_bytes": len(pdf_content), "extractions": extractions}
+    for mode in ("inline", "file"):
+        files = PdfFiles(client, mode)
+        received = getattr(client, "received_bytes", None)
+        per_extraction = []
+        for _ in range(extractions):
+            report: Dict[str, Any] = {}
+            await extract_from_pdf_bytes(client, pdf_content, files, report)
+            per_extraction.append(report["bytes_sent"])
+        results[mode] = {
+            "bytes_per_extraction": per_extraction,
+            "total_bytes": sum(per_extraction),
+            # What the stub actually received (uploads + request bodies), as a cross-check
+            "received_by_stub": None if received is None else client.received_bytes - received,
+        }
+    results["saved"] = round(1 - results["file"]["total_bytes"] / results["inline"]["total_bytes"], 3)
+    return results
+
+
+def form_pdf(pages: List[List[str]]) -> bytes:
+    """A PDF with a text layer: one page per list of lines."""
+    objects = [b"<</Type/Catalog/Pages 2 0 R>>", None, b"<</Type/Font/Subtype/Type1/BaseFont/Helvetica>>"]
+    kids = []
+    for lines in pages:
+        text = " ".join(f"({line}) Tj 0 -16 Td" for line in lines).encode("latin-1")
+        stream = b"BT /F1 11 Tf 50 760 Td " + text + b" ET"
+        objects.append(b"<</Length %d>>stream\n" % len(stream) + stream + b"\nendstream")
+        objects.append(b"<</Type/Page/Parent 2 0 R/MediaBox[0 0 612 792]/Resources<</Font<</F1 3 0 R>>>>/Contents %d 0 R>>" % len(objects))
+        kids.append(len(objects))
+    objects[1] = b"<</Type/Pages/Kids[%s]/Count %d>>" % (b" ".join(b"%d 0 R" % k for k in kids), len(kids))
+    out, offsets = bytearray(b"%PDF-1.4\n"), []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj" % number + body + b"endobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer<</Size %d/Root 1 0 R>>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+# A six-page application form; each field's label sits on one page
+FORM_PAGES = [
+    ["Application for life insurance", "Personal details", "Gender: female", "Date of birth: 1983-05-17", "Marital status: married"],
+    ["Health", "Height: 168 cm", "Weight: 64.5 kg", "Smoking: no", "Medical issues: yes", "Doctor visits: specialist"],
+    ["Medication", "Regular medication: yes, considered safe", "Drugs: no"],
+    ["Lifestyle", "Staying abroad: yes", "Sports: 3.5 h per week, no dangerous sports"],
+    ["Finances", "Annual income: CHF 98000"],
+    ["Declarations and signature"],
+]
+
+
+async def benchmark_reextraction(stub_factory: Callable[..., Any], first_pass: Dict[str, Any], answers: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Tokens and latency of re-extracting a first pass's low-confidence fields:
+    full re-run vs. reduced schema vs. reduced schema on the relevant pages.
+    """
+    pdf = form_pdf(FORM_PAGES)
+    fields = await extract_from_pdf_bytes(stub_factory(first_pass), pdf)
+    low = low_confidence_fields(fields)
+    client = stub_factory(answers)
+    runs: Dict[str, Any] = {}
+    for name, kwargs in (
+        ("full_rerun", {}),
+        ("targeted", {"fields": low}),
+        ("targeted_pages", {"fields": low, "pages": relevant_pages(pdf, low)}),
+    ):
+        report: Dict[str, Any] = {}
+        if "fields" in kwargs:
+            values = await reextract_fields(client, pdf, kwargs["fields"], pages=kwargs.get("pages"), report=report)
+        else:
+            values = {k: v for k, v in (await extract_from_pdf_bytes(client, pdf, report=report)).items() if k in low}
+        runs[name] = {
+            "pages": kwargs.get("pages") or "all",
+            "recovered": sorted(k for k, v in values.items() if field_confidence(k, v, {**fields, **values}) == CONFIDENT),
+            **{k: report[k] for k in ("prompt_tokens", "completion_tokens", "latency_s", "bytes_sent")},
+        }
+    full = runs["full_rerun"]
+    for run in runs.values():
+        tokens = run["prompt_tokens"] + run["completion_tokens"]
+        run["token_savings"] = round(1 - tokens / (full["prompt_tokens"] + full["completion_tokens"]), 3)
+        run["latency_savings"] = round(1 - run["latency_s"] / full["latency_s"], 3)
+    return {"pdf_pages": len(FORM_PAGES), "low_confidence": low, "runs": runs}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare buffered and streaming extraction against a stub model.")
+    parser.add_argument("--first-token-delay", type=float, default=stub_openai.FIRST_TOKEN_DELAY)
+    parser.add_argument("--delta-delay", type=float, default=stub_openai.DELTA_DELAY)
+    parser.add_argument("--delta-chars", type=int, default=stub_openai.DELTA_CHARS)
+    parser.add_argument("--transfer", type=int, metavar="N", help="instead report bytes sent for N extractions of one PDF, inline vs by file ID")
+    parser.add_argument("--pdf", help="PDF for --transfer (default: a 200 KB dummy)")
+    parser.add_argument("--reextract", action="store_true", help="instead compare a full re-run with targeted re-extraction of low-confidence fields")
+    args = parser.parse_args()
+
+    def stub(answers: Any = None) -> stub_openai.StubOpenAI:
+        return stub_openai.StubOpenAI(args.first_token_delay, args.delta_delay, args.delta_chars, answers)
+
+    if args.reextract:
+        # A first pass that missed or could not read a few fields
+        first_pass = {**stub_openai.CANNED_ARGUMENTS, "height_cm": "", "medication_type": "unknown", "earning_chf": "unknown", "gender": "x"}
+        result = asyncio.run(benchmark_reextraction(stub, first_pass, stub_openai.CANNED_ARGUMENTS))
+    elif args.transfer:
+        pdf = Path(args.pdf).read_bytes() if args.pdf else b"%PDF-1.4 stub\n" + bytes(range(256)) * 800
+        result = asyncio.run(benchmark_transfer(stub(), pdf, args.transfer))
+    else:
+        result = asyncio.run(benchmark_streaming(stub()))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Load test: saturate the expensive routes and watch the cheap ones.
+
+Fires bursts of concurrent uploads and explained predictions at a running
+backend while a probe keeps timing cheap requests (health, document list,
+search). Reports probe latency before and during the burst, the status
+codes of the expensive requests (including 429/503 with Retry-After and
+decision-only predictions), and the server's admission metrics.
+
+    OPENAI_STUB=1 uvicorn main:app --port 8000 &
+    python bench/loadtest.py --uploads 40 --predicts 60
+
+Documents created by the test are deleted afterwards.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from collections import Counter
+from typing import Any, Dict, List
+
+import httpx
+
+CHEAP_PATHS = ["/health", "/documents", "/search?q=a"]
+
+# Smallest well-formed PDF: one empty page
+TINY_PDF = (
+    b"%PDF-1.4\n1 0 obj<</Type/Catalog/Pages 2 0 R>>endobj\n"
+    b"2 0 obj<</Type/Pages/Kids[3 0 R]/Count 1>>endobj\n"
+    b"3 0 obj<</Type/Page/Parent 2 0 R/MediaBox[0 0 612 792]>>endobj\n"
+    b"trailer<</Root 1 0 R>>\n%%EOF\n"
+)
+
+APPLICANT = {
+    "gender": "f", "age": 42, "marital_status": "married", "height_cm": 168, "weight_kg": 64.5,
+    "bmi": 22.9, "smoking": False, "drug_use": False, "staying_abroad": True, "abroad_type": "safe",
+    "dangerous_sports": False, "medical_issue": True, "medical_type": "warning", "doctor_visits": True,
+    "visit_type": "specialist", "regular_medication": True, "medication_type": "safe",
+    "sports_activity_h_per_week": 3.5, "earning_chf": 98000, "include_explanation": True,
+}
+
+
+def _percentiles(samples: List[float]) -> str:
+    if not samples:
+        return "no samples"
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    return f"n={len(samples):4d}  p50 {statistics.median(samples):7.1f} ms  p95 {p95:7.1f} ms  max {samples[-1]:7.1f} ms"
+
+
+async def _probe(client: httpx.AsyncClient, stop: asyncio.Event, samples: List[float]) -> None:
+    i = 0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await client.get(CHEAP_PATHS[i % len(CHEAP_PATHS)])
+        samples.append((time.perf_counter() - started) * 1000)
+        i += 1
+        await asyncio.sleep(0.02)
+
+
+async def _upload(client: httpx.AsyncClient, i: int, results: Counter, created: List[str], latencies: List[float]) -> None:
+    started = time.perf_counter()
+    r = await client.post("/upload", files={"files": (f"load-{i}.pdf", TINY_PDF, "application/pdf")})
+    latencies.append((time.perf_counter() - started) * 1000)
+    results[f"{r.status_code}" + (" (Retry-After)" if "retry-after" in r.headers else "")] += 1
+    if r.status_code == 200 and r.json().get("id"):
+        created.append(r.json()["id"])
+
+
+async def _predict(client: httpx.AsyncClient, i: int, results: Counter, latencies: List[float]) -> None:
+    started = time.perf_counter()
+    # Vary the applicant so that no stored explanation can answer
+    r = await client.post("/predict", json={**APPLICANT, "earning_chf": 60000 + i})
+    latencies.append((time.perf_counter() - started) * 1000)
+    if r.status_code == 200:
+        body = r.json()
+        results["200 decision-only" if body.get("degraded") else "200 explained"] += 1
+    else:
+        results[str(r.status_code)] += 1
+
+
+async def run(url: str, uploads: int, predicts: int, baseline_s: float) -> Dict[str, Any]:
+    limits = httpx.Limits(max_connections=uploads + predicts + 10)
+    async with httpx.AsyncClient(base_url=url, timeout=120, limits=limits) as client:
+        stop = asyncio.Event()
+        baseline: List[float] = []
+        probe = asyncio.create_task(_probe(client, stop, baseline))
+        await asyncio.sleep(baseline_s)
+        stop.set()
+        await probe
+
+        stop = asyncio.Event()
+        loaded: List[float] = []
+        probe = asyncio.create_task(_probe(client, stop, loaded))
+        upload_results: Counter = Counter()
+        predict_results: Counter = Counter()
+        upload_ms: List[float] = []
+        predict_ms: List[float] = []
+        created: List[str] = []
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(_upload(client, i, upload_results, created, upload_ms) for i in range(uploads)),
+            *(_predict(client, i, predict_results, predict_ms) for i in range(predicts)),
+        )
+        burst_s = time.perf_counter() - started
+        stop.set()
+        await probe
+
+        metrics = (await client.get("/metrics")).json()
+        for doc_id in created:
+            await client.delete(f"/documents/{doc_id}")
+
+    return {
+        "burst_s": burst_s,
+        "baseline": baseline,
+        "loaded": loaded,
+        "uploads": upload_results,
+        "upload_ms": upload_ms,
+        "predicts": predict_results,
+        "predict_ms": predict_ms,
+        "admission": metrics.get("admission", {}),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Saturate /upload and explained /predict; time cheap endpoints")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--uploads", type=int, default=40)
+    parser.add_argument("--predicts", type=int, default=60)
+    parser.add_argument("--baseline", type=float, default=3.0, help="seconds of probing before the burst")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args.url, args.uploads, args.predicts, args.baseline))
+    print(f"cheap endpoints, idle:       {_percentiles(report['baseline'])}")
+    print(f"cheap endpoints, under load: {_percentiles(report['loaded'])}")
+    print(f"burst of {args.uploads} uploads + {args.predicts} explained predicts took {report['burst_s']:.1f}s")
+    print(f"  /upload:  {dict(report['uploads'])}  {_percentiles(report['upload_ms'])}")
+    print(f"  /predict: {dict(report['predicts'])}  {_percentiles(report['predict_ms'])}")
+    for name, stats in report["admission"].items():
+        print(f"  {name}: {stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+"""
+Bulk ingestion of many applications from a ZIP archive or a multipart batch.
+
+Entries are listed first (a ZIP's central directory, or the spooled parts of
+a multipart request) and grouped into applications by name:
+
+- entries in a folder form one application per folder;
+- a top-level PDF is an application of its own;
+- top-level images are grouped by name with a trailing page number removed
+  (``smith_1.jpg``, ``smith_p2.png``, ``smith-page-3.jpg`` -> ``smith``).
+
+Only the applications currently in the pipeline are held in memory: a
+producer reads one application's bytes at a time into a bounded queue and a
+fixed number of workers take them through conversion, extraction and
+scoring. `BulkJob` is the per-item manifest, readable while the job runs.
+"""
+import asyncio
+import io
+import re
+import shutil
+import time
+import zipfile
+from pathlib import Path, PurePosixPath
+from typing import Any, Awaitable, BinaryIO, Callable, Dict, List, Optional, Tuple
+
+try:
+    from PyPDF2 import PdfReader, PdfWriter
+    HAS_PYPDF2 = True
+except ImportError:
+    HAS_PYPDF2 = False
+
+PDF_SUFFIXES = (".pdf",)
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png")
+ARCHIVE_SUFFIXES = (".zip",)
+MAX_ENTRIES = 5000
+# Larger entries are skipped (also guards against decompression bombs)
+MAX_ENTRY_BYTES = 50 * 1024 * 1024
+# "name_1", "name-p2", "name page 03", "name_seite_4" -> "name"
+PAGE_SUFFIX = re.compile(r"^(?P<base>.+?)[ _.-]+(?:p|page|seite|s)?[ _.-]*\d{1,3}$", re.IGNORECASE)
+
+# Item statuses, in pipeline order
+PENDING, CONVERTING, EXTRACTING, SCORING, STORING, DONE, FAILED = (
+    "pending", "converting", "extracting", "scoring", "storing", "done", "failed"
+)
+
+
+class Entry:
+    """One file of a batch; `read()` loads its bytes on demand."""
+
+    def __init__(self, name: str, size: int, read: Callable[[], bytes]) -> None:
+        self.name = name
+        self.size = size
+        self.read = read
+
+
+def _natural_key(name: str) -> List[Any]:
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r"(\d+)", name)]
+
+
+def application_key(name: str) -> str:
+    """Which application an entry belongs to (see the module docstring)."""
+    path = PurePosixPath(name)
+    if len(path.parts) > 1:
+        return str(path.parent)
+    if path.suffix.lower() in IMAGE_SUFFIXES:
+        match = PAGE_SUFFIX.match(path.stem)
+        return match["base"] if match else path.stem
+    return name
+
+
+def _skip_reason(entry: Entry) -> Optional[str]:
+    path = PurePosixPath(entry.name)
+    if any(part.startswith(".") or part == "__MACOSX" for part in path.parts):
+        return "hidden file"
+    if path.suffix.lower() not in PDF_SUFFIXES + IMAGE_SUFFIXES:
+        return "unsupported file type"
+    if entry.size > MAX_ENTRY_BYTES:
+        return f"larger than {MAX_ENTRY_BYTES // (1024 * 1024)} MB"
+    return None
+
+
+def group_entries(entries: List[Entry]) -> Tuple[List[Tuple[str, List[Entry]]], List[Dict[str, str]]]:
+    """(applications as (key, entries) in name order, skipped entries with reasons)."""
+    groups: Dict[str, List[Entry]] = {}
+    skipped: List[Dict[str, str]] = []
+    for entry in entries:
+        reason = _skip_reason(entry)
+        if reason:
+            skipped.append({"file": entry.name, "reason": reason})
+            continue
+        groups.setdefault(application_key(entry.name), []).append(entry)
+    return [
+        (key, sorted(members, key=lambda e: _natural_key(e.name)))
+        for key, members in sorted(groups.items(), key=lambda kv: _natural_key(kv[0]))
+    ], skipped
+
+
+def zip_entries(archive: zipfile.ZipFile) -> List[Entry]:
+    """Entries of an open archive (nothing is decompressed until an entry is read)."""
+    infos = [info for info in archive.infolist() if not info.is_dir()]
+    if len(infos) > MAX_ENTRIES:
+        raise ValueError(f"Archive has {len(infos)} files; at most {MAX_ENTRIES} are accepted")
+
+    def reader(info: zipfile.ZipInfo) -> Callable[[], bytes]:
+        def read() -> bytes:
+            with archive.open(info) as f:
+                data = f.read(MAX_ENTRY_BYTES + 1)
+            if len(data) > MAX_ENTRY_BYTES:
+                raise ValueError(f"{info.filename} is larger than {MAX_ENTRY_BYTES // (1024 * 1024)} MB")
+            return data
+        return read
+
+    return [Entry(info.filename, info.file_size, reader(info)) for info in infos]
+
+
+def spool_parts(parts: List[Tuple[str, BinaryIO]], spool_dir: Path) -> Tuple[List[Entry], List[zipfile.ZipFile]]:
+    """
+    Copy the uploaded parts to `spool_dir` (the request's files do not outlive
+    it) and list their entries: a ZIP part contributes its members, any other
+    part itself. Returns the entries and the open archives (close them when done).
+    """
+    entries: List[Entry] = []
+    archives: List[zipfile.ZipFile] = []
+    try:
+        for i, (filename, fileobj) in enumerate(parts):
+            path = spool_dir / f"{i:05d}"
+            with open(path, "wb") as out:
+                shutil.copyfileobj(fileobj, out, 1024 * 1024)
+            if filename.lower().endswith(ARCHIVE_SUFFIXES):
+                try:
+                    archive = zipfile.ZipFile(path)
+                except zipfile.BadZipFile:
+                    raise ValueError(f"{filename} is not a valid ZIP archive")
+                archives.append(archive)
+                entries.extend(zip_entries(archive))
+            else:
+                entries.append(Entry(filename, path.stat().st_size, path.read_bytes))
+        if len(entries) > MAX_ENTRIES:
+            raise ValueError(f"Batch has {len(entries)} files; at most {MAX_ENTRIES} are accepted")
+    except Exception:
+        for archive in archives:
+            archive.close()
+        raise
+    return entries, archives
+
+
+def read_application(entries: List[Entry]) -> Tuple[List[Tuple[str, bytes]], List[Tuple[str, bytes]]]:
+    """(pdfs, images) of one application as (name, bytes), in name order."""
+    pdfs, images = [], []
+    for entry in entries:
+        data = entry.read()
+        (pdfs if entry.name.lower().endswith(PDF_SUFFIXES) else images).append((entry.name, data))
+    return pdfs, images
+
+
+def merge_pdfs(parts: List[bytes]) -> Tuple[bytes, bool]:
+    """(one PDF with the pages of all parts, whether all parts made it in). Needs PyPDF2 for more than one."""
+    if len(parts) == 1:
+        return parts[0], True
+    if not HAS_PYPDF2:
+        return parts[0], False
+    writer = PdfWriter()
+    for part in parts:
+        for page in PdfReader(io.BytesIO(part)).pages:
+            writer.add_page(page)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue(), True
+
+
+class BulkJob:
+    """Per-item manifest and throughput of one bulk ingestion."""
+
+    def __init__(self, job_id: str, groups: List[Tuple[str, List[Entry]]], skipped: List[Dict[str, str]], workers: int) -> None:
+        self.id = job_id
+        self.workers = workers
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.skipped = skipped
+        self.items: List[Dict[str, Any]] = [
+            {
+                "item": i,
+                "application": key,
+                "files": [e.name for e in entries],
+                "bytes": sum(e.size for e in entries),
+                "status": PENDING,
+                "doc_id": None,
+                "model_prediction": None,
+                "error": None,
+                "seconds": None,
+            }
+            for i, (key, entries) in enumerate(groups)
+        ]
+        # Seconds spent per stage over all items, to see where the time goes
+        self.stage_seconds: Dict[str, float] = {}
+        self._item_started: Dict[int, float] = {}
+        self._stage_started: Dict[int, Tuple[str, float]] = {}
+
+    @property
+    def status(self) -> str:
+        if self.finished is not None:
+            return "done"
+        return "running" if self.started is not None else "queued"
+
+    def stage(self, item: int, status: str) -> None:
+        now = time.monotonic()
+        self._close_stage(item, now)
+        self._item_started.setdefault(item, now)
+        self._stage_started[item] = (status, now)
+        self.items[item]["status"] = status
+
+    def _close_stage(self, item: int, now: float) -> None:
+        if item in self._stage_started:
+            stage, since = self._stage_started.pop(item)
+            self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + now - since
+
+    def finish(self, item: int, error: Optional[str] = None, **fields: Any) -> Dict[str, Any]:
+        now = time.monotonic()
+        self._close_stage(item, now)
+        entry = self.items[item]
+        entry.update(fields, status=FAILED if error else DONE, error=error)
+        entry["seconds"] = round(now - self._item_started.get(item, now), 3)
+        return entry
+
+    def counts(self) -> Dict[str, int]:
+        counts = {"items": len(self.items), "done": 0, "failed": 0, "in_progress": 0, "pending": 0, "skipped_files": len(self.skipped)}
+        for item in self.items:
+            status = item["status"]
+            key = status if status in (DONE, FAILED, PENDING) else "in_progress"
+            counts[key] += 1
+        return counts
+
+    def throughput(self) -> Dict[str, Any]:
+        if self.started is None:
+            return {"elapsed_s": 0.0, "items_per_s": None, "mb_per_s": None}
+        elapsed = (self.finished or time.time()) - self.started
+        finished = [i for i in self.items if i["status"] in (DONE, FAILED)]
+        mb = sum(i["bytes"] for i in finished) / (1024 * 1024)
+        return {
+            "elapsed_s": round(elapsed, 3),
+            "items_per_s": round(len(finished) / elapsed, 3) if elapsed > 0 else None,
+            "mb_per_s": round(mb / elapsed, 3) if elapsed > 0 else None,
+            "workers": self.workers,
+            "stage_seconds": {k: round(v, 3) for k, v in self.stage_seconds.items()},
+        }
+
+    def manifest(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            **self.counts(),
+            "throughput": self.throughput(),
+            "items": self.items,
+            "skipped": self.skipped,
+        }
+
+
+async def run_pipeline(
+    job: BulkJob,
+    groups: List[Tuple[str, List[Entry]]],
+    process: Callable[[int, List[Tuple[str, bytes]], List[Tuple[str, bytes]]], Awaitable[None]],
+    on_failed: Callable[[int, str], None],
+) -> None:
+    """
+    Read applications one at a time into a queue of `job.workers` places and
+    let `job.workers` workers `process(item, pdfs, images)` them. Failures of
+    one item (reading or processing) go to `on_failed` and do not stop the job.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=job.workers)
+    job.started = time.time()
+
+    async def produce() -> None:
+        try:
+            for item, (_, entries) in enumerate(groups):
+                try:
+                    # Reads (and decompression) happen one at a time, off the event loop
+                    pdfs, images = await asyncio.to_thread(read_application, entries)
+                except Exception as e:
+                    on_failed(item, f"could not read: {e}")
+                    continue
+                await queue.put((item, pdfs, images))
+        finally:
+            for _ in range(job.workers):
+                await queue.put(None)
+
+    async def work() -> None:
+        while (task := await queue.get()) is not None:
+            item, pdfs, images = task
+            try:
+                await process(item, pdfs, images)
+            except Exception as e:
+                on_failed(item, str(getattr(e, "detail", e)))
+
+    try:
+        await asyncio.gather(produce(), *(work() for _ in range(job.workers)))
+    finally:
+        job.finished = time.time()
@@ -0,0 +1,185 @@
+"""
+Counterfactual search: the smallest changes to an applicant that reach a target class.
+
+Works on the applicant's encoded row, like partial_dependence: an edit sets one
+numeric column or one one-hot block. The search is a level-wise beam search:
+
+- level k scores every single-feature extension of the beam's k-1 change sets
+  in large batches;
+- sets whose argmax is the target class are results; since levels grow one
+  change at a time, results found at a level are minimal in size;
+- supersets of a result are pruned, and only the `beam_width` candidates
+  closest to the target (highest target probability) are expanded further;
+- the search stops at `max_changes`, once `max_results` are found, or when
+  the time budget runs out.
+"""
+import time
+from typing import Any, Dict, FrozenSet, List, Optional, Set, Tuple
+
+import numpy as np
+import xgboost as xgb
+
+from partial_dependence import numeric_grid
+
+# Fields an applicant cannot change (birthdate is not a model input but is
+# listed so callers can rely on it being protected).
+IMMUTABLE_FEATURES = {"gender", "age", "birthdate"}
+
+BEAM_WIDTH = 40
+BATCH_SIZE = 8192
+
+Edit = Tuple[str, Any]
+
+
+def candidate_edits(
+    base_row: np.ndarray,
+    background: np.ndarray,
+    columns: Dict[str, Dict[str, Any]],
+    immutable: Set[str],
+) -> Dict[str, List[Tuple[Any, float]]]:
+    """Allowed (value, cost) alternatives per mutable feature.
+
+    Categorical values come from the encoder's category lists and cost 1.
+    Numeric values come from the background grid; their cost is the distance
+    from the current value as a fraction of the grid's range.
+    """
+    out: Dict[str, List[Tuple[Any, float]]] = {}
+    for feature, column in columns.items():
+        if feature in immutable:
+            continue
+        if column["kind"] == "categorical":
+            current = [c for c, idx in zip(column["categories"], column["indices"]) if base_row[idx] == 1.0]
+            out[feature] = [(c, 1.0) for c in column["categories"] if c not in current]
+        else:
+            grid = numeric_grid(background[:, column["index"]], feature)
+            if grid.size == 0:
+                continue
+            span = max(float(grid[-1] - grid[0]), 1e-9)
+            current = base_row[column["index"]]
+            out[feature] = [
+                (float(v), 1.0 if np.isnan(current) else abs(float(v) - float(current)) / span)
+                for v in grid if np.isnan(current) or v != current
+            ]
+    return out
+
+
+def apply_edits(row: np.ndarray, edits: FrozenSet[Edit], columns: Dict[str, Dict[str, Any]]) -> np.ndarray:
+    """Return a copy of an encoded row with the edits applied."""
+    out = row.copy()
+    for feature, value in edits:
+        column = columns[feature]
+        if column["kind"] == "numeric":
+            out[column["index"]] = value
+        else:
+            out[column["indices"]] = 0.0
+            out[column["indices"][column["categories"].index(value)]] = 1.0
+    return out
+
+
+def _current_value(row: np.ndarray, column: Dict[str, Any]) -> Any:
+    if column["kind"] == "numeric":
+        v = row[column["index"]]
+        return None if np.isnan(v) else float(v)
+    hot = [c for c, idx in zip(column["categories"], column["indices"]) if row[idx] == 1.0]
+    return hot[0] if hot else None
+
+
+def search(
+    booster: xgb.Booster,
+    base_row: np.ndarray,
+    background: np.ndarray,
+    columns: Dict[str, Dict[str, Any]],
+    class_names: List[str],
+    target: str,
+    immutable: Optional[Set[str]] = None,
+    max_changes: int = 3,
+    max_results: int = 3,
+    time_budget_s: float = 0.5,
+    beam_width: int = BEAM_WIDTH,
+    batch_size: int = BATCH_SIZE,
+) -> Dict[str, Any]:
+    """Find up to `max_results` smallest change sets whose prediction is `target`.
+
+    `immutable` adds to IMMUTABLE_FEATURES; it cannot unprotect them.
+    """
+    t0 = time.perf_counter()
+    immutable = IMMUTABLE_FEATURES | set(immutable or ())
+    deadline = t0 + time_budget_s
+    base_row = np.asarray(base_row, dtype=np.float64).reshape(-1)
+    target_idx = class_names.index(target)
+    edits_by_feature = candidate_edits(base_row, background, columns, immutable)
+    cost_of = {(f, v): c for f, values in edits_by_feature.items() for v, c in values}
+
+    results: List[Dict[str, Any]] = []
+    found: List[FrozenSet[Edit]] = []
+    beam: List[FrozenSet[Edit]] = [frozenset()]
+    seen: Set[FrozenSet[Edit]] = set()
+    evaluated = 0
+    timed_out = False
+
+    for level in range(1, max_changes + 1):
+        # Expand: every beam state plus one edit on a feature it doesn't change yet.
+        candidates: List[FrozenSet[Edit]] = []
+        for state in beam:
+            changed = {f for f, _ in state}
+            for feature, values in edits_by_feature.items():
+                if feature in changed:
+                    continue
+                for value, _ in values:
+                    cand = state | {(feature, value)}
+                    if cand in seen or any(r <= cand for r in found):
+                        continue
+                    seen.add(cand)
+                    candidates.append(cand)
+        if not candidates:
+            break
+
+        scored: List[Tuple[FrozenSet[Edit], np.ndarray]] = []
+        for i in range(0, len(candidates), batch_size):
+            if time.perf_counter() > deadline:
+                timed_out = True
+                break
+            batch = candidates[i:i + batch_size]
+            X = np.vstack([apply_edits(base_row, c, columns) for c in batch])
+            probs = booster.predict(xgb.DMatrix(X))
+            evaluated += len(batch)
+            scored.extend(zip(batch, probs))
+
+        hits = [(c, p) for c, p in scored if int(np.argmax(p)) == target_idx]
+        # Keep the cheapest value assignment per set of changed features.
+        best_per_features: Dict[FrozenSet[str], Tuple[float, FrozenSet[Edit], np.ndarray]] = {}
+        for c, p in hits:
+            key = frozenset(f for f, _ in c)
+            cost = sum(cost_of[e] for e in c)
+            if key not in best_per_features or cost < best_per_features[key][0]:
+                best_per_features[key] = (cost, c, p)
+        for cost, c, p in sorted(best_per_features.values(), key=lambda t: (t[0], -float(t[2][target_idx]))):
+            found.append(c)
+            results.append({
+                "changes": [
+                    {"feature": f, "from": _current_value(base_row, columns[f]), "to": v}
+                    for f, v in sorted(c, key=lambda e: e[0])
+                ],
+                "n_changes": level,
+                "cost": round(cost, 4),
+                "probabilities": {name: round(float(p[k]), 5) for k, name in enumerate(class_names)},
+            })
+
+        if len(results) >= max_results or timed_out:
+            break
+        misses = [(c, p) for c, p in scored if int(np.argmax(p)) != target_idx]
+        misses.sort(key=lambda t: -float(t[1][target_idx]))
+        beam = [c for c, _ in misses[:beam_width]]
+        if not beam:
+            break
+
+    return {
+        "target": target,
+        "counterfactuals": results[:max_results],
+        "stats": {
+            "evaluated": evaluated,
+            "elapsed_ms": round((time.perf_counter() - t0) * 1000, 1),
+            "timed_out": timed_out,
+            "immutable": sorted(immutable),
+        },
+    }
@@ -0,0 +1,466 @@
+"""
+Document store backed by an append-only mutation log.
+
+State lives in memory; every change is first appended to the log and only
+then applied, all under one lock, so concurrent edits of the same document
+are serialized instead of overwriting each other.
+
+On disk (under the data directory):
+
+- ``{doc_id}.json``: snapshot of each document as of the last compaction
+  (same files and format as before the log existed);
+- ``log/segment-<first seq>.log``: log records, one per line, framed as
+  ``<crc32 hex> <json>`` so a torn or corrupt tail is detected on replay;
+- ``log/checkpoint.json``: the last sequence number contained in the
+  snapshot files;
+- ``log/history/{doc_id}.ndjson``: records moved out of compacted segments,
+  i.e. each document's edit history.
+
+Appends are group-committed: a writer appends its record and then waits until
+an fsync covers it; whichever waiting writer fsyncs first does it for all
+records written so far.
+
+Compaction (after ``COMPACT_AFTER_RECORDS`` records, in a background thread)
+rotates to a new segment, writes the documents changed since the last
+compaction to their snapshot files, moves the old segments' records to the
+history files, then advances the checkpoint and deletes the old segments.
+Records only carry absolute values (whole documents or new field values), so
+replaying any suffix of the log over a snapshot that is newer than the
+checkpoint gives the same state; a crash at any point of a compaction is
+recovered by replaying from the old checkpoint (see tests/test_document_store.py).
+"""
+import copy
+import os
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import serialization
+
+LOG_DIR_NAME = "log"
+CHECKPOINT_FILE = "checkpoint.json"
+SEGMENT_PREFIX = "segment-"
+COMPACT_AFTER_RECORDS = 2000
+
+Document = Dict[str, Any]
+Listener = Callable[[Optional[Document], Optional[Document]], None]
+
+
+def _fsync_dir(path: Path) -> None:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    tmp.replace(path)
+
+
+def encode_record(record: Dict[str, Any]) -> bytes:
+    body = serialization.dumps(record)
+    return b"%08x " % zlib.crc32(body) + body + b"\n"
+
+
+def decode_segment(data: bytes) -> Tuple[List[Dict[str, Any]], int]:
+    """Parse a segment; returns the intact records and the byte length they span.
+
+    Stops at the first line that is incomplete or fails its checksum.
+    """
+    records: List[Dict[str, Any]] = []
+    pos = 0
+    while pos < len(data):
+        end = data.find(b"\n", pos)
+        if end < 0:
+            break
+        line = data[pos:end]
+        if len(line) < 10 or line[8:9] != b" ":
+            break
+        body = line[9:]
+        try:
+            if int(line[:8], 16) != zlib.crc32(body):
+                break
+            records.append(serialization.loads(body))
+        except ValueError:
+            break
+        pos = end + 1
+    return records, pos
+
+
+def _ops(record: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """The single-document operations of a record (a batch holds several)."""
+    return record["ops"] if record["op"] == "batch" else [record]
+
+
+def _changes(before: Optional[Document], after: Optional[Document]) -> Dict[str, List[Any]]:
+    """{field: [old, new]} for every field that differs."""
+    before, after = before or {}, after or {}
+    return {
+        k: [before.get(k), after.get(k)]
+        for k in sorted(set(before) | set(after))
+        if before.get(k) != after.get(k)
+    }
+
+
+class DocumentStore:
+    def __init__(self, data_dir: Path, listener: Optional[Listener] = None,
+                 compact_after: int = COMPACT_AFTER_RECORDS) -> None:
+        self.data_dir = Path(data_dir)
+        self.log_dir = self.data_dir / LOG_DIR_NAME
+        self.history_dir = self.log_dir / "history"
+        self.listener = listener
+        self.compact_after = compact_after
+
+        self._lock = threading.RLock()
+        self._durable = threading.Condition(threading.Lock())
+        self._syncing = False
+        self._compact_lock = threading.Lock()
+
+        self._docs: Dict[str, Document] = {}
+        self._dirty: set = set()
+        self._seq = 0
+        self._written_seq = 0
+        self._durable_seq = 0
+        self._checkpoint = 0
+        self._segment = None
+        self._segment_records = 0
+        self.recovery: Dict[str, Any] = {}
+
+    # ----- opening / recovery -----
+
+    def _segments(self) -> List[Path]:
+        return sorted(self.log_dir.glob(f"{SEGMENT_PREFIX}*.log"),
+                      key=lambda p: int(p.stem[len(SEGMENT_PREFIX):]))
+
+    def open(self) -> Dict[str, Any]:
+        """Load the snapshot, replay the log after the checkpoint and truncate a torn tail."""
+        t0 = time.perf_counter()
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        self.history_dir.mkdir(exist_ok=True)
+        for path in self.data_dir.glob("*.json"):
+            doc = serialization.read_record(path)
+            if doc.get("id"):
+                self._docs[doc["id"]] = doc
+        self._checkpoint = serialization.loads((self.log_dir / CHECKPOINT_FILE).read_bytes()).get("seq", 0) \
+            if (self.log_dir / CHECKPOINT_FILE).exists() else 0
+        self._seq = self._checkpoint
+
+        replayed, truncated_bytes = 0, 0
+        segments = self._segments()
+        for i, path in enumerate(segments):
+            data = path.read_bytes()
+            records, good = decode_segment(data)
+            if good < len(data):
+                # Only the tail of the last segment can be torn; anything after
+                # a bad record elsewhere is unreadable too and is dropped.
+                truncated_bytes += len(data) - good
+                with open(path, "r+b") as f:
+                    f.truncate(good)
+                    os.fsync(f.fileno())
+                for later in segments[i + 1:]:
+                    truncated_bytes += later.stat().st_size
+                    later.unlink()
+                segments = segments[:i + 1]
+            for record in records:
+                if record["seq"] > self._checkpoint:
+                    self._apply(record)
+                    self._dirty.update(op["id"] for op in _ops(record))
+                    replayed += 1
+                self._seq = max(self._seq, record["seq"])
+            if good < len(data):
+                break
+
+        self._written_seq = self._durable_seq = self._seq
+        if segments:
+            self._segment = open(segments[-1], "ab")
+            self._segment_records = sum(1 for _ in decode_segment(segments[-1].read_bytes())[0])
+        else:
+            self._open_segment()
+        self.recovery = {
+            "documents": len(self._docs),
+            "checkpoint": self._checkpoint,
+            "replayed_records": replayed,
+            "truncated_bytes": truncated_bytes,
+            "seconds": round(time.perf_counter() - t0, 3),
+        }
+        return self.recovery
+
+    def _open_segment(self) -> None:
+        if self._segment is not None:
+            self._segment.close()
+        path = self.log_dir / f"{SEGMENT_PREFIX}{self._seq + 1}.log"
+        self._segment = open(path, "ab")
+        self._segment_records = 0
+        _fsync_dir(self.log_dir)
+
+    # ----- applying records -----
+
+    def _apply(self, record: Dict[str, Any]) -> Tuple[Optional[Document], Optional[Document]]:
+        """Apply one record to the in-memory state; returns (before, after) of its document."""
+        op = record["op"]
+        if op == "batch":
+            for sub in record["ops"]:
+                self._apply(sub)
+            return None, None
+        doc_id = record["id"]
+        before = self._docs.get(doc_id)
+        if op == "put":
+            after = record["doc"]
+        elif op == "patch":
+            if before is None:
+                return None, None
+            after = {**before, **record["fields"]}
+        elif op == "delete":
+            after = None
+        else:
+            raise ValueError(f"Unknown log operation: {op}")
+        if after is None:
+            self._docs.pop(doc_id, None)
+        else:
+            self._docs[doc_id] = after
+        return before, after
+
+    def _append(self, records: List[Dict[str, Any]]) -> int:
+        """Write records to the current segment (caller holds the lock); returns the last seq."""
+        data = b"".join(encode_record(r) for r in records)
+        self._segment.write(data)
+        self._segment.flush()
+        self._written_seq = records[-1]["seq"]
+        self._segment_records += len(records)
+        return self._written_seq
+
+    def _wait_durable(self, seq: int) -> None:
+        """Group commit: return once an fsync covers `seq`."""
+        with self._durable:
+            while self._durable_seq < seq:
+                if self._syncing:
+                    self._durable.wait()
+                    continue
+                self._syncing = True
+                target = self._written_seq
+                segment = self._segment
+                self._durable.release()
+                try:
+                    os.fsync(segment.fileno())
+                finally:
+                    self._durable.acquire()
+                    self._syncing = False
+                self._durable_seq = max(self._durable_seq, target)
+                self._durable.notify_all()
+
+    def _commit(self, ops: List[Dict[str, Any]]) -> List[Tuple[Optional[Document], Optional[Document]]]:
+        """Log `ops` as one record (atomic even when there are several), apply them, notify the listener."""
+        with self._lock:
+            results = []
+            # Resolve patches against the current state so the log holds absolute values
+            resolved = []
+            for op in ops:
+                before = self._docs.get(op["id"])
+                if op["op"] == "patch" and before is None:
+                    results.append((None, None))
+                    continue
+                if op["op"] == "delete" and before is None:
+                    results.append((None, None))
+                    continue
+                after = None if op["op"] == "delete" else (
+                    op["doc"] if op["op"] == "put" else {**before, **op["fields"]})
+                changes = _changes(before, after)
+                if not changes:
+                    results.append((before, before))  # nothing to log
+                    continue
+                resolved.append({**op, "changes": changes})
+                results.append((before, after))
+            if not resolved:
+                return results
+
+            self._seq += 1
+            ts = time.strftime("%Y-%m-%d %H:%M:%S")
+            if len(resolved) == 1:
+                record = {"seq": self._seq, "ts": ts, **resolved[0]}
+            else:
+                record = {"seq": self._seq, "ts": ts, "op": "batch",
+                          "ops": [{"seq": self._seq, "ts": ts, **op} for op in resolved]}
+            seq = self._append([record])
+            self._apply(record)
+            for op in resolved:
+                self._dirty.add(op["id"])
+            if self.listener:
+                for before, after in results:
+                    if after is not before:
+                        self.listener(before, after)
+            compact = self._segment_records >= self.compact_after
+        self._wait_durable(seq)
+        if compact:
+            self.compact_in_background()
+        return results
+
+    # ----- public API -----
+
+    def get(self, doc_id: str) -> Optional[Document]:
+        with self._lock:
+            doc = self._docs.get(doc_id)
+            return copy.deepcopy(doc) if doc is not None else None
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._docs
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def iter_documents(self) -> Iterator[Document]:
+        """Shallow copies of all documents (snapshot of the ids at call time)."""
+        with self._lock:
+            ids = list(self._docs)
+        for doc_id in ids:
+            doc = self._docs.get(doc_id)
+            if doc is not None:
+                yield dict(doc)
+
+    def put(self, doc: Document) -> Optional[Document]:
+        """Create or replace a document; returns the previous version."""
+        return self._commit([{"op": "put", "id": doc["id"], "doc": doc}])[0][0]
+
+    def put_many(self, docs: List[Document]) -> None:
+        """Create or replace several documents as one atomic log record."""
+        self._commit([{"op": "put", "id": d["id"], "doc": d} for d in docs])
+
+    def patch(self, doc_id: str, fields: Dict[str, Any]) -> Optional[Document]:
+        """Set fields of an existing document atomically; returns the new version (None if missing)."""
+        _, after = self._commit([{"op": "patch", "id": doc_id, "fields": fields}])[0]
+        return copy.deepcopy(after) if after is not None else None
+
+    def delete(self, doc_id: str) -> Optional[Document]:
+        """Delete a document; returns the deleted version (None if missing)."""
+        return self._commit([{"op": "delete", "id": doc_id}])[0][0]
+
+    def history(self, doc_id: str) -> List[Dict[str, Any]]:
+        """Every logged change of one document, oldest first."""
+        records: Dict[int, Dict[str, Any]] = {}
+        with self._lock:
+            segments = self._segments()
+        for path in segments:
+            try:
+                data = path.read_bytes()
+            except FileNotFoundError:
+                continue  # retired by a compaction meanwhile; its records are in the history file now
+            for rec in decode_segment(data)[0]:
+                for op in _ops(rec):
+                    if op["id"] == doc_id:
+                        records[op["seq"]] = op
+        # Read after the segments: compaction appends here before it deletes a segment
+        history_file = self.history_dir / f"{doc_id}.ndjson"
+        if history_file.exists():
+            for line in history_file.read_bytes().splitlines():
+                if line.strip():
+                    rec = serialization.loads(line)
+                    records[rec["seq"]] = rec
+        return [
+            {"seq": r["seq"], "ts": r["ts"], "op": r["op"], "changes": r.get("changes", {})}
+            for _, r in sorted(records.items())
+        ]
+
+    # ----- compaction -----
+
+    def compact_in_background(self) -> None:
+        if self._compact_lock.locked():
+            return
+        threading.Thread(target=self.compact, args=(False,), name="document-store-compaction",
+                         daemon=True).start()
+
+    def compact(self, wait: bool = True) -> Dict[str, Any]:
+        """Write changed documents to their snapshot files and retire the old log segments.
+
+        With `wait` False, returns immediately if a compaction is already running.
+        """
+        if not self._compact_lock.acquire(blocking=wait):
+            return {"skipped": "compaction already running"}
+        try:
+            t0 = time.perf_counter()
+            with self._lock, self._durable:
+                # Make the current segment durable before rotating away from it
+                while self._syncing:
+                    self._durable.wait()
+                os.fsync(self._segment.fileno())
+                self._durable_seq = self._written_seq
+                self._durable.notify_all()
+
+                old_segments = self._segments()
+                checkpoint = self._seq
+                dirty = {doc_id: copy.deepcopy(self._docs.get(doc_id)) for doc_id in self._dirty}
+                self._dirty = set()
+                self._open_segment()
+
+            try:
+                self._write_snapshot(dirty, old_segments, checkpoint)
+            except BaseException:
+                with self._lock:
+                    self._dirty.update(dirty)
+                raise
+            return {
+                "checkpoint": checkpoint,
+                "documents_written": len(dirty),
+                "segments_retired": len(old_segments),
+                "seconds": round(time.perf_counter() - t0, 3),
+            }
+        finally:
+            self._compact_lock.release()
+
+    def _write_snapshot(self, dirty: Dict[str, Optional[Document]], old_segments: List[Path],
+                        checkpoint: int) -> None:
+        # 1. snapshot files
+        for doc_id, doc in dirty.items():
+            path = self.data_dir / f"{doc_id}.json"
+            if doc is None:
+                if path.exists():
+                    path.unlink()
+            else:
+                _write_atomic(path, serialization.dumps_record(doc))
+        _fsync_dir(self.data_dir)
+
+        # 2. history
+        moved: Dict[str, List[bytes]] = {}
+        for path in old_segments:
+            for rec in decode_segment(path.read_bytes())[0]:
+                for op in _ops(rec):
+                    entry = {k: op[k] for k in ("seq", "ts", "op", "changes") if k in op}
+                    moved.setdefault(op["id"], []).append(serialization.dumps(entry))
+        for doc_id, lines in moved.items():
+            with open(self.history_dir / f"{doc_id}.ndjson", "ab") as f:
+                f.write(b"\n".join(lines) + b"\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+        # 3. checkpoint, then 4. drop the retired segments
+        _write_atomic(self.log_dir / CHECKPOINT_FILE, serialization.dumps({"seq": checkpoint}))
+        self._checkpoint = checkpoint
+        for path in old_segments:
+            path.unlink()
+        _fsync_dir(self.log_dir)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._segment is not None:
+                self._segment.flush()
+                os.fsync(self._segment.fileno())
+                self._segment.close()
+                self._segment = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "documents": len(self._docs),
+                "seq": self._seq,
+                "checkpoint": self._checkpoint,
+                "dirty_documents": len(self._dirty),
+                "segment_records": self._segment_records,
+                "segments": len(self._segments()),
+                "recovery": self.recovery,
+            }
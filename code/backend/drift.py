@@ -0,0 +1,383 @@
+"""
+Input-drift monitoring for scored applications.
+
+The reference profile describes the training distribution of every model
+input: for numeric features, the cut points of ``NUMERIC_BINS`` equal-mass
+bins (quantiles of the training data) with their fractions; for categorical
+features, the fraction of each value. It is exported next to the model by
+datageneration/train_model.py (``drift_reference.json``); for models trained
+before that, it is derived from the SHAP background sample instead.
+
+Live rows are summarized in fixed memory: per numeric feature one counter per
+reference bin (a quantile sketch on the reference's cut points, updated with
+one bisect) plus count/sum for the mean; per categorical feature a count
+table capped at ``MAX_CATEGORIES`` values. Drift scores compare the two:
+
+- PSI (population stability index) over the bins / values, missing values
+  included as their own bin; < 0.1 stable, 0.1-0.25 moderate, > 0.25 drifted;
+- KS, for numeric features: the largest gap between the reference and live
+  CDFs at the bin edges (of non-missing values).
+
+State is written to disk periodically and reloaded on start, as long as the
+reference profile is unchanged.
+"""
+import bisect
+import hashlib
+import math
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Mapping, Optional
+
+import numpy as np
+import pandas as pd
+
+import serialization
+
+NUMERIC_BINS = 20
+MAX_CATEGORIES = 32
+REFERENCE_SAMPLE_SIZE = 200_000
+
+MISSING = "__missing__"
+OTHER = "__other__"
+PSI_MODERATE = 0.1
+PSI_SIGNIFICANT = 0.25
+# Fewer live rows than this give noisy scores; features are reported as such
+MIN_ROWS = 100
+# Smoothing for empty bins in PSI
+EPSILON = 1e-4
+SAVE_INTERVAL = 30.0
+
+
+def category_key(value: Any) -> Optional[str]:
+    """Count-table key of a categorical value (None when missing); bools match the one-hot names."""
+    if value is None or value == "" or (isinstance(value, float) and math.isnan(value)):
+        return None
+    return str(value.item() if isinstance(value, np.generic) else value)
+
+
+def _numeric_value(value: Any) -> Optional[float]:
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        v = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(v) else v
+
+
+# ----- reference profiles -----
+
+def _numeric_profile(values: np.ndarray, missing: int) -> Dict[str, Any]:
+    total = len(values) + missing
+    values = values[~np.isnan(values)]
+    if len(values):
+        edges = np.unique(np.quantile(values, np.arange(1, NUMERIC_BINS) / NUMERIC_BINS))
+    else:
+        edges = np.array([])
+    counts = np.bincount(np.searchsorted(edges, values, side="left"), minlength=len(edges) + 1)
+    return {
+        "edges": [float(e) for e in edges],
+        "fractions": [float(c) / total for c in counts] if total else [],
+        "missing": missing / total if total else 0.0,
+        "mean": float(values.mean()) if len(values) else None,
+    }
+
+
+def _categorical_profile(counts: Mapping[str, int], missing: int) -> Dict[str, Any]:
+    total = sum(counts.values()) + missing
+    return {
+        "fractions": {k: c / total for k, c in sorted(counts.items())} if total else {},
+        "missing": missing / total if total else 0.0,
+    }
+
+
+class ReferenceBuilder:
+    """Reference profile from a dataset read in chunks.
+
+    Categorical counts are exact; numeric quantiles come from a uniform
+    sample of at most ``sample_size`` rows (the rows with the smallest random
+    keys seen so far), so memory does not depend on the dataset size.
+    """
+
+    def __init__(self, numeric_cols: List[str], sample_size: int = REFERENCE_SAMPLE_SIZE, seed: int = 0):
+        self.numeric_cols = numeric_cols
+        self.sample_size = sample_size
+        self._rng = np.random.default_rng(seed)
+        self._keys = np.empty(0)
+        self._sample = np.empty((0, len(numeric_cols)))
+        self._categorical: Dict[str, Dict[str, int]] = {}
+        self._missing: Dict[str, int] = {}
+        self.rows = 0
+
+    def update(self, df: pd.DataFrame, categorical_cols: List[str]) -> None:
+        for col in categorical_cols:
+            counts = self._categorical.setdefault(col, {})
+            values = df[col] if col in df else pd.Series([None] * len(df))
+            self._missing[col] = self._missing.get(col, 0) + int(values.isna().sum())
+            for value, n in values.dropna().map(category_key).value_counts().items():
+                counts[value] = counts.get(value, 0) + int(n)
+        numeric = df.reindex(columns=self.numeric_cols).astype(np.float64).to_numpy()
+        keys = np.concatenate([self._keys, self._rng.random(len(df))])
+        sample = np.concatenate([self._sample, numeric])
+        if len(keys) > self.sample_size:
+            keep = np.argpartition(keys, self.sample_size)[:self.sample_size]
+            keys, sample = keys[keep], sample[keep]
+        self._keys, self._sample = keys, sample
+        self.rows += len(df)
+
+    def finish(self, source: str = "training") -> Dict[str, Any]:
+        numeric = {}
+        for j, col in enumerate(self.numeric_cols):
+            values = self._sample[:, j]
+            missing = int(np.isnan(values).sum())
+            numeric[col] = _numeric_profile(values[~np.isnan(values)], missing)
+        categorical = {col: _categorical_profile(counts, self._missing.get(col, 0))
+                       for col, counts in self._categorical.items()}
+        return {"source": source, "rows": self.rows, "numeric": numeric, "categorical": categorical}
+
+
+def reference_from_encoded(X: np.ndarray, feature_meta: Dict[str, Any], source: str = "shap_background") -> Dict[str, Any]:
+    """Reference profile from preprocessed rows (one-hot columns + numeric passthrough), e.g. the SHAP background."""
+    names: List[str] = feature_meta.get("all_feature_names_after_pre", [])
+    categorical_cols: List[str] = feature_meta.get("categorical_cols", [])
+    numeric_cols: List[str] = feature_meta.get("numeric_cols", [])
+    X = np.asarray(X, dtype=np.float64)
+    index = {name: i for i, name in enumerate(names)}
+
+    # One-hot column -> (categorical feature, value); the longest matching feature name owns it
+    by_length = sorted(categorical_cols, key=len, reverse=True)
+    onehot: Dict[str, List] = {col: [] for col in categorical_cols}
+    for name, i in index.items():
+        owner = next((col for col in by_length if name.startswith(f"{col}_")), None)
+        if owner is not None:
+            onehot[owner].append((name[len(owner) + 1:], i))
+
+    categorical = {}
+    for col in categorical_cols:
+        columns = onehot[col]
+        counts: Dict[str, int] = {}
+        missing = 0
+        for row in X:
+            hot = [value for value, i in columns if row[i] > 0.5]
+            if hot:
+                counts[hot[0]] = counts.get(hot[0], 0) + 1
+            else:
+                missing += 1
+        categorical[col] = _categorical_profile(counts, missing)
+
+    numeric = {}
+    for col in numeric_cols:
+        values = X[:, index[col]] if col in index else np.full(len(X), np.nan)
+        numeric[col] = _numeric_profile(values[~np.isnan(values)], int(np.isnan(values).sum()))
+    return {"source": source, "rows": int(len(X)), "numeric": numeric, "categorical": categorical}
+
+
+def reference_id(reference: Dict[str, Any]) -> str:
+    return hashlib.sha256(serialization.dumps(reference)).hexdigest()[:16]
+
+
+# ----- scores -----
+
+def psi(expected: List[float], actual: List[float]) -> float:
+    return float(sum((a - e) * math.log(a / e)
+                     for e, a in ((max(e, EPSILON), max(a, EPSILON)) for e, a in zip(expected, actual))))
+
+
+def ks(expected: List[float], actual: List[float]) -> float:
+    """Largest CDF gap between two binned distributions (each renormalized to sum 1)."""
+    se, sa = sum(expected), sum(actual)
+    if se <= 0 or sa <= 0:
+        return 0.0
+    ce = np.cumsum(np.asarray(expected) / se)
+    ca = np.cumsum(np.asarray(actual) / sa)
+    return float(np.max(np.abs(ce - ca)))
+
+
+def status(psi_value: float, rows: int) -> str:
+    if rows < MIN_ROWS:
+        return "insufficient_data"
+    if psi_value > PSI_SIGNIFICANT:
+        return "drifted"
+    if psi_value > PSI_MODERATE:
+        return "moderate"
+    return "stable"
+
+
+# ----- live monitor -----
+
+class DriftMonitor:
+    def __init__(self, reference: Dict[str, Any], state_file: Optional[Path] = None):
+        self.reference = reference
+        self.reference_id = reference_id(reference)
+        self.state_file = Path(state_file) if state_file else None
+        self._lock = threading.Lock()
+        self._numeric = [(col, ref["edges"]) for col, ref in reference["numeric"].items()]
+        self._categorical = list(reference["categorical"])
+        self._reset_state()
+        self._dirty = False
+        self._last_save = time.monotonic()
+        self._saving = False
+        if self.state_file is not None:
+            self._load()
+
+    def _reset_state(self) -> None:
+        self.rows = 0
+        self.since = time.strftime("%Y-%m-%d %H:%M:%S")
+        # numeric: one counter per reference bin, then missing
+        self.numeric_counts: Dict[str, List[int]] = {col: [0] * (len(edges) + 2) for col, edges in self._numeric}
+        self.numeric_sums: Dict[str, float] = {col: 0.0 for col, _ in self._numeric}
+        self.categorical_counts: Dict[str, Dict[str, int]] = {col: {} for col in self._categorical}
+
+    def observe(self, row: Mapping[str, Any]) -> None:
+        """Add one scored row (a dict of raw model inputs)."""
+        with self._lock:
+            self._observe(row)
+            self._dirty = True
+        self._maybe_save()
+
+    def observe_many(self, rows: Iterable[Mapping[str, Any]]) -> None:
+        with self._lock:
+            for row in rows:
+                self._observe(row)
+            self._dirty = True
+        self._maybe_save()
+
+    def _observe(self, row: Mapping[str, Any]) -> None:
+        self.rows += 1
+        for col, edges in self._numeric:
+            v = _numeric_value(row.get(col))
+            counts = self.numeric_counts[col]
+            if v is None:
+                counts[-1] += 1
+            else:
+                counts[bisect.bisect_left(edges, v)] += 1
+                self.numeric_sums[col] += v
+        for col in self._categorical:
+            key = category_key(row.get(col))
+            counts = self.categorical_counts[col]
+            if key is None:
+                key = MISSING
+            elif key not in counts and len(counts) >= MAX_CATEGORIES:
+                key = OTHER
+            counts[key] = counts.get(key, 0) + 1
+
+    def reset(self) -> None:
+        with self._lock:
+            self._reset_state()
+            self._dirty = True
+        self.save()
+
+    # ----- reporting -----
+
+    def _numeric_report(self, col: str, detail: bool) -> Dict[str, Any]:
+        ref = self.reference["numeric"][col]
+        counts = self.numeric_counts[col]
+        n = sum(counts)
+        live = [c / n for c in counts] if n else [0.0] * len(counts)
+        expected = ref["fractions"] + [ref["missing"]]
+        present = n - counts[-1]
+        out = {
+            "type": "numeric",
+            "psi": round(psi(expected, live), 4) if n else None,
+            "ks": round(ks(ref["fractions"], live[:-1]), 4) if present else None,
+            "missing_rate": {"reference": round(ref["missing"], 4), "live": round(live[-1], 4)},
+            "mean": {"reference": ref["mean"], "live": self.numeric_sums[col] / present if present else None},
+        }
+        if detail:
+            out["bins"] = {"edges": ref["edges"], "reference": ref["fractions"], "live": live[:-1]}
+        return out
+
+    def _categorical_report(self, col: str, detail: bool) -> Dict[str, Any]:
+        ref = self.reference["categorical"][col]
+        counts = self.categorical_counts[col]
+        n = sum(counts.values())
+        keys = sorted(set(ref["fractions"]) | (set(counts) - {MISSING}))
+        expected = [ref["fractions"].get(k, 0.0) for k in keys] + [ref["missing"]]
+        live = [counts.get(k, 0) / n for k in keys] + [counts.get(MISSING, 0) / n] if n else []
+        out = {
+            "type": "categorical",
+            "psi": round(psi(expected, live), 4) if n else None,
+            "missing_rate": {"reference": round(ref["missing"], 4), "live": round(live[-1], 4) if n else None},
+            "unseen_values": sorted(k for k in counts if k not in ref["fractions"] and k != MISSING),
+        }
+        if detail:
+            out["values"] = {k: {"reference": e, "live": a} for k, e, a in zip(keys, expected, live)}
+        return out
+
+    def report(self, feature: Optional[str] = None) -> Dict[str, Any]:
+        with self._lock:
+            columns = [feature] if feature else [c for c, _ in self._numeric] + self._categorical
+            features = {}
+            for col in columns:
+                if col in self.numeric_counts:
+                    features[col] = self._numeric_report(col, detail=feature is not None)
+                else:
+                    features[col] = self._categorical_report(col, detail=feature is not None)
+                features[col]["status"] = status(features[col]["psi"] or 0.0, self.rows)
+            rows, since = self.rows, self.since
+        ranked = sorted(features.items(), key=lambda kv: -(kv[1]["psi"] or 0.0))
+        return {
+            "rows": rows,
+            "since": since,
+            "reference": {"id": self.reference_id, "source": self.reference.get("source"),
+                          "rows": self.reference.get("rows")},
+            "drifted": [col for col, f in ranked if f["status"] == "drifted"],
+            "moderate": [col for col, f in ranked if f["status"] == "moderate"],
+            "features": dict(ranked),
+        }
+
+    # ----- persistence -----
+
+    def _snapshot(self) -> bytes:
+        return serialization.dumps({
+            "reference_id": self.reference_id,
+            "rows": self.rows,
+            "since": self.since,
+            "numeric_counts": self.numeric_counts,
+            "numeric_sums": self.numeric_sums,
+            "categorical_counts": self.categorical_counts,
+        })
+
+    def _load(self) -> None:
+        if not self.state_file.exists():
+            return
+        try:
+            state = serialization.loads(self.state_file.read_bytes())
+        except ValueError as e:
+            print("Ignoring unreadable drift state:", e)
+            return
+        if state.get("reference_id") != self.reference_id:
+            print("Drift reference changed; starting a new drift window")
+            return
+        self.rows = state["rows"]
+        self.since = state["since"]
+        self.numeric_counts.update(state["numeric_counts"])
+        self.numeric_sums.update(state["numeric_sums"])
+        for col, counts in state["categorical_counts"].items():
+            self.categorical_counts[col] = dict(counts)
+
+    def save(self) -> None:
+        if self.state_file is None:
+            return
+        with self._lock:
+            data = self._snapshot()
+            self._dirty = False
+            self._last_save = time.monotonic()
+        self.state_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.state_file.with_name(self.state_file.name + ".tmp")
+        tmp.write_bytes(data)
+        tmp.replace(self.state_file)
+
+    def _maybe_save(self) -> None:
+        """Persist in a background thread at most every SAVE_INTERVAL seconds."""
+        if self.state_file is None or self._saving or time.monotonic() - self._last_save < SAVE_INTERVAL:
+            return
+        self._saving = True
+
+        def run():
+            try:
+                self.save()
+            finally:
+                self._saving = False
+        threading.Thread(target=run, name="drift-state-save", daemon=True).start()
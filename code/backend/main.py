@@ -1,24 +1,50 @@
 import asyncio
+import atexit
 import base64
+import hashlib
 import json
 import os
+import re
+import shutil
+import tempfile
+import threading
 import time
 import uuid
-from pathlib import Path
-from typing import Dict, Any, Optional, List
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path, PurePosixPath
+from typing import Callable, Dict, Any, Optional, List
 
 from openai import AsyncOpenAI
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, UploadFile, HTTPException, Query, Request, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
-from pydantic import BaseModel
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import FileResponse, StreamingResponse, Response
+from pydantic import BaseModel, ValidationError, create_model
 from dotenv import load_dotenv
 import io
 import numpy as np
 import pandas as pd
-import joblib
 import xgboost as xgb
 import shap
+import partial_dependence
+import counterfactual
+import analytics
+import model_artifacts
+import search_index
+import thumbnails
+import serialization
+import document_store
+import progress
+import drift
+import shap_background
+import admission
+import applicant_schema
+import bulk_ingest
+import pdf_store
+import workflow_agent
+from workflow_agent import PdfFiles, extract_from_pdf_bytes, stream_from_pdf_bytes
+from serialization import FastJSONResponse
 try:
     from PIL import Image
     HAS_PIL = True
@@ -34,6 +60,11 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 # Initialize OpenAI client
 if OPENAI_API_KEY:
     client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+elif os.getenv("OPENAI_STUB") == "1":
+    # Local stand-in streaming canned extractions with realistic pacing
+    import stub_openai
+    client = stub_openai.StubOpenAI()
+    OPENAI_API_KEY = "stub"
 
 app = FastAPI(title="PAX Document Processing API")
 
@@ -45,13 +76,47 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Compress large JSON/NDJSON payloads (document lists, curves, exports); PDFs
+# are already compressed and must stay byte-addressable for Range requests.
+app.add_middleware(
+    GZipMiddleware,
+    minimum_size=serialization.GZIP_MINIMUM_SIZE,
+    compresslevel=5,
+    exclude_content_types=("application/pdf", "image/jpeg", "image/png", "text/event-stream"),
+)
 
 # Data storage directory
 DATA_DIR = Path(__file__).parent / "data"
 DATA_DIR.mkdir(exist_ok=True)
 PDF_DIR = DATA_DIR / "pdfs"
 PDF_DIR.mkdir(exist_ok=True)
+# Original PDFs: recent ones as files in PDF_DIR (where uploads are written),
+# older ones moved into append-only packs by the background compactor
+PDF_STORE = pdf_store.PdfStore(PDF_DIR, os.getenv("PDF_PACK_COMPRESSION", "zlib"))
+PDF_STORE.open()
+# PDFs of decided documents are packed after this many days, undecided ones after four times as long
+PDF_COLD_AFTER_DAYS = float(os.getenv("PDF_COLD_AFTER_DAYS", 7))
+PDF_COMPACT_INTERVAL_S = float(os.getenv("PDF_COMPACT_INTERVAL_S", 3600))
+THUMBNAIL_DIR = DATA_DIR / "thumbnails"
+THUMBNAIL_DIR.mkdir(exist_ok=True)
 MODEL_DIR = DATA_DIR / "model"
+# Derived, model-versioned results (kept out of DATA_DIR's top level, which holds documents)
+CACHE_DIR = DATA_DIR / "cache"
+
+# PDFs are uploaded once to the provider's file store and referenced by file ID
+# (OPENAI_FILE_MODE: auto, file or inline); the stub's files do not outlive the process.
+# A document's file is deleted with the document; the sweep deletes unused files
+# and every file older than OPENAI_FILE_MAX_AGE_DAYS (0 = kept while used)
+PDF_FILES: Optional[PdfFiles] = None
+OPENAI_FILE_MAX_AGE_DAYS = float(os.getenv("OPENAI_FILE_MAX_AGE_DAYS", 30))
+OPENAI_FILE_SWEEP_INTERVAL_S = float(os.getenv("OPENAI_FILE_SWEEP_INTERVAL_S", 3600))
+if OPENAI_API_KEY:
+    PDF_FILES = PdfFiles(
+        client,
+        os.getenv("OPENAI_FILE_MODE", "auto"),
+        None if OPENAI_API_KEY == "stub" else CACHE_DIR / "provider_files.json",
+        OPENAI_FILE_MAX_AGE_DAYS * 86400 if OPENAI_FILE_MAX_AGE_DAYS > 0 else None,
+    )
 
 # Globals for model artifacts (loaded once)
 PREPROCESSOR = None
@@ -61,53 +126,66 @@ FEATURE_META: Dict[str, Any] = {}
 SHAP_BG: Optional[np.ndarray] = None
 MANIFEST: Dict[str, Any] = {}
 EXPLAINER: Optional[shap.Explainer] = None
+# Explanation latency/accuracy knob: rows of the summarized SHAP background
+# (0 = all) and how they are chosen; `python shap_background.py` compares sizes
+SHAP_BACKGROUND_SIZE = int(os.getenv("SHAP_BACKGROUND_SIZE", shap_background.DEFAULT_SIZE))
+SHAP_BACKGROUND_METHOD = os.getenv("SHAP_BACKGROUND_METHOD", shap_background.DEFAULT_METHOD)
+EXPLAINER_BACKGROUND: Dict[str, Any] = {}
+# The explainer reuses its masking buffers between calls
+_EXPLAINER_LOCK = threading.Lock()
+# Input drift of scored rows against the model's training distribution
+DRIFT: Optional[drift.DriftMonitor] = None
+DRIFT_STATE_FILE = DATA_DIR / "drift" / "state.json"
+# Where the model's inputs disagree with the applicant schema (checked at load)
+SCHEMA_MISMATCHES: List[str] = []
+# The preprocessor compiled into lookups (None: encode with the preprocessor itself)
+ROW_ENCODER: Optional[applicant_schema.RowEncoder] = None
 
 
-def _safe_load_json(p: Path) -> Dict[str, Any]:
-    try:
-        with open(p, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return {}
+def _warm_explainer(explainer: shap.Explainer, row: np.ndarray) -> None:
+    with _EXPLAINER_LOCK:
+        try:
+            explainer(row)
+        except Exception as e:
+            print("SHAP explainer warm-up failed:", e)
 
 
 def load_model_artifacts() -> None:
     """Load model, preprocessor and SHAP background once at startup."""
-    global PREPROCESSOR, LABEL_ENCODER, BOOSTER, FEATURE_META, SHAP_BG, MANIFEST, EXPLAINER
+    global PREPROCESSOR, LABEL_ENCODER, BOOSTER, FEATURE_META, SHAP_BG, MANIFEST, EXPLAINER, EXPLAINER_BACKGROUND, DRIFT
+    global SCHEMA_MISMATCHES, ROW_ENCODER
 
-    if not MODEL_DIR.exists():
-        print("Model directory not found:", MODEL_DIR)
+    artifacts = model_artifacts.load_artifacts(MODEL_DIR)
+    if not artifacts:
         return
+    PREPROCESSOR = artifacts.get("preprocessor", PREPROCESSOR)
+    LABEL_ENCODER = artifacts.get("label_encoder", LABEL_ENCODER)
+    BOOSTER = artifacts.get("booster", BOOSTER)
+    FEATURE_META = artifacts.get("feature_meta", FEATURE_META)
+    SHAP_BG = artifacts.get("shap_background", SHAP_BG)
+    MANIFEST = artifacts.get("manifest", MANIFEST)
 
-    pre_path = MODEL_DIR / "preprocessor.joblib"
-    le_path = MODEL_DIR / "label_encoder.joblib"
-    model_json_path = MODEL_DIR / "xgboost_model.json"
-    feat_meta_path = MODEL_DIR / "feature_names.json"
-    shap_bg_path = MODEL_DIR / "shap_background.npy"
-    manifest_path = MODEL_DIR / "manifest.json"
-
-    if pre_path.exists():
-        PREPROCESSOR = joblib.load(pre_path)
-        print("Loaded preprocessor")
-    if le_path.exists():
-        LABEL_ENCODER = joblib.load(le_path)
-        print("Loaded label encoder")
-    if model_json_path.exists():
-        BOOSTER = xgb.Booster()
-        BOOSTER.load_model(str(model_json_path))
-        print("Loaded XGBoost booster")
-    if feat_meta_path.exists():
-        FEATURE_META = _safe_load_json(feat_meta_path)
-        print("Loaded feature metadata")
-    if shap_bg_path.exists():
+    if FEATURE_META:
+        SCHEMA_MISMATCHES = applicant_schema.check_model(FEATURE_META, PREPROCESSOR)
+        for problem in SCHEMA_MISMATCHES:
+            print("Schema mismatch:", problem)
+    if FEATURE_META and PREPROCESSOR is not None:
+        encoder = applicant_schema.RowEncoder(FEATURE_META, PREPROCESSOR)
         try:
-            SHAP_BG = np.load(shap_bg_path)
-            print("Loaded SHAP background", SHAP_BG.shape)
+            verified = encoder.verify(FEATURE_META, PREPROCESSOR)
         except Exception as e:
-            print("Failed to load SHAP background:", e)
-    if manifest_path.exists():
-        MANIFEST = _safe_load_json(manifest_path)
-        print("Loaded manifest")
+            print("Row encoder check failed:", e)
+            verified = False
+        ROW_ENCODER = encoder if verified else None
+        print("Compiled row encoder verified" if verified else "Compiled row encoder disagrees with the preprocessor; not used")
+
+    # Drift reference: exported with the model, else derived from the SHAP background
+    reference = artifacts.get("drift_reference")
+    if reference is None and SHAP_BG is not None and FEATURE_META:
+        reference = drift.reference_from_encoded(SHAP_BG, FEATURE_META)
+    if reference is not None:
+        DRIFT = drift.DriftMonitor(reference, DRIFT_STATE_FILE)
+        print(f"Drift monitor: {reference.get('source')} reference, {DRIFT.rows} rows observed so far")
 
     # Build SHAP explainer lazily if all pieces exist
     if BOOSTER is not None and SHAP_BG is not None:
@@ -117,16 +195,30 @@ def load_model_artifacts() -> None:
                 dm = xgb.DMatrix(X)
                 return BOOSTER.predict(dm)
 
-            EXPLAINER = shap.Explainer(predict_proba_fn, SHAP_BG)
-            print("Initialized SHAP explainer")
+            rows, weights = shap_background.load_or_summarize(
+                SHAP_BG, SHAP_BACKGROUND_SIZE, SHAP_BACKGROUND_METHOD, CACHE_DIR,
+                MANIFEST.get("created_at") or "unversioned",
+            )
+            EXPLAINER = shap_background.make_explainer(predict_proba_fn, rows, weights)
+            EXPLAINER_BACKGROUND = {"method": SHAP_BACKGROUND_METHOD, "rows": len(rows), "of": len(SHAP_BG)}
+            print(f"Initialized SHAP explainer ({len(rows)} of {len(SHAP_BG)} background rows, {SHAP_BACKGROUND_METHOD})")
+            # shap compiles its kernels on first use (seconds); do it now rather than in a request
+            threading.Thread(target=_warm_explainer, args=(EXPLAINER, rows[:1]), daemon=True).start()
         except Exception as e:
             print("Failed to initialize SHAP explainer:", e)
 
-async def process_pdf_with_workflow(pdf_content: bytes) -> Dict[str, Any]:
+async def process_pdf_with_workflow(
+    pdf_content: bytes,
+    on_field: Optional[Callable[[str, Any], None]] = None,
+    transfer: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
     """
     Process PDF through OpenAI agent-based extraction workflow.
     Uses vision API to read the PDF, then extraction agent to parse data.
     If OpenAI key is not configured, returns mock data.
+    With `on_field`, the model's answer is streamed and on_field(name, value)
+    is called as soon as each field has been parsed. `transfer` receives
+    how the PDF was sent (file ID or inline) and the bytes sent.
     """
     if not OPENAI_API_KEY:
         print("OPENAI_API_KEY not configured - returning mock data")
@@ -163,13 +255,16 @@ async def process_pdf_with_workflow(pdf_content: bytes) -> Dict[str, Any]:
         return mock_data
     
     try:
-        # Import the agent workflow
-        from workflow_agent import extract_from_pdf_bytes
-        
         print(f"Starting agent-based extraction (PDF size: {len(pdf_content)} bytes)")
         
         # Run the agent workflow with raw PDF bytes
-        result = await extract_from_pdf_bytes(client, pdf_content)
+        if on_field is None:
+            result = await extract_from_pdf_bytes(client, pdf_content, PDF_FILES, transfer)
+        else:
+            result = {}
+            async for key, value in stream_from_pdf_bytes(client, pdf_content, PDF_FILES, transfer):
+                result[key] = value
+                on_field(key, value)
         
         print(f"Agent extraction complete")
         print(f"Full result: {json.dumps(result, indent=2)}")
@@ -183,67 +278,26 @@ async def process_pdf_with_workflow(pdf_content: bytes) -> Dict[str, Any]:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Agent workflow error: {str(e)}")
 
-class DocumentData(BaseModel):
-    id: str
-    filename: str
-    name: Optional[str] = None  # Display name for the document/case
-    gender: Optional[str] = None  # "m", "f", "other"
-    age: Optional[int] = None
-    birthdate: Optional[str] = None  # "YYYY-MM-DD" format
-    marital_status: Optional[str] = None  # "single", "married", "divorced", "widowed"
-    height_cm: Optional[float] = None
-    weight_kg: Optional[float] = None
-    bmi: Optional[float] = None
-    smoking: Optional[bool] = None
-    packs_per_week: Optional[float] = None
-    drug_use: Optional[bool] = None
-    drug_frequency: Optional[float] = None
-    drug_type: Optional[str] = None  # "safe", "warning", "danger", "unknown"
-    staying_abroad: Optional[bool] = None
-    abroad_type: Optional[str] = None  # "safe", "warning", "danger", "unknown"
-    dangerous_sports: Optional[bool] = None
-    sport_type: Optional[str] = None  # "safe", "warning", "danger", "unknown"
-    medical_issue: Optional[bool] = None
-    medical_type: Optional[str] = None  # "safe", "warning", "danger", "unknown"
-    doctor_visits: Optional[bool] = None
-    visit_type: Optional[str] = None  # "physician", "specialist", "hospital"
-    regular_medication: Optional[bool] = None
-    medication_type: Optional[str] = None  # "safe", "warning", "danger", "unknown"
-    sports_activity_h_per_week: Optional[float] = None
-    earning_chf: Optional[int] = None
-    uploaded_at: Optional[str] = None
-    pdf_path: Optional[str] = None
-    model_prediction: Optional[str] = None  # "Accepted" or "Rejected" - AI model prediction
-    human_prediction: Optional[str] = None  # "Accepted" or "Rejected" - Human override
-
-
-class PredictRequest(BaseModel):
-    # Mirror the fields used by the model (all optional; missing -> np.nan/None)
-    gender: Optional[str] = None
-    age: Optional[int] = None
-    birthdate: Optional[str] = None
-    marital_status: Optional[str] = None
-    height_cm: Optional[float] = None
-    weight_kg: Optional[float] = None
-    bmi: Optional[float] = None
-    smoking: Optional[bool] = None
-    packs_per_week: Optional[float] = None
-    drug_use: Optional[bool] = None
-    drug_frequency: Optional[float] = None
-    drug_type: Optional[str] = None
-    staying_abroad: Optional[bool] = None
-    abroad_type: Optional[str] = None
-    dangerous_sports: Optional[bool] = None
-    sport_type: Optional[str] = None
-    medical_issue: Optional[bool] = None
-    medical_type: Optional[str] = None
-    doctor_visits: Optional[bool] = None
-    visit_type: Optional[str] = None
-    regular_medication: Optional[bool] = None
-    medication_type: Optional[str] = None
-    sports_activity_h_per_week: Optional[float] = None
-    earning_chf: Optional[int] = None
-    include_explanation: bool = True
+# The applicant fields are generated from the schema shared with extraction and scoring
+DocumentData = create_model(
+    "DocumentData",
+    id=(str, ...),
+    filename=(str, ...),
+    name=(Optional[str], None),  # Display name for the document/case
+    **applicant_schema.pydantic_fields(),
+    uploaded_at=(Optional[str], None),
+    pdf_path=(Optional[str], None),
+    model_prediction=(Optional[str], None),  # "Accepted" or "Rejected" - AI model prediction
+    human_prediction=(Optional[str], None),  # "Accepted" or "Rejected" - Human override
+)
+
+# The fields used by the model (all optional; missing -> np.nan/None)
+PredictRequest = create_model(
+    "PredictRequest",
+    **applicant_schema.pydantic_fields(),
+    include_explanation=(bool, True),
+)
+_validate_model_inputs = applicant_schema.compile_validator(PredictRequest)
 
 
 class PredictResponse(BaseModel):
@@ -252,6 +306,22 @@ class PredictResponse(BaseModel):
     score: float
     model_version: Optional[str] = None
     explanation: Optional[Dict[str, Any]] = None
+    # True if the explanation was skipped because the explainer was overloaded
+    degraded: bool = False
+
+class WhatIfRequest(BaseModel):
+    applicant: PredictRequest
+    # Features to vary; defaults to the ones reviewers ask about most
+    features: List[str] = ["age", "bmi", "packs_per_week", "sports_activity_h_per_week", "earning_chf"]
+
+class CounterfactualRequest(BaseModel):
+    applicant: PredictRequest
+    target: str = "accept"
+    # Fields the search may not touch, in addition to counterfactual.IMMUTABLE_FEATURES
+    immutable: Optional[List[str]] = None
+    max_changes: int = 3
+    max_results: int = 3
+    time_budget_ms: int = 500
 
 class DocumentNameUpdate(BaseModel):
     name: str
@@ -272,7 +342,279 @@ def health() -> Dict[str, Any]:
         BOOSTER is not None,
         isinstance(FEATURE_META, dict) and FEATURE_META.get("all_feature_names_after_pre"),
     ])
-    return {"status": "ok" if ok else "degraded", "model_loaded": ok}
+    return {"status": "ok" if ok else "degraded", "model_loaded": ok, "schema_mismatches": SCHEMA_MISMATCHES}
+
+# Derived state updated by every document write below: analytics counters
+# and the search index
+ANALYTICS = analytics.AnalyticsAggregator()
+SEARCH_INDEX = search_index.SearchIndex()
+
+
+# input hash -> id of a document holding a stored explanation for those inputs (see _stored_prediction)
+_EXPLANATION_INDEX: Dict[str, str] = {}
+
+
+def _index_explanation(before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]) -> None:
+    old_hash = ((before or {}).get("explanation") or {}).get("input_hash")
+    if old_hash and _EXPLANATION_INDEX.get(old_hash) == before.get("id"):
+        del _EXPLANATION_INDEX[old_hash]
+    new_hash = ((after or {}).get("explanation") or {}).get("input_hash")
+    if new_hash:
+        _EXPLANATION_INDEX[new_hash] = after["id"]
+
+
+def _document_changed(before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]) -> None:
+    """Keep derived state in step with a document going from `before` to `after` (None = absent)."""
+    ANALYTICS.apply(before, after)
+    SEARCH_INDEX.update(before, after)
+    _index_explanation(before, after)
+
+
+# Documents live in memory, backed by an append-only log under data/log/ that
+# is periodically compacted into the per-document JSON files (see
+# document_store.py). Every change goes through the store, which logs it and
+# then calls _document_changed, under one lock.
+STORE = document_store.DocumentStore(DATA_DIR, listener=_document_changed)
+
+
+def _read_document(doc_id: str) -> Optional[Dict[str, Any]]:
+    """One stored document, or None if it does not exist."""
+    return STORE.get(doc_id)
+
+
+def _iter_documents():
+    """Yield every stored document (full scan; only for listings and rebuilds)."""
+    return STORE.iter_documents()
+
+
+def _commit_documents(docs: List[Dict[str, Any]]) -> None:
+    """Write a batch of documents all-or-nothing (a single log record)."""
+    STORE.put_many(docs)
+
+
+# Stage events of uploads and analyses, streamed by GET /events/{job_id}
+PROGRESS = progress.ProgressBroker()
+# Jobs started with background=true (referenced so they are not garbage collected)
+_BACKGROUND_JOBS: set = set()
+
+
+# Admission control (admission.py): OpenAI extractions and SHAP explanations
+# run a bounded number at a time behind bounded queues; limits are
+# configurable via ADMISSION_<NAME>_CONCURRENCY/_QUEUE/_TIMEOUT
+UPLOAD_LIMIT = admission.Limiter.from_env("upload", concurrency=4, queue=16, timeout=30)
+# Explanations are serialized by _EXPLAINER_LOCK anyway; a few may wait briefly, the rest degrade
+EXPLAIN_LIMIT = admission.Limiter.from_env("explain", concurrency=1, queue=4, timeout=2)
+# Bulk jobs run one at a time, each with BULK_WORKERS applications in flight
+# on an extraction budget of its own, so single uploads keep theirs
+BULK_LIMIT = admission.Limiter.from_env("bulk", concurrency=1, queue=4, timeout=3600)
+BULK_WORKERS = int(os.getenv("BULK_WORKERS", 4))
+ADMISSION = {limiter.name: limiter for limiter in (UPLOAD_LIMIT, EXPLAIN_LIMIT, BULK_LIMIT)}
+
+
+def _overloaded(e: admission.Overloaded) -> HTTPException:
+    return HTTPException(status_code=e.status_code, detail=e.detail, headers={"Retry-After": str(e.retry_after)})
+
+
+def _spawn(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    _BACKGROUND_JOBS.add(task)
+    task.add_done_callback(_BACKGROUND_JOBS.discard)
+    return task
+
+
+# PDFs and thumbnails never change once written for a doc_id, so clients may
+# cache them for good (private: they contain personal data).
+IMMUTABLE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+# path -> (mtime_ns, size, etag); content hashes are computed once per file
+_ETAG_CACHE: Dict[str, tuple] = {}
+
+
+def _file_etag(path: Path, stat: os.stat_result) -> str:
+    """Strong ETag: SHA-256 of the file content, cached by mtime and size."""
+    key = str(path)
+    cached = _ETAG_CACHE.get(key)
+    if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+        return cached[2]
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    etag = f'"{digest.hexdigest()[:32]}"'
+    _ETAG_CACHE[key] = (stat.st_mtime_ns, stat.st_size, etag)
+    return etag
+
+
+def _not_modified(request: Request, etag: str, mtime: float) -> bool:
+    """Evaluate If-None-Match (preferred) or If-Modified-Since."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [t.strip() for t in if_none_match.split(",")]
+        return "*" in tags or etag in tags or f"W/{etag}" in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _immutable_file_response(request: Request, path: Path, media_type: str, headers: Optional[Dict[str, str]] = None) -> Response:
+    """Serve a never-changing file with strong validators, 304s and range support."""
+    stat = path.stat()
+    validators = {
+        "ETag": _file_etag(path, stat),
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL,
+    }
+    if _not_modified(request, validators["ETag"], stat.st_mtime):
+        return Response(status_code=304, headers=validators)
+    # FileResponse answers Range/If-Range requests itself, using our ETag
+    return FileResponse(path, media_type=media_type, stat_result=stat, headers={**validators, **(headers or {})})
+
+
+_RANGE = re.compile(r"bytes=(\d*)-(\d*)")
+RANGE_CHUNK_BYTES = 256 * 1024
+
+
+def _immutable_bytes_response(
+    request: Request, data, etag: str, mtime: float, media_type: str, headers: Optional[Dict[str, str]] = None
+) -> Response:
+    """
+    Serve never-changing content held in memory or mapped (bytes or memoryview)
+    like _immutable_file_response: validators, 304s and single byte ranges.
+    """
+    validators = {
+        "ETag": etag,
+        "Last-Modified": formatdate(mtime, usegmt=True),
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL,
+    }
+    if _not_modified(request, etag, mtime):
+        return Response(status_code=304, headers=validators)
+    size = len(data)
+    start, end, status = 0, size - 1, 200
+    headers = {**validators, **(headers or {}), "Accept-Ranges": "bytes"}
+    match = _RANGE.fullmatch(request.headers.get("range", "").strip())
+    # If-Range with another validator (or a date) asks for the whole content; so do multiple ranges
+    if match and any(match.groups()) and request.headers.get("if-range", etag) == etag:
+        first, last = match.groups()
+        if first:
+            start, end = int(first), min(int(last), size - 1) if last else size - 1
+        else:
+            start = max(0, size - int(last))
+        if start >= size or start > end:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+        status = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    body = data[start:end + 1]
+    headers["Content-Length"] = str(len(body))
+    
+    def chunks():
+        for i in range(0, len(body), RANGE_CHUNK_BYTES):
+            yield bytes(body[i:i + RANGE_CHUNK_BYTES])
+    
+    return StreamingResponse(chunks(), status_code=status, media_type=media_type, headers=headers)
+
+
+def _thumbnail_file(doc_id: str) -> Path:
+    return THUMBNAIL_DIR / f"{doc_id}.jpg"
+
+
+def _render_thumbnail(doc_id: str, image_bytes: Optional[bytes] = None) -> bool:
+    """Render and store a document's thumbnail; runs as a background task after upload."""
+    pdf_file = PDF_STORE.hot_path(doc_id)
+    try:
+        if image_bytes is None:
+            pdf_bytes = PDF_STORE.read(doc_id)
+            if pdf_bytes is None:
+                return False
+            data = thumbnails.render_thumbnail(pdf_bytes=pdf_bytes)
+        else:
+            data = thumbnails.render_thumbnail(image_bytes=image_bytes)
+    except Exception as e:
+        print(f"Thumbnail rendering failed for {doc_id}: {e}")
+        return False
+    if data is None:
+        return False
+    tmp = _thumbnail_file(doc_id).with_suffix(".tmp")
+    tmp.write_bytes(data)
+    tmp.replace(_thumbnail_file(doc_id))
+    if pdf_file.exists():
+        _file_etag(pdf_file, pdf_file.stat())  # warm the PDF's ETag while we are at it
+    return True
+
+
+def _load_derived_state() -> None:
+    """Open the document store, then build analytics and search index in one pass over it."""
+    t0 = time.perf_counter()
+    recovery = STORE.open()
+    if recovery["replayed_records"] or recovery["truncated_bytes"]:
+        print(f"Document log replayed {recovery['replayed_records']} records "
+              f"(truncated {recovery['truncated_bytes']} bytes of torn tail)")
+
+    def documents():
+        # The search index sorts once after the pass instead of per document
+        for doc in SEARCH_INDEX.load(_iter_documents()):
+            if doc.get("id"):
+                _index_explanation(None, doc)
+            yield doc
+
+    _EXPLANATION_INDEX.clear()
+    report = ANALYTICS.rebuild(documents())
+    print(f"Indexed {report['documents']} documents in {time.perf_counter() - t0:.2f}s")
+
+
+_load_derived_state()
+
+
+def _pdf_is_cold(doc_id: str, age_s: float) -> bool:
+    """Whether a hot PDF should move to the packs: decided documents after PDF_COLD_AFTER_DAYS, others after 4x."""
+    doc = STORE.get(doc_id)
+    if doc is None:
+        # Uploads in progress (or failed ones) have no document yet
+        return False
+    decided = doc.get("human_prediction") or doc.get("model_prediction")
+    return age_s >= PDF_COLD_AFTER_DAYS * 86400 * (1 if decided else 4)
+
+
+def _compact_pdfs_periodically() -> None:
+    while True:
+        time.sleep(PDF_COMPACT_INTERVAL_S)
+        try:
+            report = PDF_STORE.compact(_pdf_is_cold, wait=False)
+            if report.get("moved"):
+                print(f"Packed {report['moved']} PDFs ({report['raw_bytes']} -> {report['stored_bytes']} bytes) in {report['seconds']}s")
+            PDF_STORE.repack()
+        except Exception as e:
+            print(f"PDF compaction failed: {e}")
+
+
+if PDF_COMPACT_INTERVAL_S > 0:
+    threading.Thread(target=_compact_pdfs_periodically, name="pdf-compaction", daemon=True).start()
+
+
+def _attach_provider_file(doc_id: str, pdf_content: bytes) -> None:
+    """Tie the provider's copy of a document's PDF to the document, so that deleting it deletes the copy."""
+    if PDF_FILES is not None:
+        PDF_FILES.attach(doc_id, pdf_content)
+
+
+async def _sweep_provider_files_periodically() -> None:
+    while True:
+        try:
+            report = await PDF_FILES.sweep(STORE.__contains__)
+            if report["deleted_files"]:
+                print(f"Deleted {report['deleted_files']} unused or expired provider files")
+        except Exception as e:
+            print(f"Provider file sweep failed: {e}")
+        await asyncio.sleep(OPENAI_FILE_SWEEP_INTERVAL_S)
+
+
+@app.on_event("startup")
+async def _start_provider_file_sweep() -> None:
+    if PDF_FILES is not None and OPENAI_FILE_SWEEP_INTERVAL_S > 0:
+        _spawn(_sweep_provider_files_periodically())
+
 
 async def convert_images_to_pdf(image_files: List[bytes]) -> bytes:
     """
@@ -307,10 +649,17 @@ async def convert_images_to_pdf(image_files: List[bytes]) -> bytes:
         raise HTTPException(status_code=500, detail=f"Failed to convert images to PDF: {str(e)}")
 
 @app.post("/upload")
-async def upload_document(files: List[UploadFile] = File(...)) -> Dict[str, Any]:
+async def upload_document(
+    background_tasks: BackgroundTasks,
+    files: List[UploadFile] = File(...),
+    job_id: Optional[str] = None,
+    background: bool = False,
+):
     """
     Upload one or more files (PDF or images) and extract data using OpenAI workflow.
     Images will be converted to PDF before processing.
+    Progress is published to GET /events/{job_id} (job_id defaults to the new document's id).
+    With background=true, responds 202 right away and the result arrives as the stream's `done` event.
     """
     if not files or len(files) == 0:
         raise HTTPException(status_code=400, detail="No files provided")
@@ -318,6 +667,9 @@ async def upload_document(files: List[UploadFile] = File(...)) -> Dict[str, Any]
     if len(files) > 2:
         raise HTTPException(status_code=400, detail="Maximum 2 files allowed")
     
+    if job_id is not None and not progress.JOB_ID_PATTERN.match(job_id):
+        raise HTTPException(status_code=400, detail="job_id must be 1-64 letters, digits, '-' or '_'")
+    
     # Validate file types
     pdf_files = []
     image_files = []
@@ -337,65 +689,149 @@ async def upload_document(files: List[UploadFile] = File(...)) -> Dict[str, Any]
                 detail=f"Invalid file type: {file.filename}. Only PDF, JPG, and PNG are accepted"
             )
     
+    # Fail fast when extraction capacity and its queue are both taken
+    try:
+        ticket = UPLOAD_LIMIT.enter()
+    except admission.Overloaded as e:
+        raise _overloaded(e)
+    
     # Generate unique ID
     doc_id = str(uuid.uuid4())
+    job_id = job_id or doc_id
+    thumbnail_image = image_files[0] if image_files and not pdf_files else None
+    
+    PROGRESS.start(job_id)
+    PROGRESS.publish(job_id, "received", {
+        "doc_id": doc_id,
+        "files": filenames,
+        "bytes": sum(map(len, pdf_files + image_files)),
+    })
+    if ticket.waiter is not None:
+        PROGRESS.publish(job_id, "queued", {"position": UPLOAD_LIMIT.queued})
+    
+    async def admitted() -> Dict[str, Any]:
+        try:
+            async with ticket:
+                return await _process_upload(job_id, doc_id, pdf_files, image_files, filenames)
+        except admission.Overloaded as e:
+            PROGRESS.publish(job_id, "error", {
+                "stage": "queued", "status_code": e.status_code, "detail": e.detail, "retry_after": e.retry_after,
+            })
+            raise _overloaded(e)
+    
+    if background:
+        async def run() -> None:
+            try:
+                await admitted()
+            except HTTPException:
+                return  # already published as the job's error event
+            await asyncio.to_thread(_render_thumbnail, doc_id, thumbnail_image)
+        _spawn(run())
+        return FastJSONResponse(
+            {"job_id": job_id, "doc_id": doc_id, "events": f"/events/{job_id}"}, status_code=202
+        )
     
+    extracted_data = await admitted()
+    
+    # Render the preview after the response is sent
+    background_tasks.add_task(_render_thumbnail, doc_id, thumbnail_image)
+    
+    return extracted_data
+
+
+async def _combine_to_pdf(pdf_files: List[bytes], image_files: List[bytes]) -> tuple:
+    """(one PDF of all files: PDFs' pages then images as pages, False if only the first PDF could be kept)."""
+    parts = list(pdf_files)
+    if image_files:
+        parts.append(await convert_images_to_pdf(image_files))
+    return await asyncio.to_thread(bulk_ingest.merge_pdfs, parts)
+
+
+EXTRACTED_FIELDS = applicant_schema.FIELD_NAMES
+
+
+def _extraction_record(doc: Dict[str, Any], transfer: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Per-field confidence of a document's extracted values, with the cost of the extraction that produced them."""
+    confidence = workflow_agent.extraction_confidence(doc)
+    return {
+        "confidence": confidence,
+        "low_confidence": [key for key, value in confidence.items() if value < workflow_agent.CONFIDENT],
+        "extracted_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        **{key: (transfer or {}).get(key) for key in ("prompt_tokens", "completion_tokens", "latency_s", "bytes_sent")},
+    }
+
+
+def _document_from_extraction(
+    doc_id: str, filename: str, workflow_result: Any, transfer: Optional[Dict[str, Any]] = None
+) -> tuple:
+    """(new document for an extraction result, the fields the extraction produced)."""
+    # Build extracted data from workflow result
+    extracted_data = {
+        "id": doc_id,
+        "filename": filename,
+        "name": filename,  # Default name is the filename
+        "uploaded_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "pdf_path": f"pdfs/{doc_id}.pdf",
+        "model_prediction": None,  # No AI prediction yet
+        "human_prediction": None   # No human override yet
+    }
+    
+    # Merge workflow result with extracted data (all fields optional)
+    if isinstance(workflow_result, dict):
+        # Add all fields from workflow, keeping them optional
+        for key in EXTRACTED_FIELDS:
+            extracted_data[key] = workflow_result.get(key)
+    fields = {k: extracted_data[k] for k in workflow_result if k in extracted_data} if isinstance(workflow_result, dict) else {}
+    extracted_data["extraction"] = _extraction_record(extracted_data, transfer)
+    return extracted_data, fields
+
+
+async def _process_upload(
+    job_id: str, doc_id: str, pdf_files: List[bytes], image_files: List[bytes], filenames: List[str]
+) -> Dict[str, Any]:
+    """Convert, extract and store an upload, publishing each stage to the job's event stream."""
+    stage = "converting"
     try:
-        # Determine the content to process
-        if pdf_files and not image_files:
-            # Only PDF(s) - use the first one
-            content = pdf_files[0]
-            main_filename = filenames[0]
-        elif image_files and not pdf_files:
-            # Only image(s) - convert to PDF
-            content = await convert_images_to_pdf(image_files)
-            main_filename = " + ".join(filenames)
-        else:
-            # Mix of PDF and images - convert images to PDF and use first PDF
-            content = pdf_files[0]
-            main_filename = filenames[0]
+        # One PDF of everything uploaded: the PDFs' pages, then the images as pages
+        content, complete = await _combine_to_pdf(pdf_files, image_files)
+        if not complete:
+            print(f"Upload {doc_id}: PyPDF2 not installed, only the first PDF is kept")
+        main_filename = " + ".join(filenames)
         
         # Save PDF file
         pdf_path = PDF_DIR / f"{doc_id}.pdf"
         with open(pdf_path, "wb") as f:
             f.write(content)
+        PROGRESS.publish(job_id, "converted", {"pdf_bytes": len(content), "from_images": bool(image_files and not pdf_files)})
         
         # Process PDF through OpenAI workflow
-        workflow_result = await process_pdf_with_workflow(content)
-        
-        # Build extracted data from workflow result
-        extracted_data = {
-            "id": doc_id,
-            "filename": main_filename,
-            "name": main_filename,  # Default name is the filename
-            "uploaded_at": time.strftime("%Y-%m-%d %H:%M:%S"),
-            "pdf_path": f"pdfs/{doc_id}.pdf",
-            "model_prediction": None,  # No AI prediction yet
-            "human_prediction": None   # No human override yet
-        }
-        
-        # Merge workflow result with extracted data (all fields optional)
-        if isinstance(workflow_result, dict):
-            # Add all fields from workflow, keeping them optional
-            for key in ['gender', 'age', 'birthdate', 'marital_status', 'height_cm', 'weight_kg', 
-                       'bmi', 'smoking', 'packs_per_week', 'drug_use', 'drug_frequency', 'drug_type',
-                       'staying_abroad', 'abroad_type', 'dangerous_sports', 'sport_type', 
-                       'medical_issue', 'medical_type', 'doctor_visits', 'visit_type', 
-                       'regular_medication', 'medication_type', 'sports_activity_h_per_week', 'earning_chf']:
-                extracted_data[key] = workflow_result.get(key)
+        stage = "extracting"
+        PROGRESS.publish(job_id, "extracting", {})
+        transfer: Dict[str, Any] = {}
+        workflow_result = await process_pdf_with_workflow(
+            content, on_field=lambda key, value: PROGRESS.publish(job_id, "partial", {"fields": {key: value}}), transfer=transfer
+        )
+        extracted_data, fields = _document_from_extraction(doc_id, main_filename, workflow_result, transfer)
+        PROGRESS.publish(job_id, "extracted", {
+            "fields": fields,
+            "low_confidence": extracted_data["extraction"]["low_confidence"],
+            **({"transfer": transfer} if transfer else {}),
+        })
         
-        # Save to JSON file
-        data_file = DATA_DIR / f"{doc_id}.json"
-        with open(data_file, "w") as f:
-            json.dump(extracted_data, f, indent=2)
+        # Save the document
+        stage = "storing"
+        await asyncio.to_thread(STORE.put, extracted_data)
+        _attach_provider_file(doc_id, content)
+        PROGRESS.publish(job_id, "done", extracted_data)
         
         return extracted_data
         
-    except HTTPException:
+    except HTTPException as e:
         # Clean up PDF file on error
         pdf_path = PDF_DIR / f"{doc_id}.pdf"
         if pdf_path.exists():
             pdf_path.unlink()
+        PROGRESS.publish(job_id, "error", {"stage": stage, "status_code": e.status_code, "detail": e.detail})
         raise
     except Exception as e:
         # Clean up PDF file on error
@@ -405,7 +841,141 @@ async def upload_document(files: List[UploadFile] = File(...)) -> Dict[str, Any]
         print(f"Upload error: {str(e)}")
         import traceback
         traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"Failed to process document: {str(e)}")
+        detail = f"Failed to process document: {str(e)}"
+        PROGRESS.publish(job_id, "error", {"stage": stage, "status_code": 500, "detail": detail})
+        raise HTTPException(status_code=500, detail=detail)
+
+# Manifests of bulk jobs: in memory while recent, in data/bulk/ once finished
+BULK_DIR = DATA_DIR / "bulk"
+MAX_BULK_JOBS = 100
+_BULK_JOBS: "OrderedDict[str, bulk_ingest.BulkJob]" = OrderedDict()
+
+
+@app.post("/bulk")
+async def bulk_upload(files: List[UploadFile] = File(...), job_id: Optional[str] = None) -> FastJSONResponse:
+    """
+    Ingest many applications at once: ZIP archives and/or many PDFs and
+    images in one multipart request. Files are grouped into applications
+    (one per folder, per top-level PDF, or per image name without its page
+    number), and each is converted, extracted, scored and stored.
+    Responds 202 at once; GET /bulk/{job_id} is the per-item manifest and
+    GET /events/{job_id} streams an `item` event per finished application.
+    """
+    if job_id is not None and not progress.JOB_ID_PATTERN.match(job_id):
+        raise HTTPException(status_code=400, detail="job_id must be 1-64 letters, digits, '-' or '_'")
+    job_id = job_id or str(uuid.uuid4())
+    if job_id in _BULK_JOBS:
+        raise HTTPException(status_code=409, detail=f"Bulk job {job_id} already exists")
+    try:
+        ticket = BULK_LIMIT.enter()
+    except admission.Overloaded as e:
+        raise _overloaded(e)
+    
+    spool_dir = Path(tempfile.mkdtemp(prefix="bulk-"))
+    archives: List[Any] = []
+    try:
+        entries, archives = await asyncio.to_thread(
+            bulk_ingest.spool_parts, [(f.filename or "", f.file) for f in files], spool_dir
+        )
+        groups, skipped = bulk_ingest.group_entries(entries)
+        if not groups:
+            raise ValueError("No PDF, JPG or PNG files found")
+    except Exception as e:
+        # Any failure (also e.g. a full disk) must give back the only bulk slot
+        for archive in archives:
+            archive.close()
+        ticket.cancel()
+        shutil.rmtree(spool_dir, ignore_errors=True)
+        if isinstance(e, ValueError):
+            raise HTTPException(status_code=400, detail=str(e))
+        raise
+    
+    job = bulk_ingest.BulkJob(job_id, groups, skipped, BULK_WORKERS)
+    _BULK_JOBS[job_id] = job
+    while len(_BULK_JOBS) > MAX_BULK_JOBS:
+        oldest = next((j for j in _BULK_JOBS.values() if j.finished is not None), None)
+        if oldest is None:
+            break
+        del _BULK_JOBS[oldest.id]
+    PROGRESS.start(job_id)
+    PROGRESS.publish(job_id, "received", {"items": len(groups), "skipped_files": len(skipped)})
+    
+    def failed(item: int, error: str) -> None:
+        PROGRESS.publish(job_id, "item", job.finish(item, error=error))
+    
+    async def process(item: int, pdfs: List[tuple], images: List[tuple]) -> None:
+        doc_id = str(uuid.uuid4())
+        pdf_path = PDF_DIR / f"{doc_id}.pdf"
+        filename = " + ".join(PurePosixPath(name).name for name, _ in pdfs + images)
+        scored = PREPROCESSOR is not None and BOOSTER is not None and bool(FEATURE_META)
+        try:
+            job.stage(item, bulk_ingest.CONVERTING)
+            content, complete = await _combine_to_pdf([d for _, d in pdfs], [d for _, d in images])
+            await asyncio.to_thread(pdf_path.write_bytes, content)
+            
+            job.stage(item, bulk_ingest.EXTRACTING)
+            transfer: Dict[str, Any] = {}
+            workflow_result = await process_pdf_with_workflow(content, transfer=transfer)
+            doc, _ = _document_from_extraction(doc_id, filename, workflow_result, transfer)
+            
+            if scored:
+                job.stage(item, bulk_ingest.SCORING)
+                await asyncio.to_thread(_score_documents, [doc])
+            
+            job.stage(item, bulk_ingest.STORING)
+            await asyncio.to_thread(STORE.put, doc)
+            _attach_provider_file(doc_id, content)
+        except Exception:
+            if pdf_path.exists():
+                pdf_path.unlink()
+            raise
+        await asyncio.to_thread(_render_thumbnail, doc_id, images[0][1] if images and not pdfs else None)
+        if scored:
+            _queue_explanations([doc_id])
+        extra = {} if complete else {"warning": "PyPDF2 not installed: only the first PDF was kept"}
+        if transfer:
+            extra["bytes_sent"] = transfer["bytes_sent"]
+        PROGRESS.publish(job_id, "item", job.finish(item, doc_id=doc_id, model_prediction=doc.get("model_prediction"), **extra))
+    
+    async def run() -> None:
+        try:
+            async with ticket:
+                await bulk_ingest.run_pipeline(job, groups, process, failed)
+        except admission.Overloaded as e:
+            job.started = job.finished = time.time()
+            for item in job.items:
+                job.finish(item["item"], error=e.detail)
+        finally:
+            for archive in archives:
+                archive.close()
+            await asyncio.to_thread(shutil.rmtree, spool_dir, True)
+            manifest = job.manifest()
+            BULK_DIR.mkdir(exist_ok=True)
+            await asyncio.to_thread((BULK_DIR / f"{job_id}.json").write_bytes, serialization.dumps(manifest))
+            PROGRESS.publish(job_id, "done", {k: v for k, v in manifest.items() if k not in ("items", "skipped")})
+    
+    _spawn(run())
+    return FastJSONResponse({
+        "job_id": job_id,
+        "items": len(groups),
+        "skipped_files": len(skipped),
+        "manifest": f"/bulk/{job_id}",
+        "events": f"/events/{job_id}",
+    }, status_code=202)
+
+
+@app.get("/bulk/{job_id}")
+async def get_bulk_manifest(job_id: str) -> FastJSONResponse:
+    """Per-application status (doc_id and model prediction, or the error) and throughput of a bulk job."""
+    job = _BULK_JOBS.get(job_id)
+    if job is not None:
+        return FastJSONResponse(job.manifest())
+    if progress.JOB_ID_PATTERN.match(job_id):
+        path = BULK_DIR / f"{job_id}.json"
+        if path.exists():
+            return FastJSONResponse(serialization.loads(path.read_bytes()))
+    raise HTTPException(status_code=404, detail="Bulk job not found")
+
 
 @app.put("/save/{doc_id}")
 async def save_document(doc_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
@@ -416,93 +986,95 @@ async def save_document(doc_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
     if data.get("id") != doc_id:
         raise HTTPException(status_code=400, detail="Document ID mismatch")
     
-    data_file = DATA_DIR / f"{doc_id}.json"
-    
-    if not data_file.exists():
+    if doc_id not in STORE:
         raise HTTPException(status_code=404, detail="Document not found")
     
     # Save updated data
-    with open(data_file, "w") as f:
-        json.dump(data, f, indent=2)
+    await asyncio.to_thread(STORE.put, data)
     
     return {"status": "success", "message": f"Document {doc_id} saved", "data": data}
 
 @app.get("/documents")
-async def list_documents() -> Dict[str, Any]:
+async def list_documents() -> FastJSONResponse:
     """
     List all stored documents with summary info.
     """
     documents = []
-    for file_path in DATA_DIR.glob("*.json"):
-        with open(file_path) as f:
-            data = json.load(f)
-            # Return only summary fields
-            documents.append({
-                "id": data.get("id"),
-                "filename": data.get("filename"),
-                "name": data.get("name", data.get("filename")),  # Use name if available, fallback to filename
-                "uploaded_at": data.get("uploaded_at", "Unknown"),
-                "model_prediction": data.get("model_prediction"),  # AI prediction
-                "human_prediction": data.get("human_prediction"),  # Human override
-                # For backward compatibility, also send 'prediction' as human_prediction if exists, else model_prediction
-                "prediction": data.get("human_prediction") or data.get("model_prediction")
-            })
+    for data in _iter_documents():
+        # Return only summary fields
+        documents.append({
+            "id": data.get("id"),
+            "filename": data.get("filename"),
+            "name": data.get("name", data.get("filename")),  # Use name if available, fallback to filename
+            "uploaded_at": data.get("uploaded_at", "Unknown"),
+            "model_prediction": data.get("model_prediction"),  # AI prediction
+            "human_prediction": data.get("human_prediction"),  # Human override
+            # For backward compatibility, also send 'prediction' as human_prediction if exists, else model_prediction
+            "prediction": data.get("human_prediction") or data.get("model_prediction")
+        })
     
     # Sort by uploaded_at descending
     documents.sort(key=lambda x: x.get("uploaded_at", ""), reverse=True)
     
-    return {"count": len(documents), "documents": documents}
+    return FastJSONResponse({"count": len(documents), "documents": documents})
 
 @app.get("/documents/{doc_id}")
 async def get_document(doc_id: str) -> Dict[str, Any]:
     """
     Get full document data by ID.
     """
-    data_file = DATA_DIR / f"{doc_id}.json"
+    data = _read_document(doc_id)
     
-    if not data_file.exists():
+    if data is None:
         raise HTTPException(status_code=404, detail="Document not found")
     
-    with open(data_file) as f:
-        return json.load(f)
+    return data
 
 @app.get("/pdf/{doc_id}")
-async def get_pdf(doc_id: str):
+def get_pdf(doc_id: str, request: Request):
     """
-    Retrieve the original PDF file for a document.
+    Retrieve the original PDF file for a document, from its file or its pack.
+    Supports Range requests and conditional GETs (ETag / Last-Modified).
     """
-    pdf_file = PDF_DIR / f"{doc_id}.pdf"
+    pdf_file = PDF_STORE.hot_path(doc_id)
+    headers = {"Content-Disposition": "inline"}
     
-    if not pdf_file.exists():
+    if pdf_file.exists():
+        return _immutable_file_response(request, pdf_file, "application/pdf", headers)
+    entry = PDF_STORE.cold_entry(doc_id)
+    if entry is None:
         raise HTTPException(status_code=404, detail="PDF file not found")
-    
-    return FileResponse(
-        pdf_file,
-        media_type="application/pdf",
-        headers={"Content-Disposition": "inline"}
-    )
+    # Same ETag as the file had (SHA-256 of the content), so client caches stay valid
+    etag = f'"{entry["sha256"][:32]}"'
+    try:
+        content = PDF_STORE.cold_view(doc_id, entry)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="PDF file not found")
+    return _immutable_bytes_response(request, content, etag, entry["mtime"], "application/pdf", headers)
+
+
+@app.get("/thumbnail/{doc_id}")
+def get_thumbnail(doc_id: str, request: Request):
+    """
+    Small JPEG preview of the document's first page.
+    Rendered after upload; documents uploaded earlier are rendered on first request.
+    """
+    thumb_file = _thumbnail_file(doc_id)
+    if not thumb_file.exists() and not _render_thumbnail(doc_id):
+        raise HTTPException(status_code=404, detail="Thumbnail not available")
+    return _immutable_file_response(request, thumb_file, "image/jpeg")
 
 @app.patch("/documents/{doc_id}/name")
 async def update_document_name(doc_id: str, update: DocumentNameUpdate) -> Dict[str, Any]:
     """
     Update the display name of a document.
     """
-    data_file = DATA_DIR / f"{doc_id}.json"
+    # Update name (only this field, so concurrent edits of other fields are kept)
+    data = await asyncio.to_thread(STORE.patch, doc_id, {"name": update.name})
     
-    if not data_file.exists():
+    if data is None:
         raise HTTPException(status_code=404, detail="Document not found")
     
-    # Load existing data
-    with open(data_file) as f:
-        data = json.load(f)
-    
-    # Update name
-    data["name"] = update.name
-    
-    # Save updated data
-    with open(data_file, "w") as f:
-        json.dump(data, f, indent=2)
-    
     return {"status": "success", "message": f"Document name updated", "name": update.name}
 
 @app.delete("/documents/{doc_id}")
@@ -510,58 +1082,212 @@ async def delete_document(doc_id: str) -> Dict[str, Any]:
     """
     Delete a document and its associated PDF file.
     """
-    data_file = DATA_DIR / f"{doc_id}.json"
-    pdf_file = PDF_DIR / f"{doc_id}.pdf"
+    pdf_file = PDF_STORE.hot_path(doc_id)
     
-    if not data_file.exists():
+    # Delete the document record
+    if await asyncio.to_thread(STORE.delete, doc_id) is None:
         raise HTTPException(status_code=404, detail="Document not found")
     
-    # Delete JSON file
-    data_file.unlink()
-    
-    # Delete PDF file if it exists
-    if pdf_file.exists():
-        pdf_file.unlink()
+    # Delete PDF (file or packed copy) and thumbnail if they exist
+    await asyncio.to_thread(PDF_STORE.delete, doc_id)
+    thumb_file = _thumbnail_file(doc_id)
+    if thumb_file.exists():
+        thumb_file.unlink()
+    _ETAG_CACHE.pop(str(pdf_file), None)
+    _ETAG_CACHE.pop(str(thumb_file), None)
+    # The provider's copy of the PDF too, unless another document has the same PDF
+    if PDF_FILES is not None:
+        await PDF_FILES.release(doc_id)
     
     return {"status": "success", "message": f"Document {doc_id} deleted"}
 
 @app.post("/documents/{doc_id}/analyze")
-async def run_analysis(doc_id: str) -> Dict[str, Any]:
+async def run_analysis(doc_id: str, background: bool = False):
     """
-    Run risk analysis on a document and update prediction.
-    Simulates AI analysis with 3 second delay.
+    Run risk analysis on a document and update prediction: the model's decision
+    on the stored fields, explained from the same inputs.
+    Progress is published to GET /events/analysis-{doc_id}; with background=true,
+    responds 202 right away and the result arrives as the stream's `done` event.
     """
-    data_file = DATA_DIR / f"{doc_id}.json"
-    
-    if not data_file.exists():
+    if doc_id not in STORE:
         raise HTTPException(status_code=404, detail="Document not found")
     
-    # Load existing data
-    with open(data_file) as f:
-        data = json.load(f)
+    job_id = f"analysis-{doc_id}"
+    PROGRESS.start(job_id)
+    PROGRESS.publish(job_id, "received", {"doc_id": doc_id})
     
-    # Simulate analysis time
-    await asyncio.sleep(5)
+    if background:
+        async def run() -> None:
+            try:
+                await _process_analysis(job_id, doc_id)
+            except HTTPException:
+                pass  # already published as the job's error event
+        _spawn(run())
+        return FastJSONResponse({"job_id": job_id, "doc_id": doc_id, "events": f"/events/{job_id}"}, status_code=202)
     
-    # Mock prediction based on simple rules
-    import random
+    return await _process_analysis(job_id, doc_id)
+
 
-    # Weighted random: 50% Accepted, 50% Rejected
-    model_prediction = "Accepted" if random.random() < 0.5 else "Rejected"
+async def _process_analysis(job_id: str, doc_id: str) -> Dict[str, Any]:
+    PROGRESS.publish(job_id, "scoring", {})
     
-    # Update model prediction (don't touch human_prediction)
-    data["model_prediction"] = model_prediction
+    doc = STORE.get(doc_id)
+    if doc is None:
+        PROGRESS.publish(job_id, "error", {"stage": "scoring", "status_code": 404, "detail": "Document not found"})
+        raise HTTPException(status_code=404, detail="Document not found")
+    # Same scoring as bulk ingestion and import, on a copy of the stored inputs
+    scored = dict(doc)
+    try:
+        _require_model()
+        await asyncio.to_thread(_score_documents, [scored])
+    except Exception as e:
+        status_code, detail = (e.status_code, e.detail) if isinstance(e, HTTPException) else (400, f"Scoring failed: {e}")
+        PROGRESS.publish(job_id, "error", {"stage": "scoring", "status_code": status_code, "detail": detail})
+        raise HTTPException(status_code=status_code, detail=detail)
+    model_prediction = scored["model_prediction"]
+    PROGRESS.publish(job_id, "scored", {"model_prediction": model_prediction})
     
-    # Save updated data
-    with open(data_file, "w") as f:
-        json.dump(data, f, indent=2)
+    # Explain now, so that opening the case later is a read (skipped if the
+    # explainer is busy: GET /documents/{doc_id}/explanation computes it then).
+    # The explanation is of the same inputs the prediction was made from
+    fields = {"model_prediction": model_prediction, "analyzed_at": scored["analyzed_at"]}
+    if EXPLAINER is not None and EXPLAIN_LIMIT.try_acquire():
+        started = time.monotonic()
+        try:
+            record = await asyncio.to_thread(_explain_document, doc)
+        except HTTPException as e:
+            print(f"Explanation of {doc_id} failed: {e.detail}")
+            record = None
+        finally:
+            EXPLAIN_LIMIT.release(time.monotonic() - started)
+        if record is not None:
+            fields["explanation"] = record
     
-    return {
+    # Update model prediction only, so edits made during the analysis are kept
+    data = await asyncio.to_thread(STORE.patch, doc_id, fields)
+    if data is None:
+        PROGRESS.publish(job_id, "error", {"stage": "storing", "status_code": 404, "detail": "Document not found"})
+        raise HTTPException(status_code=404, detail="Document not found")
+    
+    result = {
         "status": "success",
         "message": "Analysis complete",
         "model_prediction": model_prediction,
         "data": data
     }
+    PROGRESS.publish(job_id, "done", result)
+    return result
+
+def _parse_pages(pages: Optional[str], pdf_content: bytes, fields: List[str]) -> Optional[List[int]]:
+    """`pages` of a re-extraction: None (all), "auto" (pages mentioning the fields) or "1,3-4"."""
+    if not pages:
+        return None
+    if pages == "auto":
+        return workflow_agent.relevant_pages(pdf_content, fields)
+    selected: List[int] = []
+    try:
+        for part in pages.split(","):
+            first, _, last = part.strip().partition("-")
+            selected.extend(range(int(first), int(last or first) + 1))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid pages {pages!r}; expected 'auto' or e.g. '1,3-4'")
+    return sorted(set(selected))
+
+
+def _savings(targeted: Dict[str, Any], full: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Tokens and seconds a targeted re-extraction saved against the document's full extraction."""
+    if full.get("prompt_tokens") is None or targeted.get("prompt_tokens") is None:
+        return None
+    full_tokens = full["prompt_tokens"] + full["completion_tokens"]
+    tokens = targeted["prompt_tokens"] + targeted["completion_tokens"]
+    return {
+        "tokens": full_tokens - tokens,
+        "token_ratio": round(1 - tokens / full_tokens, 3) if full_tokens else None,
+        "completion_tokens": full["completion_tokens"] - targeted["completion_tokens"],
+        "latency_s": round(full["latency_s"] - targeted["latency_s"], 3),
+        "latency_ratio": round(1 - targeted["latency_s"] / full["latency_s"], 3) if full["latency_s"] else None,
+    }
+
+
+@app.post("/documents/{doc_id}/reextract")
+async def reextract_document(
+    doc_id: str,
+    fields: Optional[str] = Query(None, description="Comma-separated fields (default: those below `threshold`)"),
+    threshold: float = Query(workflow_agent.CONFIDENT, description="Re-extract fields with confidence below this"),
+    pages: Optional[str] = Query(None, description="'auto' for the pages mentioning the fields, or e.g. '1,3-4'"),
+) -> Dict[str, Any]:
+    """
+    Re-extract only a document's missing or low-confidence fields: the model
+    gets a tool schema with just those fields (and, with `pages`, just those
+    pages). A new value replaces the stored one only if it is more confident.
+    """
+    doc = STORE.get(doc_id)
+    if doc is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    if not OPENAI_API_KEY:
+        raise HTTPException(status_code=503, detail="Extraction model not configured")
+    if fields:
+        requested = [key.strip() for key in fields.split(",") if key.strip()]
+        unknown = [key for key in requested if key not in workflow_agent.EXTRACTION_FIELDS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    else:
+        requested = workflow_agent.low_confidence_fields(doc, threshold)
+    if not requested:
+        return {"status": "success", "message": "No low-confidence fields", "fields": [], "updated": {}, "data": doc}
+    
+    pdf_content = await asyncio.to_thread(PDF_STORE.read, doc_id)
+    if pdf_content is None:
+        raise HTTPException(status_code=404, detail="PDF not found")
+    page_list = _parse_pages(pages, pdf_content, requested)
+    
+    report: Dict[str, Any] = {}
+    try:
+        async with UPLOAD_LIMIT.enter():
+            values = await workflow_agent.reextract_fields(client, pdf_content, requested, PDF_FILES, page_list, report)
+    except admission.Overloaded as e:
+        raise _overloaded(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"Re-extraction of {doc_id} failed: {e}")
+        raise HTTPException(status_code=500, detail=f"Agent workflow error: {str(e)}")
+    
+    # Merge into the current version (the document may have been edited meanwhile)
+    current = STORE.get(doc_id)
+    if current is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    updated = {}
+    for key, value in values.items():
+        merged = {**current, **updated, key: value}
+        if workflow_agent.field_confidence(key, value, merged) > workflow_agent.field_confidence(key, current.get(key), current):
+            updated[key] = value
+    full = current.get("extraction") or {}
+    cost = {key: report.get(key) for key in ("prompt_tokens", "completion_tokens", "latency_s", "bytes_sent")}
+    extraction = _extraction_record({**current, **updated}, full)
+    extraction["extracted_at"] = full.get("extracted_at", extraction["extracted_at"])
+    extraction["reextractions"] = (full.get("reextractions") or [])[-19:] + [{
+        "at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "fields": requested,
+        "pages": page_list,
+        "updated": sorted(updated),
+        **cost,
+    }]
+    data = await asyncio.to_thread(STORE.patch, doc_id, {**updated, "extraction": extraction})
+    if data is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    _attach_provider_file(doc_id, pdf_content)
+    
+    return {
+        "status": "success",
+        "message": f"Re-extracted {len(requested)} field(s), updated {len(updated)}",
+        "fields": requested,
+        "pages": page_list,
+        "updated": updated,
+        "low_confidence": extraction["low_confidence"],
+        "report": {"targeted": cost, "full_extraction": {key: full.get(key) for key in cost}, "saved": _savings(cost, full)},
+        "data": data,
+    }
 
 @app.patch("/documents/{doc_id}/human-prediction")
 async def update_human_prediction(doc_id: str, update: HumanPredictionUpdate) -> Dict[str, Any]:
@@ -570,25 +1296,18 @@ async def update_human_prediction(doc_id: str, update: HumanPredictionUpdate) ->
     Allows humans to accept or reject regardless of AI prediction.
     Set to null to clear the human override.
     """
-    data_file = DATA_DIR / f"{doc_id}.json"
-    
-    if not data_file.exists():
-        raise HTTPException(status_code=404, detail="Document not found")
-    
     # Validate prediction value (allow null to clear)
     if update.human_prediction is not None and update.human_prediction not in ["Accepted", "Rejected"]:
         raise HTTPException(status_code=400, detail="human_prediction must be 'Accepted', 'Rejected', or null")
     
-    # Load existing data
-    with open(data_file) as f:
-        data = json.load(f)
-    
     # Update human prediction
-    data["human_prediction"] = update.human_prediction
+    data = await asyncio.to_thread(STORE.patch, doc_id, {
+        "human_prediction": update.human_prediction,
+        "reviewed_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+    })
     
-    # Save updated data
-    with open(data_file, "w") as f:
-        json.dump(data, f, indent=2)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Document not found")
     
     message = f"Human prediction updated to {update.human_prediction}" if update.human_prediction else "Human override cleared"
     
@@ -599,6 +1318,63 @@ async def update_human_prediction(doc_id: str, update: HumanPredictionUpdate) ->
         "data": data
     }
 
+@app.get("/documents/{doc_id}/history")
+def get_document_history(doc_id: str) -> Dict[str, Any]:
+    """
+    Edit history of a document: every logged change with its changed fields ({field: [old, new]}).
+    Kept after the document is deleted.
+    """
+    history = STORE.history(doc_id)
+    if not history and doc_id not in STORE:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return {"id": doc_id, "count": len(history), "history": history}
+
+@app.post("/store/compact")
+def compact_store() -> Dict[str, Any]:
+    """
+    Write pending changes to the per-document files and retire the compacted log segments.
+    Also runs automatically in the background as the log grows.
+    """
+    report = STORE.compact()
+    return {**report, "store": STORE.stats()}
+
+
+@app.post("/pdfs/compact")
+def compact_pdfs(older_than_days: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Move PDFs into the packs now (by default those the background compactor
+    would move; with `older_than_days`, every document's PDF at least that old)
+    and rewrite packs that are mostly deleted PDFs.
+    """
+    if older_than_days is None:
+        select = _pdf_is_cold
+    else:
+        select = lambda doc_id, age_s: doc_id in STORE and age_s >= older_than_days * 86400
+    report = PDF_STORE.compact(select)
+    return {**report, "repack": PDF_STORE.repack(), "pdfs": PDF_STORE.stats()}
+
+@app.get("/events/{job_id}")
+async def stream_events(job_id: str, request: Request, last_event_id: Optional[int] = None) -> StreamingResponse:
+    """
+    Server-Sent Events for an upload or analysis job: received, converted, extracting,
+    partial, extracted, scoring, scored, then done (with the result) or error.
+    Resumes after the Last-Event-ID header (sent by EventSource on reconnect) or ?last_event_id=.
+    """
+    if not progress.JOB_ID_PATTERN.match(job_id):
+        raise HTTPException(status_code=400, detail="Invalid job id")
+    if PROGRESS.subscribers >= progress.MAX_SUBSCRIBERS:
+        raise HTTPException(status_code=503, detail="Too many event subscribers", headers={"Retry-After": "5"})
+    if last_event_id is None:
+        try:
+            last_event_id = int(request.headers.get("last-event-id", 0))
+        except ValueError:
+            last_event_id = 0
+    return StreamingResponse(
+        PROGRESS.subscribe(job_id, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -611,23 +1387,20 @@ except Exception as _e:
     print("Model artifacts load failed:", _e)
 
 
-def _build_input_dataframe(payload: Dict[str, Any]) -> pd.DataFrame:
-    """Construct a single-row DataFrame with the columns expected by the preprocessor."""
-    if not FEATURE_META:
-        raise HTTPException(status_code=500, detail="Feature metadata not loaded")
-    categorical_cols: List[str] = FEATURE_META.get("categorical_cols", [])
-    numeric_cols: List[str] = FEATURE_META.get("numeric_cols", [])
+def _save_drift_state() -> None:
+    if DRIFT is not None:
+        DRIFT.save()
 
-    row: Dict[str, Any] = {}
-    # Fill categorical with provided values (strings/bools), else None
-    for col in categorical_cols:
-        row[col] = payload.get(col, None)
-    # Fill numeric with provided values, else np.nan
-    for col in numeric_cols:
-        val = payload.get(col, None)
-        row[col] = np.nan if val is None else val
 
-    return pd.DataFrame([row], columns=categorical_cols + numeric_cols)
+# Drift counters are also saved every few seconds while rows are scored
+atexit.register(_save_drift_state)
+
+
+def _build_input_frame(payloads: List[Dict[str, Any]]) -> pd.DataFrame:
+    """Construct a DataFrame (one row per payload) with the columns expected by the preprocessor."""
+    if not FEATURE_META:
+        raise HTTPException(status_code=500, detail="Feature metadata not loaded")
+    return model_artifacts.build_input_frame(FEATURE_META, payloads)
 
 
 def _group_shap_contributions(contrib: np.ndarray) -> Dict[str, Any]:
@@ -665,22 +1438,41 @@ def _group_shap_contributions(contrib: np.ndarray) -> Dict[str, Any]:
     return {"grouped_impacts": grouped_list, "top_features": top_features}
 
 
-@app.post("/predict", response_model=PredictResponse)
-def predict(req: PredictRequest) -> PredictResponse:
-    # Lazy-load once if not yet loaded (e.g., server started before artifacts were written)
-    global PREPROCESSOR, LABEL_ENCODER, BOOSTER, FEATURE_META
+def _require_model() -> None:
+    """Lazy-load once if not yet loaded (e.g., server started before artifacts were written)."""
     if PREPROCESSOR is None or LABEL_ENCODER is None or BOOSTER is None or not FEATURE_META:
         load_model_artifacts()
     if PREPROCESSOR is None or LABEL_ENCODER is None or BOOSTER is None or not FEATURE_META:
         raise HTTPException(status_code=503, detail="Model not available")
 
-    # Build input DataFrame and transform
-    df = _build_input_dataframe(req.model_dump())
+
+def _model_version() -> str:
+    return MANIFEST.get("created_at") or "unversioned"
+
+
+def _class_names() -> List[str]:
+    class_names: List[str] = FEATURE_META.get("class_names") or list(getattr(LABEL_ENCODER, "classes_", []))
+    if not class_names:
+        raise HTTPException(status_code=500, detail="Class names not available")
+    return class_names
+
+
+def _encode(payloads: List[Dict[str, Any]]) -> np.ndarray:
+    """Encoded model rows, by the compiled encoder if it matched the preprocessor at load."""
+    if ROW_ENCODER is not None:
+        return ROW_ENCODER.encode(payloads)
+    return PREPROCESSOR.transform(_build_input_frame(payloads))
+
+
+def _transform(payload: Dict[str, Any]) -> np.ndarray:
     try:
-        X_t = PREPROCESSOR.transform(df)
+        return _encode([payload])
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Preprocessing failed: {e}")
 
+
+def _prediction(X_t: np.ndarray, include_explanation: bool) -> Dict[str, Any]:
+    """Decision, class probabilities and (optionally) SHAP explanation of one encoded row."""
     # Predict probabilities
     dm = xgb.DMatrix(X_t)
     probs = BOOSTER.predict(dm)
@@ -688,9 +1480,7 @@ def predict(req: PredictRequest) -> PredictResponse:
         probs = probs.reshape(1, -1)
 
     # Map to class names
-    class_names: List[str] = FEATURE_META.get("class_names") or list(getattr(LABEL_ENCODER, "classes_", []))
-    if not class_names:
-        raise HTTPException(status_code=500, detail="Class names not available")
+    class_names = _class_names()
 
     prob_map = {class_names[i]: float(probs[0, i]) for i in range(len(class_names))}
     pred_idx = int(np.argmax(probs[0]))
@@ -698,9 +1488,10 @@ def predict(req: PredictRequest) -> PredictResponse:
     score = float(probs[0, pred_idx])
 
     explanation = None
-    if req.include_explanation and EXPLAINER is not None:
+    if include_explanation and EXPLAINER is not None:
         try:
-            shap_values = EXPLAINER(X_t)
+            with _EXPLAINER_LOCK:
+                shap_values = EXPLAINER(X_t)
             # Handle various SHAP output shapes
             values = getattr(shap_values, "values", shap_values)
             # base values
@@ -729,16 +1520,654 @@ def predict(req: PredictRequest) -> PredictResponse:
             explanation = {
                 "target_class": decision,
                 "base_value": base_value,
+                "background": EXPLAINER_BACKGROUND,
                 **groups,
             }
         except Exception as e:
             # Provide graceful degradation if SHAP fails
             explanation = {"error": f"SHAP explanation failed: {e}"}
 
-    return PredictResponse(
-        decision=decision,
-        probabilities=prob_map,
-        score=score,
-        model_version=MANIFEST.get("created_at"),
-        explanation=explanation,
+    return {
+        "decision": decision,
+        "probabilities": prob_map,
+        "score": score,
+        "model_version": MANIFEST.get("created_at"),
+        "explanation": explanation,
+    }
+
+
+@app.post("/predict", response_model=PredictResponse)
+async def predict(req: PredictRequest) -> PredictResponse:
+    _require_model()
+
+    # Build input DataFrame and transform
+    payload = req.model_dump()
+    # Already validated: hash the request as it is
+    stored = _stored_prediction(_applicant_hash(payload)) if req.include_explanation else None
+    if stored is not None:
+        # The stored document's inputs were observed when it was scored
+        return PredictResponse(**stored)
+    X_t = await asyncio.to_thread(_transform, payload)
+    if DRIFT is not None:
+        DRIFT.observe(payload)
+
+    if req.include_explanation and EXPLAINER is not None:
+        # Under pressure, answer with the decision alone instead of queueing for SHAP
+        try:
+            async with EXPLAIN_LIMIT.enter():
+                return PredictResponse(**await asyncio.to_thread(_prediction, X_t, True))
+        except admission.Overloaded:
+            EXPLAIN_LIMIT.counters["degraded"] += 1
+            return PredictResponse(**await asyncio.to_thread(_prediction, X_t, False), degraded=True)
+    return PredictResponse(**await asyncio.to_thread(_prediction, X_t, req.include_explanation))
+
+
+# Explanations are computed when a document is analyzed and stored with it as
+# {"model_version", "input_hash", "background", "computed_at", "prediction"},
+# "prediction" being the /predict response. A stored copy is served while the
+# model, the explainer background and the document's model inputs are unchanged.
+
+
+def _model_inputs(data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """A document's or request's model inputs, normalized as /predict sees them (None if invalid)."""
+    return _validate_model_inputs(data)
+
+
+def _input_hash(data: Dict[str, Any]) -> Optional[str]:
+    payload = _model_inputs(data)
+    return _applicant_hash(payload) if payload is not None else None
+
+
+def _explanation_fresh(record: Optional[Dict[str, Any]], input_hash: Optional[str]) -> bool:
+    return (
+        isinstance(record, dict)
+        and input_hash is not None
+        and record.get("input_hash") == input_hash
+        and record.get("model_version") == _model_version()
+        and record.get("background") == EXPLAINER_BACKGROUND
     )
+
+
+def _stored_prediction(input_hash: str) -> Optional[Dict[str, Any]]:
+    """The stored /predict response of any document with these inputs (by input hash), if still fresh."""
+    doc_id = _EXPLANATION_INDEX.get(input_hash)
+    doc = STORE.get(doc_id) if doc_id else None
+    record = (doc or {}).get("explanation")
+    return record["prediction"] if _explanation_fresh(record, input_hash) else None
+
+
+def _explain_document(doc: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Full prediction and explanation of a document, as stored with it (None without explainer)."""
+    payload = _model_inputs(doc)
+    if EXPLAINER is None or payload is None:
+        return None
+    prediction = _prediction(_transform(payload), include_explanation=True)
+    if "error" in (prediction["explanation"] or {}):
+        return None
+    return {
+        "model_version": _model_version(),
+        "input_hash": _applicant_hash(payload),
+        "background": EXPLAINER_BACKGROUND,
+        "computed_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "prediction": prediction,
+    }
+
+
+def _precompute_explanations(doc_ids: List[str]) -> int:
+    """Store explanations for documents whose stored copy is missing or stale; returns how many were computed."""
+    computed = 0
+    for doc_id in doc_ids:
+        doc = STORE.get(doc_id)
+        if doc is None or _explanation_fresh(doc.get("explanation"), _input_hash(doc)):
+            continue
+        try:
+            record = _explain_document(doc)
+        except HTTPException as e:
+            print(f"Explanation of {doc_id} failed: {e.detail}")
+            continue
+        if record is not None:
+            STORE.patch(doc_id, {"explanation": record})
+            computed += 1
+    return computed
+
+
+# Documents waiting for an explanation after bulk scoring, worked off one at a time
+_EXPLAIN_QUEUE: "OrderedDict[str, None]" = OrderedDict()
+_EXPLAIN_WORKER: Optional[asyncio.Task] = None
+
+
+def _queue_explanations(doc_ids: List[str]) -> None:
+    global _EXPLAIN_WORKER
+    if EXPLAINER is None:
+        return
+    _EXPLAIN_QUEUE.update(dict.fromkeys(doc_ids))
+    if _EXPLAIN_WORKER is None or _EXPLAIN_WORKER.done():
+        _EXPLAIN_WORKER = _spawn(_explain_queued())
+
+
+async def _explain_queued() -> None:
+    while _EXPLAIN_QUEUE:
+        # Only use the explainer while no interactive request wants it
+        await EXPLAIN_LIMIT.acquire_idle()
+        doc_id, _ = _EXPLAIN_QUEUE.popitem(last=False)
+        started = time.monotonic()
+        try:
+            await asyncio.to_thread(_precompute_explanations, [doc_id])
+        except Exception as e:
+            print(f"Explanation of {doc_id} failed: {e}")
+        finally:
+            EXPLAIN_LIMIT.release(time.monotonic() - started)
+
+
+@app.get("/documents/{doc_id}/explanation")
+async def get_document_explanation(doc_id: str) -> FastJSONResponse:
+    """
+    Prediction and SHAP explanation of a stored document: the copy computed at
+    analysis time, or recomputed (and stored) if the document's inputs, the
+    model or the explainer background changed since.
+    """
+    doc = STORE.get(doc_id)
+    if doc is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    record = doc.get("explanation")
+    cached = _explanation_fresh(record, _input_hash(doc))
+    if not cached:
+        _require_model()
+        if EXPLAINER is None:
+            raise HTTPException(status_code=503, detail="Explainer not available")
+        try:
+            async with EXPLAIN_LIMIT.enter():
+                record = await asyncio.to_thread(_explain_document, doc)
+        except admission.Overloaded as e:
+            raise _overloaded(e)
+        if record is None:
+            raise HTTPException(status_code=422, detail="Document inputs cannot be explained")
+        await asyncio.to_thread(STORE.patch, doc_id, {"explanation": record})
+    return FastJSONResponse({**record["prediction"], "cached": cached, "computed_at": record["computed_at"]})
+
+
+# Partial-dependence curves per model version: {version: {feature: curve}}
+_PDP_CACHE: Dict[str, Dict[str, Any]] = {}
+
+
+def _pdp_cache_file(version: str) -> Path:
+    safe = "".join(ch if ch.isalnum() else "_" for ch in version)
+    return CACHE_DIR / f"partial_dependence_{safe}.json"
+
+
+def _partial_dependence_curves() -> Dict[str, Any]:
+    """All curves for the loaded model: memory, then disk, then one batched scoring per feature."""
+    _require_model()
+    if SHAP_BG is None:
+        raise HTTPException(status_code=503, detail="Background sample not available")
+    version = _model_version()
+    if version in _PDP_CACHE:
+        return _PDP_CACHE[version]
+
+    cache_file = _pdp_cache_file(version)
+    curves = model_artifacts.load_json(cache_file) if cache_file.exists() else {}
+    if not curves:
+        curves = partial_dependence.compute_all_curves(
+            BOOSTER, SHAP_BG, FEATURE_META, PREPROCESSOR, _class_names()
+        )
+        CACHE_DIR.mkdir(exist_ok=True)
+        tmp = cache_file.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump(curves, f)
+        tmp.replace(cache_file)
+    _PDP_CACHE.clear()
+    _PDP_CACHE[version] = curves
+    return curves
+
+
+@app.get("/partial-dependence")
+def get_partial_dependence() -> FastJSONResponse:
+    """
+    Partial-dependence and ICE curves of the deployed model for every feature.
+    Computed once per model version and served from cache afterwards.
+    """
+    curves = _partial_dependence_curves()
+    return FastJSONResponse({
+        "model_version": _model_version(),
+        "class_names": _class_names(),
+        "features": curves,
+    })
+
+
+@app.get("/partial-dependence/{feature}")
+def get_feature_partial_dependence(feature: str) -> Dict[str, Any]:
+    """
+    Partial-dependence and ICE curves for a single feature.
+    """
+    curves = _partial_dependence_curves()
+    if feature not in curves:
+        raise HTTPException(status_code=404, detail=f"Unknown feature: {feature}")
+    return {
+        "model_version": _model_version(),
+        "class_names": _class_names(),
+        "feature": feature,
+        **curves[feature],
+    }
+
+
+# Per-applicant what-if curves, keyed by (applicant hash, model version)
+_WHAT_IF_CACHE: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+_WHAT_IF_CACHE_SIZE = 512
+
+
+def _applicant_hash(payload: Dict[str, Any]) -> str:
+    """Stable hash of the model-relevant applicant fields."""
+    cols = FEATURE_META.get("categorical_cols", []) + FEATURE_META.get("numeric_cols", [])
+    canonical = json.dumps({c: payload.get(c) for c in cols}, sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+@app.post("/what-if")
+def what_if(req: WhatIfRequest) -> Dict[str, Any]:
+    """
+    Per-feature probability curves for one applicant: how all class probabilities
+    change as each requested feature varies, everything else held fixed.
+    The whole perturbation grid is scored in a single prediction.
+    """
+    _require_model()
+    if SHAP_BG is None:
+        raise HTTPException(status_code=503, detail="Background sample not available")
+
+    payload = req.applicant.model_dump()
+    key = (_applicant_hash(payload), tuple(req.features), _model_version())
+    if key in _WHAT_IF_CACHE:
+        _WHAT_IF_CACHE.move_to_end(key)
+        return _WHAT_IF_CACHE[key]
+
+    columns = partial_dependence.feature_columns(FEATURE_META, PREPROCESSOR)
+    unknown = [f for f in req.features if f not in columns]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown features: {unknown}")
+
+    base_row = _transform(payload)
+
+    result = {
+        "model_version": _model_version(),
+        "class_names": _class_names(),
+        "features": partial_dependence.applicant_curves(
+            BOOSTER, base_row, SHAP_BG, columns, req.features, _class_names()
+        ),
+    }
+    _WHAT_IF_CACHE[key] = result
+    if len(_WHAT_IF_CACHE) > _WHAT_IF_CACHE_SIZE:
+        _WHAT_IF_CACHE.popitem(last=False)
+    return result
+
+
+@app.post("/counterfactual")
+def find_counterfactuals(req: CounterfactualRequest) -> Dict[str, Any]:
+    """
+    Smallest sets of changes to the applicant's mutable fields that make the
+    model predict the target class (e.g. "accept"), within a time budget.
+    """
+    _require_model()
+    if SHAP_BG is None:
+        raise HTTPException(status_code=503, detail="Background sample not available")
+    class_names = _class_names()
+    if req.target not in class_names:
+        raise HTTPException(status_code=400, detail=f"target must be one of {class_names}")
+    if not 1 <= req.max_changes <= 5 or not 1 <= req.max_results <= 20:
+        raise HTTPException(status_code=400, detail="max_changes must be 1-5 and max_results 1-20")
+
+    columns = partial_dependence.feature_columns(FEATURE_META, PREPROCESSOR)
+    unknown = sorted(set(req.immutable or ()) - set(columns) - counterfactual.IMMUTABLE_FEATURES)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown immutable features: {', '.join(unknown)}")
+
+    base_row = _transform(req.applicant.model_dump())
+
+    probs = BOOSTER.predict(xgb.DMatrix(base_row)).reshape(1, -1)[0]
+    current = {
+        "decision": class_names[int(np.argmax(probs))],
+        "probabilities": {c: float(probs[i]) for i, c in enumerate(class_names)},
+    }
+    if current["decision"] == req.target:
+        return {"model_version": _model_version(), "current": current, "target": req.target,
+                "counterfactuals": [], "stats": {"evaluated": 0, "elapsed_ms": 0.0, "timed_out": False}}
+
+    result = counterfactual.search(
+        BOOSTER,
+        base_row[0],
+        SHAP_BG,
+        columns,
+        class_names,
+        req.target,
+        immutable=set(req.immutable or ()),
+        max_changes=req.max_changes,
+        max_results=req.max_results,
+        time_budget_s=min(req.time_budget_ms, 5000) / 1000,
+    )
+    return {"model_version": _model_version(), "current": current, **result}
+
+# ----- Analytics -----
+# Counters are maintained incrementally by the store's change listener
+# (_document_changed), so these endpoints never scan the document store.
+
+@app.get("/analytics")
+def get_analytics() -> Dict[str, Any]:
+    """Decision mix, model/human agreement and throughput in one response."""
+    return {
+        "decision_mix": ANALYTICS.decision_mix(),
+        "agreement": ANALYTICS.agreement(),
+        "throughput": ANALYTICS.throughput(),
+    }
+
+
+@app.get("/analytics/decision-mix")
+def get_decision_mix() -> Dict[str, Any]:
+    """Counts of final (human over model), model and human decisions."""
+    return ANALYTICS.decision_mix()
+
+
+@app.get("/analytics/agreement")
+def get_agreement() -> Dict[str, Any]:
+    """How often reviewers agree with or override the model."""
+    return ANALYTICS.agreement()
+
+
+@app.get("/analytics/features")
+def get_feature_distributions(feature: Optional[str] = None) -> Dict[str, Any]:
+    """Bucketed feature distributions per final decision."""
+    known = list(analytics.NUMERIC_BINS) + analytics.CATEGORICAL_FEATURES
+    if feature is not None and feature not in known:
+        raise HTTPException(status_code=404, detail=f"Unknown feature '{feature}'")
+    return ANALYTICS.feature_distributions(feature)
+
+
+@app.get("/analytics/throughput")
+def get_throughput() -> Dict[str, Any]:
+    """Documents uploaded, analyzed and reviewed per day."""
+    return ANALYTICS.throughput()
+
+
+@app.post("/analytics/rebuild")
+def rebuild_analytics() -> Dict[str, Any]:
+    """Recompute all counters from the stored documents and report any drift."""
+    t0 = time.perf_counter()
+    report = ANALYTICS.rebuild(_iter_documents())
+    report["elapsed_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+    return report
+
+
+# ----- Search -----
+
+def _parse_search_params(filters: List[str], ranges: List[str]):
+    parsed_filters: Dict[str, str] = {}
+    for f in filters:
+        field, sep, value = f.partition(":")
+        if not sep or field not in search_index.CATEGORICAL_FIELDS:
+            raise HTTPException(status_code=400, detail=f"Invalid filter '{f}' (expected field:value)")
+        parsed_filters[field] = value
+
+    parsed_ranges: Dict[str, tuple] = {}
+    for r in ranges:
+        parts = r.split(":")
+        if len(parts) != 3 or parts[0] not in search_index.NUMERIC_FIELDS:
+            raise HTTPException(status_code=400, detail=f"Invalid range '{r}' (expected field:min:max)")
+        try:
+            lo = float(parts[1]) if parts[1] else None
+            hi = float(parts[2]) if parts[2] else None
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid range bounds in '{r}'")
+        parsed_ranges[parts[0]] = (lo, hi)
+    return parsed_filters, parsed_ranges
+
+
+@app.get("/search")
+def search_documents(
+    q: Optional[str] = None,
+    filters: List[str] = Query(default=[], alias="filter"),
+    ranges: List[str] = Query(default=[], alias="range"),
+    limit: int = 50,
+    offset: int = 0,
+) -> FastJSONResponse:
+    """
+    Search documents by name, filename and extracted fields.
+
+    `q` matches words of the name/filename and categorical values; its last
+    word is a prefix (type-ahead). `filter=smoking:true` matches a categorical
+    field exactly and `range=age:30:50` (either bound may be empty) a numeric
+    one. All conditions must hold; results are newest first.
+    """
+    if not 1 <= limit <= 500 or offset < 0:
+        raise HTTPException(status_code=400, detail="limit must be 1-500 and offset >= 0")
+    parsed_filters, parsed_ranges = _parse_search_params(filters, ranges)
+
+    t0 = time.perf_counter()
+    result = SEARCH_INDEX.search(q, parsed_filters, parsed_ranges, limit=limit, offset=offset)
+    result["elapsed_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+    return FastJSONResponse(result)
+
+
+@app.get("/search/suggest")
+def suggest_terms(prefix: str, limit: int = 10) -> Dict[str, Any]:
+    """Indexed terms starting with `prefix`, most frequent first."""
+    if not prefix:
+        raise HTTPException(status_code=400, detail="prefix must not be empty")
+    return {"prefix": prefix, "suggestions": SEARCH_INDEX.suggest(prefix, limit=min(limit, 50))}
+
+
+# ----- Bulk export / import (NDJSON) -----
+
+IMPORT_BATCH_SIZE = 500
+# Per-row errors returned by an import are capped; the count is always exact
+MAX_REPORTED_ERRORS = 1000
+# Longer import rows are rejected without being buffered (a document is a few KB)
+MAX_IMPORT_LINE_BYTES = 1024 * 1024
+_DOC_ID_CHARS = set("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-_")
+
+
+@app.get("/export")
+def export_documents(
+    q: Optional[str] = None,
+    filters: List[str] = Query(default=[], alias="filter"),
+    ranges: List[str] = Query(default=[], alias="range"),
+) -> StreamingResponse:
+    """
+    Stream all documents, or those matching the /search conditions, as NDJSON.
+    Documents are read one at a time, so memory does not grow with the archive.
+    """
+    parsed_filters, parsed_ranges = _parse_search_params(filters, ranges)
+    if q or parsed_filters or parsed_ranges:
+        doc_ids = SEARCH_INDEX.matching_ids(q, parsed_filters, parsed_ranges)
+        documents = (doc for doc in map(_read_document, doc_ids) if doc is not None)
+    else:
+        documents = _iter_documents()
+
+    def lines():
+        chunk: List[bytes] = []
+        for doc in documents:
+            chunk.append(serialization.dumps(doc))
+            if len(chunk) == 256:
+                yield b"\n".join(chunk) + b"\n"
+                chunk = []
+        if chunk:
+            yield b"\n".join(chunk) + b"\n"
+
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="documents.ndjson"'},
+    )
+
+
+def _decision_to_prediction(decision: str) -> Optional[str]:
+    """Map a model class to the Accepted/Rejected labels the UI shows (None = undecided)."""
+    if decision.startswith("accept"):
+        return "Accepted"
+    if decision == "reject":
+        return "Rejected"
+    return None
+
+
+def _score_documents(docs: List[Dict[str, Any]]) -> None:
+    """Set model_prediction on a batch of documents with one prediction call."""
+    X_t = _encode(docs)
+    if DRIFT is not None:
+        DRIFT.observe_many(docs)
+    probs = BOOSTER.predict(xgb.DMatrix(X_t))
+    if probs.ndim == 1:
+        probs = probs.reshape(len(docs), -1)
+    class_names = _class_names()
+    analyzed_at = time.strftime("%Y-%m-%d %H:%M:%S")
+    for doc, p in zip(docs, probs):
+        doc["model_prediction"] = _decision_to_prediction(class_names[int(np.argmax(p))])
+        doc["analyzed_at"] = analyzed_at
+
+
+def _validate_import_row(line: bytes) -> Dict[str, Any]:
+    raw = serialization.loads(line)
+    if not isinstance(raw, dict):
+        raise ValueError("row is not a JSON object")
+    raw.setdefault("id", str(uuid.uuid4()))
+    if not raw["id"] or not set(str(raw["id"])) <= _DOC_ID_CHARS:
+        raise ValueError("id may only contain letters, digits, '-' and '_'")
+    doc = DocumentData.model_validate(raw).model_dump()
+    # Keep fields outside the schema (e.g. analyzed_at) as they were exported
+    doc = {**raw, **doc}
+    if not doc.get("uploaded_at"):
+        doc["uploaded_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
+    return doc
+
+
+@app.post("/import")
+async def import_documents(request: Request, score: bool = False, batch_size: int = IMPORT_BATCH_SIZE) -> Dict[str, Any]:
+    """
+    Bulk-load documents from an NDJSON request body (one DocumentData per line).
+
+    The body is read as a stream and processed in batches of `batch_size`
+    rows. Invalid rows are skipped and reported with their line number; every
+    batch of valid rows is committed all-or-nothing. With `score=true` each
+    batch is scored by the model in one call before it is committed.
+    """
+    if not 1 <= batch_size <= 10_000:
+        raise HTTPException(status_code=400, detail="batch_size must be 1-10000")
+    if score:
+        _require_model()
+
+    t0 = time.perf_counter()
+    stats = {"rows": 0, "imported": 0, "failed": 0, "batches": 0}
+    errors: List[Dict[str, Any]] = []
+    batch: Dict[str, Dict[str, Any]] = {}  # id -> doc; a later row with the same id wins
+
+    def fail(line_no: int, error: str) -> None:
+        stats["failed"] += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({"line": line_no, "error": error})
+
+    async def flush() -> None:
+        docs = list(batch.values())
+        batch.clear()
+        if not docs:
+            return
+        try:
+            if score:
+                await asyncio.to_thread(_score_documents, docs)
+            await asyncio.to_thread(_commit_documents, docs)
+            if score:
+                _queue_explanations([doc["id"] for doc in docs])
+        except Exception as e:
+            print(f"Import batch failed: {e}")
+            stats["failed"] += len(docs)
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append({"batch": stats["batches"] + 1, "error": f"batch not committed: {e}"})
+            return
+        stats["imported"] += len(docs)
+        stats["batches"] += 1
+
+    async def handle(line: bytes) -> None:
+        if not line.strip():
+            return
+        stats["rows"] += 1
+        try:
+            doc = _validate_import_row(line)
+        except ValidationError as e:
+            fail(line_no, "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()))
+            return
+        except ValueError as e:  # includes json.JSONDecodeError
+            fail(line_no, str(e))
+            return
+        batch[doc["id"]] = doc
+        if len(batch) >= batch_size:
+            await flush()
+
+    line_no = 0
+    buffer = bytearray()
+    skipping = False  # rest of a row already rejected as too long
+    async for chunk in request.stream():
+        # Only the new bytes are searched for line ends
+        start = 0
+        while True:
+            end = chunk.find(b"\n", start)
+            if not skipping:
+                buffer += chunk[start:] if end < 0 else chunk[start:end]
+                if len(buffer) > MAX_IMPORT_LINE_BYTES:
+                    line_no += 1
+                    stats["rows"] += 1
+                    fail(line_no, f"row longer than {MAX_IMPORT_LINE_BYTES} bytes")
+                    buffer.clear()
+                    skipping = True
+            if end < 0:
+                break
+            if skipping:
+                skipping = False
+            else:
+                line_no += 1
+                await handle(bytes(buffer))
+                buffer.clear()
+            start = end + 1
+    if buffer:
+        line_no += 1
+        await handle(bytes(buffer))
+    await flush()
+
+    elapsed = time.perf_counter() - t0
+    return {
+        **stats,
+        "elapsed_s": round(elapsed, 3),
+        "rows_per_s": round(stats["rows"] / elapsed, 1) if elapsed > 0 else None,
+        "errors": errors,
+    }
+
+
+# ----- Drift -----
+
+@app.get("/drift")
+def get_drift(feature: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Drift of the inputs scored by /predict and /import?score=true against the training distribution:
+    PSI per feature (and KS for numeric ones), most drifted first. ?feature= adds the per-bin breakdown.
+    """
+    if DRIFT is None:
+        raise HTTPException(status_code=503, detail="No drift reference available")
+    if feature is not None and feature not in DRIFT.numeric_counts and feature not in DRIFT.categorical_counts:
+        raise HTTPException(status_code=404, detail=f"Unknown feature: {feature}")
+    return {"model_version": _model_version(), **DRIFT.report(feature)}
+
+
+@app.post("/drift/reset")
+def reset_drift() -> Dict[str, Any]:
+    """Start a new observation window (e.g. after a known change in the applicant mix)."""
+    if DRIFT is None:
+        raise HTTPException(status_code=503, detail="No drift reference available")
+    DRIFT.reset()
+    return {"status": "success", "since": DRIFT.since}
+
+
+@app.get("/metrics")
+def get_metrics() -> Dict[str, Any]:
+    """Admission state per limited route (in flight, queued, admitted/rejected/degraded counts), queue sizes and extraction transfer totals."""
+    return {
+        "admission": {name: limiter.stats() for name, limiter in ADMISSION.items()},
+        "extraction_transfer": PDF_FILES.stats() if PDF_FILES is not None else None,
+        "explanations_queued": len(_EXPLAIN_QUEUE),
+        "jobs": PROGRESS.stats(),
+        "store": STORE.stats(),
+        "pdfs": PDF_STORE.stats(),
+    }
+
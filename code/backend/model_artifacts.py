@@ -0,0 +1,122 @@
+"""
+Loading and input encoding for the serving artifacts in data/model/.
+
+Shared by the API (main.py) and offline tools such as
+datageneration/score_portfolio.py, so both read the same files and build
+model inputs the same way.
+"""
+import json
+from pathlib import Path
+from typing import Any, Dict, List
+
+import joblib
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+PREPROCESSOR_FILE = "preprocessor.joblib"
+LABEL_ENCODER_FILE = "label_encoder.joblib"
+MODEL_FILE = "xgboost_model.json"
+FEATURE_NAMES_FILE = "feature_names.json"
+SHAP_BACKGROUND_FILE = "shap_background.npy"
+MANIFEST_FILE = "manifest.json"
+DRIFT_REFERENCE_FILE = "drift_reference.json"
+
+
+def load_json(p: Path) -> Dict[str, Any]:
+    try:
+        with open(p, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+
+def previous_model_dir(model_dir: Path, stamp: str) -> Path:
+    """Where a training run moves the current model while it swaps in a new one."""
+    return model_dir.parent / f".{model_dir.name}.previous-{stamp}"
+
+
+def previous_model_dirs(model_dir: Path) -> List[Path]:
+    """Models moved aside by training runs (see previous_model_dir), newest first."""
+    return sorted(model_dir.parent.glob(f".{model_dir.name}.previous-*"), reverse=True)
+
+
+def load_artifacts(model_dir: Path) -> Dict[str, Any]:
+    """Load whichever artifacts exist in `model_dir`.
+
+    Returns a dict with some of the keys preprocessor, label_encoder, booster,
+    feature_meta, shap_background, manifest and drift_reference; missing files
+    are left out. Without `model_dir`, the model a training run moved aside
+    is loaded (the run stopped between moving it and renaming the new one in).
+    """
+    model_dir = Path(model_dir)
+    out: Dict[str, Any] = {}
+    if not model_dir.exists():
+        previous = previous_model_dirs(model_dir)
+        if not previous:
+            print("Model directory not found:", model_dir)
+            return out
+        print(f"Model directory not found: {model_dir}; loading the previous model from {previous[0].name}")
+        model_dir = previous[0]
+
+    if (model_dir / PREPROCESSOR_FILE).exists():
+        out["preprocessor"] = joblib.load(model_dir / PREPROCESSOR_FILE)
+        print("Loaded preprocessor")
+    if (model_dir / LABEL_ENCODER_FILE).exists():
+        out["label_encoder"] = joblib.load(model_dir / LABEL_ENCODER_FILE)
+        print("Loaded label encoder")
+    if (model_dir / MODEL_FILE).exists():
+        booster = xgb.Booster()
+        booster.load_model(str(model_dir / MODEL_FILE))
+        out["booster"] = booster
+        print("Loaded XGBoost booster")
+    if (model_dir / FEATURE_NAMES_FILE).exists():
+        out["feature_meta"] = load_json(model_dir / FEATURE_NAMES_FILE)
+        print("Loaded feature metadata")
+    if (model_dir / SHAP_BACKGROUND_FILE).exists():
+        try:
+            out["shap_background"] = np.load(model_dir / SHAP_BACKGROUND_FILE)
+            print("Loaded SHAP background", out["shap_background"].shape)
+        except Exception as e:
+            print("Failed to load SHAP background:", e)
+    if (model_dir / MANIFEST_FILE).exists():
+        out["manifest"] = load_json(model_dir / MANIFEST_FILE)
+        print("Loaded manifest")
+    if (model_dir / DRIFT_REFERENCE_FILE).exists():
+        out["drift_reference"] = load_json(model_dir / DRIFT_REFERENCE_FILE)
+        print("Loaded drift reference profile")
+    return out
+
+
+def build_input_frame(feature_meta: Dict[str, Any], payloads: List[Dict[str, Any]]) -> pd.DataFrame:
+    """Construct a DataFrame (one row per payload) with the columns expected by the preprocessor."""
+    categorical_cols: List[str] = feature_meta.get("categorical_cols", [])
+    numeric_cols: List[str] = feature_meta.get("numeric_cols", [])
+
+    rows: List[Dict[str, Any]] = []
+    for payload in payloads:
+        row: Dict[str, Any] = {}
+        # Fill categorical with provided values (strings/bools), else None
+        for col in categorical_cols:
+            row[col] = payload.get(col, None)
+        # Fill numeric with provided values, else np.nan
+        for col in numeric_cols:
+            val = payload.get(col, None)
+            row[col] = np.nan if val is None else val
+        rows.append(row)
+
+    return pd.DataFrame(rows, columns=categorical_cols + numeric_cols)
+
+
+def select_input_columns(feature_meta: Dict[str, Any], df: pd.DataFrame) -> pd.DataFrame:
+    """The preprocessor's input columns from an already tabular dataset (e.g. generator output).
+
+    Same result as build_input_frame on the rows' dicts, without going
+    through one dict per row: absent categoricals become None, numerics float.
+    """
+    categorical_cols: List[str] = feature_meta.get("categorical_cols", [])
+    numeric_cols: List[str] = feature_meta.get("numeric_cols", [])
+    out = df.reindex(columns=categorical_cols + numeric_cols)
+    out[categorical_cols] = out[categorical_cols].astype(object).where(out[categorical_cols].notna(), None)
+    out[numeric_cols] = out[numeric_cols].astype(np.float64)
+    return out
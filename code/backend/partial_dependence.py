@@ -0,0 +1,198 @@
+"""
+Partial-dependence / ICE curves computed from the deployed model.
+
+Everything works in the preprocessor's output space: numeric features are
+passthrough columns and categoricals are one-hot blocks, so a grid value is
+applied by overwriting one column (numeric) or one one-hot block
+(categorical) of already-encoded rows. For each feature the full
+grid x background matrix is built once and scored in a single prediction.
+"""
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import xgboost as xgb
+
+# Grid resolution for numeric features; integer features with fewer distinct
+# values than this use every integer in range instead.
+NUMERIC_GRID_POINTS = 25
+# Numeric grids span these background quantiles, so a few outliers do not
+# stretch the axis.
+GRID_QUANTILES = (0.01, 0.99)
+# Number of individual (ICE) curves returned per feature.
+ICE_ROWS = 20
+
+INTEGER_FEATURES = {"age", "packs_per_week", "sports_activity_h_per_week", "earning_chf"}
+
+
+def _native(value: Any) -> Any:
+    """numpy scalars (np.True_, np.str_) -> plain Python values for JSON."""
+    return value.item() if hasattr(value, "item") else value
+
+
+def feature_columns(feature_meta: Dict[str, Any], preprocessor) -> Dict[str, Dict[str, Any]]:
+    """Map each raw feature to its encoded column(s).
+
+    Returns {feature: {"kind": "numeric", "index": i}} or
+    {feature: {"kind": "categorical", "indices": [...], "categories": [...]}}.
+    """
+    names: List[str] = feature_meta.get("all_feature_names_after_pre", [])
+    pos = {name: i for i, name in enumerate(names)}
+    out: Dict[str, Dict[str, Any]] = {}
+
+    categorical_cols: List[str] = feature_meta.get("categorical_cols", [])
+    encoder = getattr(preprocessor, "named_transformers_", {}).get("cat") if preprocessor is not None else None
+    categories = list(getattr(encoder, "categories_", []))
+    for j, col in enumerate(categorical_cols):
+        cats = [_native(c) for c in categories[j]] if j < len(categories) else []
+        indices = [pos[f"{col}_{c}"] for c in cats if f"{col}_{c}" in pos]
+        if indices and len(indices) == len(cats):
+            out[col] = {"kind": "categorical", "indices": indices, "categories": cats}
+
+    for col in feature_meta.get("numeric_cols", []):
+        if col in pos:
+            out[col] = {"kind": "numeric", "index": pos[col]}
+    return out
+
+
+def numeric_grid(values: np.ndarray, feature: str, points: int = NUMERIC_GRID_POINTS) -> np.ndarray:
+    """Evenly spaced grid over the central quantile range of the observed values."""
+    values = values[~np.isnan(values)]
+    if values.size == 0:
+        return np.array([], dtype=np.float64)
+    lo, hi = np.quantile(values, GRID_QUANTILES)
+    if feature in INTEGER_FEATURES:
+        lo, hi = np.floor(lo), np.ceil(hi)
+        if hi - lo + 1 <= points:
+            return np.arange(lo, hi + 1, dtype=np.float64)
+        return np.unique(np.round(np.linspace(lo, hi, points)))
+    if hi <= lo:
+        return np.array([lo], dtype=np.float64)
+    return np.linspace(lo, hi, points)
+
+
+def build_grid_matrix(rows: np.ndarray, column: Dict[str, Any], grid: List[Any]) -> np.ndarray:
+    """Stack len(grid) copies of `rows` (n x d) with the feature set to each grid value.
+
+    Block g of the result (rows g*n .. (g+1)*n) holds every row with the
+    feature forced to grid[g].
+    """
+    n = rows.shape[0]
+    X = np.tile(rows, (len(grid), 1))
+    if column["kind"] == "numeric":
+        X[:, column["index"]] = np.repeat(np.asarray(grid, dtype=X.dtype), n)
+    else:
+        block = column["indices"]
+        X[:, block] = 0.0
+        for g in range(len(grid)):
+            X[g * n:(g + 1) * n, block[g]] = 1.0
+    return X
+
+
+def score_grid(booster: xgb.Booster, X: np.ndarray, n_grid: int, n_rows: int) -> np.ndarray:
+    """One batched prediction; returns probabilities shaped (grid, rows, classes)."""
+    probs = booster.predict(xgb.DMatrix(X))
+    if probs.ndim == 1:
+        probs = probs.reshape(-1, 1)
+    return probs.reshape(n_grid, n_rows, probs.shape[1])
+
+
+def compute_feature_curve(
+    booster: xgb.Booster,
+    background: np.ndarray,
+    feature: str,
+    column: Dict[str, Any],
+    class_names: List[str],
+    ice_rows: int = ICE_ROWS,
+) -> Dict[str, Any]:
+    """Partial dependence (mean over background) and ICE curves for one feature."""
+    if column["kind"] == "numeric":
+        grid = [float(v) for v in numeric_grid(background[:, column["index"]], feature)]
+    else:
+        grid = list(column["categories"])
+    if not grid:
+        return {"kind": column["kind"], "grid": [], "pd": {}, "ice": {}}
+
+    probs = score_grid(booster, build_grid_matrix(background, column, grid), len(grid), background.shape[0])
+    probs = probs.astype(np.float64)
+    pd_curves = probs.mean(axis=1)  # (grid, classes)
+    ice = probs[:, :min(ice_rows, background.shape[0]), :]  # (grid, ice_rows, classes)
+    return {
+        "kind": column["kind"],
+        "grid": grid,
+        "pd": {c: pd_curves[:, k].round(5).tolist() for k, c in enumerate(class_names)},
+        "ice": {c: ice[:, :, k].T.round(5).tolist() for k, c in enumerate(class_names)},
+    }
+
+
+def compute_all_curves(
+    booster: xgb.Booster,
+    background: np.ndarray,
+    feature_meta: Dict[str, Any],
+    preprocessor,
+    class_names: List[str],
+    features: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """Curves for every feature in feature_names.json (or the given subset)."""
+    columns = feature_columns(feature_meta, preprocessor)
+    wanted = features or (feature_meta.get("numeric_cols", []) + feature_meta.get("categorical_cols", []))
+    return {
+        f: compute_feature_curve(booster, background, f, columns[f], class_names)
+        for f in wanted if f in columns
+    }
+
+
+def applicant_curves(
+    booster: xgb.Booster,
+    base_row: np.ndarray,
+    background: np.ndarray,
+    columns: Dict[str, Dict[str, Any]],
+    features: List[str],
+    class_names: List[str],
+) -> Dict[str, Any]:
+    """How one applicant's class probabilities move as each feature varies.
+
+    `base_row` is the applicant's encoded row (1 x d). The grids of all
+    requested features are stacked into one matrix built from that row and
+    scored in a single prediction. Numeric grids include the applicant's own
+    value so the curve passes through the current decision.
+    """
+    base_row = np.asarray(base_row, dtype=np.float64).reshape(1, -1)
+    blocks: List[np.ndarray] = []
+    spans: List[tuple] = []
+    start = 0
+    for f in features:
+        column = columns.get(f)
+        if column is None:
+            continue
+        if column["kind"] == "numeric":
+            grid_arr = numeric_grid(background[:, column["index"]], f)
+            current = base_row[0, column["index"]]
+            if not np.isnan(current):
+                grid_arr = np.unique(np.append(grid_arr, current))
+            grid = [float(v) for v in grid_arr]
+            current_value = None if np.isnan(current) else float(current)
+        else:
+            grid = list(column["categories"])
+            hot = [i for i, idx in enumerate(column["indices"]) if base_row[0, idx] == 1.0]
+            current_value = grid[hot[0]] if hot else None
+        if not grid:
+            continue
+        blocks.append(build_grid_matrix(base_row, column, grid))
+        spans.append((f, column["kind"], grid, current_value, start, start + len(grid)))
+        start += len(grid)
+
+    if not blocks:
+        return {}
+    probs = booster.predict(xgb.DMatrix(np.vstack(blocks))).astype(np.float64)
+    if probs.ndim == 1:
+        probs = probs.reshape(-1, 1)
+
+    out: Dict[str, Any] = {}
+    for f, kind, grid, current_value, lo, hi in spans:
+        out[f] = {
+            "kind": kind,
+            "grid": grid,
+            "current_value": current_value,
+            "probabilities": {c: probs[lo:hi, k].round(5).tolist() for k, c in enumerate(class_names)},
+        }
+    return out
@@ -0,0 +1,549 @@
+"""
+Tiered storage for the original PDFs.
+
+- Hot tier: one file per document, ``pdfs/{doc_id}.pdf``. Uploads are
+  written here and recent documents are served from here.
+- Cold tier: ``pdfs/packs/pack-<n>.pack``, append-only pack files holding
+  many PDFs each, optionally zlib-compressed. Reads map the pack with mmap
+  and slice the object out of it, so uncompressed objects are served
+  without copying them into memory.
+
+Every object in a pack is framed as ``MAGIC, codec, id length, body length,
+crc32`` + doc_id + body, so a pack describes itself. ``packs/index.log`` is
+the offset index: CRC-framed records (as in the document log) of objects
+put into packs, of objects deleted and of how far each pack is indexed,
+replayed on open. A crash after objects were appended but before they were
+indexed is recovered by scanning the packs beyond their indexed ends; torn
+tails are truncated.
+
+Compaction moves hot files into the current pack: append and fsync the
+objects, append their index records, then delete the hot files. A hot file
+that is also indexed (crash before the deletion) wins on reads and is
+removed by the next compaction. Packs whose objects are mostly deleted are
+rewritten by `repack`. The crash scenarios are covered by
+tests/test_pdf_store.py.
+
+    python pdf_store.py --benchmark   # space and read latency per tier
+"""
+import hashlib
+import mmap
+import os
+import shutil
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+from document_store import _fsync_dir, _write_atomic, decode_segment, encode_record
+
+PACK_DIR_NAME = "packs"
+INDEX_FILE = "index.log"
+PACK_PREFIX = "pack-"
+MAGIC = b"PDFK"
+# magic, codec, id length, body length, crc32 of the body
+HEADER = struct.Struct("<4sBHII")
+CODECS = ("none", "zlib")
+RAW, ZLIB = 0, 1
+# Start a new pack beyond this size
+PACK_MAX_BYTES = 256 * 1024 * 1024
+# Keep a compressed body only if it saves at least this fraction
+MIN_SAVING = 0.05
+ZLIB_LEVEL = 6
+# Decompressed objects kept for follow-up Range requests of PDF viewers
+DECOMPRESSED_CACHE = 8
+
+Selector = Callable[[str, float], bool]
+
+
+def disk_usage(paths: List[Path]) -> int:
+    """Bytes allocated on disk (blocks, not lengths) for files."""
+    return sum(p.stat().st_blocks * 512 for p in paths if p.exists())
+
+
+class PdfStore:
+    def __init__(self, pdf_dir: Path, compression: str = "zlib") -> None:
+        if compression not in CODECS:
+            raise ValueError(f"Unknown compression {compression!r}; expected one of {', '.join(CODECS)}")
+        self.pdf_dir = Path(pdf_dir)
+        self.pack_dir = self.pdf_dir / PACK_DIR_NAME
+        self.compression = compression
+        self._lock = threading.RLock()
+        self._compact_lock = threading.Lock()
+        # doc_id -> index entry {pack, offset, length, size, codec, crc, sha256, mtime}
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        # pack number -> offset up to which its objects are indexed
+        self._indexed: Dict[int, int] = {}
+        # pack number -> (mapped length, mmap)
+        self._maps: Dict[int, Tuple[int, mmap.mmap]] = {}
+        self._decompressed: "OrderedDict[str, bytes]" = OrderedDict()
+        self._index = None
+        self._pack_no = 0
+        self.recovery: Dict[str, Any] = {}
+
+    # ----- opening / recovery -----
+
+    def _pack_path(self, number: int) -> Path:
+        return self.pack_dir / f"{PACK_PREFIX}{number:06d}.pack"
+
+    def _packs(self) -> List[int]:
+        return sorted(int(p.stem[len(PACK_PREFIX):]) for p in self.pack_dir.glob(f"{PACK_PREFIX}*.pack"))
+
+    def open(self) -> Dict[str, Any]:
+        """Replay the index, index objects appended after it and truncate torn pack tails."""
+        t0 = time.perf_counter()
+        self.pdf_dir.mkdir(parents=True, exist_ok=True)
+        self.pack_dir.mkdir(exist_ok=True)
+        index_path = self.pack_dir / INDEX_FILE
+        data = index_path.read_bytes() if index_path.exists() else b""
+        records, good = decode_segment(data)
+        if good < len(data):
+            with open(index_path, "r+b") as f:
+                f.truncate(good)
+                os.fsync(f.fileno())
+        for record in records:
+            self._apply(record)
+
+        recovered, truncated = 0, len(data) - good
+        self._index = open(index_path, "ab")
+        for number in self._packs():
+            path = self._pack_path(number)
+            found, end = self._scan(path, self._indexed.get(number, 0))
+            if found:
+                # Objects whose index records were lost in a crash
+                self._append_index(found + [{"op": "end", "pack": number, "end": end}])
+                recovered += len(found)
+            if end < path.stat().st_size:
+                truncated += path.stat().st_size - end
+                with open(path, "r+b") as f:
+                    f.truncate(end)
+                    os.fsync(f.fileno())
+        packs = self._packs()
+        self._pack_no = packs[-1] if packs else 1
+        self.recovery = {
+            "objects": len(self._entries),
+            "recovered_objects": recovered,
+            "truncated_bytes": truncated,
+            "seconds": round(time.perf_counter() - t0, 3),
+        }
+        return self.recovery
+
+    def _apply(self, record: Dict[str, Any]) -> None:
+        if record["op"] == "put":
+            self._entries[record["id"]] = {k: v for k, v in record.items() if k not in ("op", "id")}
+        elif record["op"] == "delete":
+            self._entries.pop(record["id"], None)
+        elif record["op"] == "end":
+            self._indexed[record["pack"]] = max(self._indexed.get(record["pack"], 0), record["end"])
+
+    def _scan(self, path: Path, start: int) -> Tuple[List[Dict[str, Any]], int]:
+        """Intact objects of a pack from `start` on, and the offset where they end."""
+        found: List[Dict[str, Any]] = []
+        number = int(path.stem[len(PACK_PREFIX):])
+        with open(path, "rb") as f:
+            pos = start
+            while True:
+                f.seek(pos)
+                header = f.read(HEADER.size)
+                if len(header) < HEADER.size:
+                    break
+                magic, codec, id_len, length, crc = HEADER.unpack(header)
+                doc_id = f.read(id_len)
+                body = f.read(length)
+                if magic != MAGIC or len(doc_id) < id_len or len(body) < length or zlib.crc32(body) != crc:
+                    break
+                raw = zlib.decompress(body) if codec == ZLIB else body
+                offset = pos + HEADER.size + id_len
+                found.append({
+                    "op": "put", "id": doc_id.decode(), "pack": number, "offset": offset, "length": length, "size": len(raw),
+                    "codec": codec, "crc": crc, "sha256": hashlib.sha256(raw).hexdigest(), "mtime": path.stat().st_mtime,
+                })
+                pos = offset + length
+        return found, pos
+
+    def _append_index(self, records: List[Dict[str, Any]]) -> None:
+        self._index.write(b"".join(encode_record(r) for r in records))
+        self._index.flush()
+        os.fsync(self._index.fileno())
+        for record in records:
+            self._apply(record)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._index is not None:
+                self._index.close()
+                self._index = None
+            self._maps.clear()
+            self._decompressed.clear()
+
+    # ----- reads -----
+
+    def hot_path(self, doc_id: str) -> Path:
+        return self.pdf_dir / f"{doc_id}.pdf"
+
+    def cold_entry(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        """The index entry of a packed PDF, or None (not packed, or a hot copy exists)."""
+        if self.hot_path(doc_id).exists():
+            return None
+        with self._lock:
+            entry = self._entries.get(doc_id)
+            return dict(entry) if entry is not None else None
+
+    def exists(self, doc_id: str) -> bool:
+        return self.hot_path(doc_id).exists() or doc_id in self._entries
+
+    def _map(self, number: int, needed: int) -> mmap.mmap:
+        with self._lock:
+            mapped = self._maps.get(number)
+            if mapped is None or mapped[0] < needed:
+                # Remap a pack that grew; views of the old map keep it alive until released
+                with open(self._pack_path(number), "rb") as f:
+                    size = os.fstat(f.fileno()).st_size
+                    mapped = (size, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+                self._maps[number] = mapped
+            return mapped[1]
+
+    def cold_view(self, doc_id: str, entry: Dict[str, Any]) -> Union[memoryview, bytes]:
+        """
+        Content of a packed PDF: a view into the mapped pack, or the decompressed
+        bytes. FileNotFoundError if the PDF was deleted since `entry` was taken.
+        """
+        end = entry["offset"] + entry["length"]
+        try:
+            mapped = self._map(entry["pack"], end)
+        except FileNotFoundError:
+            # repack() moved the object and removed its pack after `entry` was taken
+            with self._lock:
+                moved = self._entries.get(doc_id)
+            if moved is None or moved["pack"] == entry["pack"]:
+                raise
+            return self.cold_view(doc_id, dict(moved))
+        body = memoryview(mapped)[entry["offset"]:end]
+        if entry["codec"] == RAW:
+            return body
+        with self._lock:
+            cached = self._decompressed.get(doc_id)
+            if cached is not None:
+                self._decompressed.move_to_end(doc_id)
+                return cached
+        data = zlib.decompress(body)
+        body.release()
+        with self._lock:
+            self._decompressed[doc_id] = data
+            while len(self._decompressed) > DECOMPRESSED_CACHE:
+                self._decompressed.popitem(last=False)
+        return data
+
+    def read(self, doc_id: str) -> Optional[bytes]:
+        """A document's PDF from whichever tier holds it, or None."""
+        try:
+            return self.hot_path(doc_id).read_bytes()
+        except FileNotFoundError:
+            pass
+        entry = self.cold_entry(doc_id)
+        return bytes(self.cold_view(doc_id, entry)) if entry is not None else None
+
+    # ----- writes -----
+
+    def delete(self, doc_id: str) -> bool:
+        """Remove a document's PDF from both tiers (packed bytes are reclaimed by `repack`)."""
+        removed = False
+        path = self.hot_path(doc_id)
+        if path.exists():
+            path.unlink()
+            removed = True
+        with self._lock:
+            if doc_id in self._entries:
+                self._append_index([{"op": "delete", "id": doc_id}])
+                self._decompressed.pop(doc_id, None)
+                removed = True
+        return removed
+
+    def _encode(self, raw: bytes, compress: bool) -> Tuple[int, bytes]:
+        if compress:
+            packed = zlib.compress(raw, ZLIB_LEVEL)
+            if len(packed) <= len(raw) * (1 - MIN_SAVING):
+                return ZLIB, packed
+        return RAW, raw
+
+    def _write_objects(self, items: List[Tuple[str, bytes, float, Optional[Tuple[int, bytes]]]]) -> List[Dict[str, Any]]:
+        """
+        Append objects (doc_id, raw, mtime, encoded (codec, body) or None) to the
+        current pack; returns their index records, ending with the packs' new ends.
+        """
+        records = []
+        compress = self.compression == "zlib"
+        path = self._pack_path(self._pack_no)
+        f = open(path, "ab")
+        try:
+            for doc_id, raw, mtime, encoded in items:
+                if f.tell() >= PACK_MAX_BYTES:
+                    f.flush()
+                    os.fsync(f.fileno())
+                    records.append({"op": "end", "pack": self._pack_no, "end": f.tell()})
+                    f.close()
+                    self._pack_no += 1
+                    path = self._pack_path(self._pack_no)
+                    f = open(path, "ab")
+                codec, body = encoded or self._encode(raw, compress)
+                key = doc_id.encode()
+                crc = zlib.crc32(body)
+                f.write(HEADER.pack(MAGIC, codec, len(key), len(body), crc) + key)
+                records.append({
+                    "op": "put", "id": doc_id, "pack": self._pack_no, "offset": f.tell(), "length": len(body),
+                    "size": len(raw), "codec": codec, "crc": crc, "sha256": hashlib.sha256(raw).hexdigest(), "mtime": mtime,
+                })
+                f.write(body)
+            f.flush()
+            os.fsync(f.fileno())
+            records.append({"op": "end", "pack": self._pack_no, "end": f.tell()})
+        finally:
+            f.close()
+        _fsync_dir(self.pack_dir)
+        return records
+
+    def hot_files(self) -> Iterator[Tuple[str, Path, os.stat_result]]:
+        for path in self.pdf_dir.glob("*.pdf"):
+            try:
+                yield path.stem, path, path.stat()
+            except FileNotFoundError:
+                continue
+
+    def compact(self, select: Selector, wait: bool = True, batch_bytes: int = 64 * 1024 * 1024) -> Dict[str, Any]:
+        """
+        Move the hot PDFs for which select(doc_id, age_s) is true into packs.
+        With `wait` False, returns at once if a compaction is already running.
+        """
+        if not self._compact_lock.acquire(blocking=wait):
+            return {"skipped": "compaction already running"}
+        try:
+            t0 = time.perf_counter()
+            now = time.time()
+            moved = raw_bytes = stored_bytes = removed_duplicates = 0
+            batch: List[Tuple[str, Path, bytes, float]] = []
+
+            def flush() -> None:
+                nonlocal moved, raw_bytes, stored_bytes
+                if not batch:
+                    return
+                # Compress outside the lock; only appends and index updates hold it
+                encoded = [(doc_id, raw, mtime, self._encode(raw, self.compression == "zlib")) for doc_id, _, raw, mtime in batch]
+                with self._lock:
+                    records = self._write_objects(encoded)
+                    self._append_index(records)
+                for (_, path, _, _), record in zip(batch, [r for r in records if r["op"] == "put"]):
+                    path.unlink()
+                    moved += 1
+                    raw_bytes += record["size"]
+                    stored_bytes += record["length"]
+                _fsync_dir(self.pdf_dir)
+                batch.clear()
+
+            for doc_id, path, stat in list(self.hot_files()):
+                entry = self._entries.get(doc_id)
+                if entry is not None and entry["size"] == stat.st_size:
+                    # Packed before a crash kept the hot copy from being deleted
+                    path.unlink()
+                    removed_duplicates += 1
+                    continue
+                if not select(doc_id, now - stat.st_mtime):
+                    continue
+                batch.append((doc_id, path, path.read_bytes(), stat.st_mtime))
+                if sum(len(raw) for _, _, raw, _ in batch) >= batch_bytes:
+                    flush()
+            flush()
+            return {
+                "moved": moved,
+                "raw_bytes": raw_bytes,
+                "stored_bytes": stored_bytes,
+                "removed_duplicates": removed_duplicates,
+                "seconds": round(time.perf_counter() - t0, 3),
+            }
+        finally:
+            self._compact_lock.release()
+
+    def repack(self, min_dead_ratio: float = 0.5) -> Dict[str, Any]:
+        """Rewrite packs whose bytes are mostly deleted objects, then the index with live entries only."""
+        with self._compact_lock, self._lock:
+            live: Dict[int, int] = {}
+            for entry in self._entries.values():
+                live[entry["pack"]] = live.get(entry["pack"], 0) + entry["length"]
+            # The current pack qualifies too: compaction cannot append while both locks are held
+            victims = [
+                n for n in self._packs()
+                if live.get(n, 0) < self._pack_path(n).stat().st_size * (1 - min_dead_ratio)
+            ]
+            if not victims:
+                return {"packs_rewritten": 0, "bytes_reclaimed": 0}
+            before = disk_usage([self._pack_path(n) for n in victims])
+            moving = [(doc_id, e) for doc_id, e in self._entries.items() if e["pack"] in victims]
+            items = []
+            for doc_id, entry in moving:
+                body = bytes(memoryview(self._map(entry["pack"], entry["offset"] + entry["length"]))[entry["offset"]:entry["offset"] + entry["length"]])
+                raw = zlib.decompress(body) if entry["codec"] == ZLIB else body
+                items.append((doc_id, raw, entry["mtime"], (entry["codec"], body)))
+            if items:
+                self._pack_no = max(self._packs()) + 1
+                self._append_index(self._write_objects(items))
+            # Rewrite the index with the live entries only, then drop the old packs
+            for number in victims:
+                self._indexed.pop(number, None)
+            self._index.close()
+            _write_atomic(self.pack_dir / INDEX_FILE, b"".join(
+                [encode_record({"op": "put", "id": doc_id, **entry}) for doc_id, entry in self._entries.items()]
+                + [encode_record({"op": "end", "pack": number, "end": end}) for number, end in self._indexed.items()]
+            ))
+            self._index = open(self.pack_dir / INDEX_FILE, "ab")
+            for number in victims:
+                self._maps.pop(number, None)
+                self._pack_path(number).unlink()
+            _fsync_dir(self.pack_dir)
+            return {
+                "packs_rewritten": len(victims),
+                "objects_moved": len(items),
+                "bytes_reclaimed": before - disk_usage([self._pack_path(self._pack_no)] if items else []),
+            }
+
+    def stats(self) -> Dict[str, Any]:
+        hot = [(path, stat) for _, path, stat in self.hot_files()]
+        with self._lock:
+            packs = [self._pack_path(n) for n in self._packs()]
+            items = list(self._entries.items())
+        entries = [e for _, e in items]
+        pack_bytes = sum(p.stat().st_size for p in packs)
+        stored = sum(e["length"] for e in entries)
+        framed = stored + sum(HEADER.size + len(doc_id.encode()) for doc_id, _ in items)
+        return {
+            "hot_files": len(hot),
+            "hot_bytes": sum(stat.st_size for _, stat in hot),
+            "hot_disk_bytes": sum(stat.st_blocks * 512 for _, stat in hot),
+            "cold_objects": len(entries),
+            "cold_raw_bytes": sum(e["size"] for e in entries),
+            "cold_stored_bytes": stored,
+            "compressed_objects": sum(1 for e in entries if e["codec"] == ZLIB),
+            "packs": len(packs),
+            "pack_bytes": pack_bytes,
+            "pack_disk_bytes": disk_usage(packs + [self.pack_dir / INDEX_FILE]),
+            "dead_bytes": pack_bytes - framed,
+            "compression": self.compression,
+        }
+
+
+def _sample_pdfs(count: int, seed: int = 0) -> List[bytes]:
+    """Synthetic corpus: text forms (uncompressed content streams) and scanned pages (JPEG images)."""
+    import io
+    import random
+
+    rng = random.Random(seed)
+    pdfs = []
+    for i in range(count):
+        if i % 5 < 3:
+            pages = []
+            for _ in range(rng.randint(2, 6)):
+                lines = " ".join(f"(Field {rng.randint(1, 99)}: {rng.random():.6f} answer text {i}) Tj 0 -14 Td" for _ in range(40))
+                pages.append(b"BT /F1 10 Tf 40 780 Td " + lines.encode() + b" ET")
+            objects = [b"<</Type/Catalog/Pages 2 0 R>>", None, b"<</Type/Font/Subtype/Type1/BaseFont/Helvetica>>"]
+            kids = []
+            for stream in pages:
+                objects.append(b"<</Length %d>>stream\n" % len(stream) + stream + b"\nendstream")
+                objects.append(b"<</Type/Page/Parent 2 0 R/Resources<</Font<</F1 3 0 R>>>>/Contents %d 0 R>>" % len(objects))
+                kids.append(len(objects))
+            objects[1] = b"<</Type/Pages/Kids[%s]/Count %d>>" % (b" ".join(b"%d 0 R" % k for k in kids), len(kids))
+            pdfs.append(b"%PDF-1.4\n" + b"".join(b"%d 0 obj" % (n + 1) + body + b"endobj\n" for n, body in enumerate(objects)) + b"%%EOF\n")
+        else:
+            try:
+                from PIL import Image
+            except ImportError:
+                continue
+            image = Image.effect_noise((850, 1100), rng.randint(20, 60)).convert("RGB")
+            buffer = io.BytesIO()
+            image.save(buffer, format="PDF", resolution=100, quality=70)
+            pdfs.append(buffer.getvalue())
+    return pdfs
+
+
+def _percentiles(samples: List[float]) -> str:
+    samples = sorted(samples)
+    p50, p95 = samples[len(samples) // 2], samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    return f"p50 {p50 * 1e3:7.3f} ms  p95 {p95 * 1e3:7.3f} ms"
+
+
+def benchmark(count: int, reads: int) -> None:
+    import random
+    import tempfile
+
+    corpus = _sample_pdfs(count)
+    root = Path(tempfile.mkdtemp(prefix="pdf-store-"))
+    try:
+        ids = [f"{i:08d}-0000-0000-0000-000000000000" for i in range(len(corpus))]
+        stores = {}
+        for compression in CODECS:
+            store = PdfStore(root / compression, compression)
+            store.open()
+            for doc_id, pdf in zip(ids, corpus):
+                store.hot_path(doc_id).write_bytes(pdf)
+            stores[compression] = store
+        hot = stores["none"].stats()
+        print(f"{len(corpus)} PDFs, {hot['hot_bytes'] / 1e6:.1f} MB")
+        print(f"  hot files:         {hot['hot_files']:5d} files  {hot['hot_disk_bytes'] / 1e6:7.1f} MB on disk")
+
+        rng = random.Random(1)
+        sample = [rng.choice(ids) for _ in range(reads)]
+        timings: Dict[str, List[float]] = {"hot file, whole": [], "hot file, 64 KB range": []}
+        for doc_id in sample:
+            t0 = time.perf_counter()
+            stores["none"].read(doc_id)
+            timings["hot file, whole"].append(time.perf_counter() - t0)
+            t0 = time.perf_counter()
+            with open(stores["none"].hot_path(doc_id), "rb") as f:
+                f.seek(4096)
+                f.read(65536)
+            timings["hot file, 64 KB range"].append(time.perf_counter() - t0)
+
+        for compression, store in stores.items():
+            report = store.compact(lambda doc_id, age: True)
+            stats = store.stats()
+            print(f"  packed ({compression:4s}):    {stats['packs']:5d} files  {stats['pack_disk_bytes'] / 1e6:7.1f} MB on disk  "
+                  f"({stats['compressed_objects']} compressed, {stats['cold_raw_bytes'] / 1e6:.1f} -> "
+                  f"{stats['cold_stored_bytes'] / 1e6:.1f} MB; compaction {report['seconds']:.2f}s)")
+            store.close()
+            store = stores[compression] = PdfStore(root / compression, compression)
+            store.open()
+            whole, ranged, first = [], [], []
+            for doc_id in sample:
+                t0 = time.perf_counter()
+                entry = store.cold_entry(doc_id)
+                view = store.cold_view(doc_id, entry)
+                bytes(view)
+                whole.append(time.perf_counter() - t0)
+                t0 = time.perf_counter()
+                bytes(store.cold_view(doc_id, store.cold_entry(doc_id))[4096:4096 + 65536])
+                ranged.append(time.perf_counter() - t0)
+            for doc_id in ids[:reads]:
+                store._decompressed.clear()
+                t0 = time.perf_counter()
+                bytes(store.cold_view(doc_id, store.cold_entry(doc_id)))
+                first.append(time.perf_counter() - t0)
+            timings[f"pack ({compression}), whole"] = whole
+            timings[f"pack ({compression}), uncached whole"] = first
+            timings[f"pack ({compression}), 64 KB range"] = ranged
+        print("read latency (warm page cache):")
+        for name, samples in timings.items():
+            print(f"  {name:30s} {_percentiles(samples)}")
+        for store in stores.values():
+            store.close()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Tiered PDF storage: space and read latency per tier")
+    parser.add_argument("--benchmark", action="store_true")
+    parser.add_argument("--count", type=int, default=500, help="PDFs in the benchmark corpus")
+    parser.add_argument("--reads", type=int, default=300)
+    args = parser.parse_args()
+    benchmark(args.count, args.reads)
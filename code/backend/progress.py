@@ -0,0 +1,184 @@
+"""
+Progress events for long-running jobs (uploads, analyses), served as
+Server-Sent Events.
+
+Each job keeps its last ``MAX_EVENTS_PER_JOB`` events in a ring buffer,
+already encoded as SSE frames. Subscribers hold only a cursor into that
+buffer, so memory does not grow with the number of subscribers, and a
+reconnecting client resumes after its ``Last-Event-ID``. If the events it
+missed have already left the buffer it first gets a ``snapshot`` event with
+the job's current state (stage, fields extracted so far, result or error).
+
+Event ids are per-job integers. A job ends with a ``done`` or ``error``
+event; finished jobs are forgotten after ``FINISHED_JOB_TTL`` seconds, and
+at most ``MAX_JOBS`` jobs are kept (oldest finished ones go first).
+
+``publish`` may be called from worker threads.
+"""
+import asyncio
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, AsyncIterator, Dict, Optional
+
+import serialization
+
+MAX_EVENTS_PER_JOB = 64
+MAX_JOBS = 1000
+MAX_SUBSCRIBERS = 1000
+FINISHED_JOB_TTL = 600
+# A subscriber may connect before its job has started; give up after this long
+PENDING_TIMEOUT = 60
+HEARTBEAT_INTERVAL = 15
+# Reconnection delay suggested to EventSource clients (ms)
+RETRY_MS = 2000
+
+TERMINAL_EVENTS = ("done", "error")
+JOB_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def format_event(event_id: int, event: str, data: Any) -> bytes:
+    return b"id: %d\nevent: %s\ndata: %s\n\n" % (event_id, event.encode(), serialization.dumps(data))
+
+
+class Job:
+    def __init__(self, job_id: str) -> None:
+        self.id = job_id
+        self.created = time.time()
+        self.finished_at: Optional[float] = None
+        self.last_id = 0
+        self.events: deque = deque(maxlen=MAX_EVENTS_PER_JOB)  # (id, frame)
+        # Latest stage, fields extracted so far and result/error, for snapshots
+        self.state: Dict[str, Any] = {"stage": None, "fields": {}}
+        self.changed: Optional[asyncio.Event] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+
+class ProgressBroker:
+    def __init__(self) -> None:
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.subscribers = 0
+
+    def _job(self, job_id: str) -> Job:
+        """Existing or new job (caller holds the lock)."""
+        job = self._jobs.get(job_id)
+        if job is None:
+            job = self._jobs[job_id] = Job(job_id)
+            self._evict()
+        return job
+
+    def _evict(self) -> None:
+        now = time.time()
+        for job_id in [j.id for j in self._jobs.values() if j.finished and now - j.finished_at > FINISHED_JOB_TTL]:
+            del self._jobs[job_id]
+        while len(self._jobs) > MAX_JOBS:
+            victim = next((j for j in self._jobs.values() if j.finished), None) or next(iter(self._jobs.values()))
+            del self._jobs[victim.id]
+            if not victim.finished:
+                victim.finished_at = now
+                self._wake(victim)
+
+    def _wake(self, job: Job) -> None:
+        """Wake the job's subscribers (their loop may be another thread's)."""
+        if self._loop is None or self._loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._notify(job)
+        else:
+            self._loop.call_soon_threadsafe(self._notify, job)
+
+    @staticmethod
+    def _notify(job: Job) -> None:
+        if job.changed is not None:
+            changed, job.changed = job.changed, None
+            changed.set()
+
+    def start(self, job_id: str) -> None:
+        """Register a job (again: a re-run keeps its event ids increasing)."""
+        with self._lock:
+            job = self._job(job_id)
+            job.finished_at = None
+            job.state = {"stage": None, "fields": {}}
+            self._jobs.move_to_end(job_id)
+
+    def publish(self, job_id: str, event: str, data: Optional[Dict[str, Any]] = None) -> int:
+        """Append an event to the job; `done`/`error` finish it. Returns the event id."""
+        data = data or {}
+        with self._lock:
+            job = self._job(job_id)
+            job.last_id += 1
+            job.events.append((job.last_id, format_event(job.last_id, event, data)))
+            if event == "partial":
+                job.state["fields"].update(data.get("fields", {}))
+            else:
+                job.state["stage"] = event
+            if event == "done":
+                job.state["result"] = data
+            elif event == "error":
+                job.state["error"] = data
+            if event in TERMINAL_EVENTS:
+                job.finished_at = time.time()
+            event_id = job.last_id
+        self._wake(job)
+        return event_id
+
+    def exists(self, job_id: str) -> bool:
+        return job_id in self._jobs
+
+    async def subscribe(self, job_id: str, last_event_id: int = 0) -> AsyncIterator[bytes]:
+        """SSE frames of the job after `last_event_id`, until it finishes."""
+        self._loop = asyncio.get_running_loop()
+        with self._lock:
+            job = self._job(job_id)
+        self.subscribers += 1
+        try:
+            yield b"retry: %d\n\n" % RETRY_MS
+            cursor = last_event_id
+            while True:
+                # Register for the wakeup before reading, so no publish is missed
+                if job.changed is None:
+                    job.changed = asyncio.Event()
+                changed = job.changed
+                with self._lock:
+                    frames = [(i, f) for i, f in job.events if i > cursor]
+                    first_buffered = job.events[0][0] if job.events else job.last_id + 1
+                    snapshot = dict(job.state, fields=dict(job.state["fields"]))
+                    finished = job.finished
+                if frames and cursor < first_buffered - 1:
+                    # Missed events that are no longer buffered: send the current state first
+                    yield format_event(first_buffered - 1, "snapshot", snapshot)
+                for event_id, frame in frames:
+                    yield frame
+                    cursor = event_id
+                if finished:
+                    return
+                if job.last_id == 0 and time.time() - job.created > PENDING_TIMEOUT:
+                    with self._lock:
+                        job.finished_at = time.time()
+                    yield format_event(0, "error", {"detail": f"Unknown job: {job_id}"})
+                    return
+                try:
+                    await asyncio.wait_for(changed.wait(), HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield b": keep-alive\n\n"
+        finally:
+            self.subscribers -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "jobs": len(self._jobs),
+                "active_jobs": sum(1 for j in self._jobs.values() if not j.finished),
+                "buffered_events": sum(len(j.events) for j in self._jobs.values()),
+                "subscribers": self.subscribers,
+            }
@@ -0,0 +1,283 @@
+"""
+In-memory inverted index over the document store.
+
+- Text terms come from `name` and `filename`, and from the values of the
+  extracted categorical fields; categorical values are also indexed as
+  `field:value` terms for exact filters.
+- The vocabulary is kept sorted, so a prefix is a bisect range over it
+  (type-ahead).
+- Numeric fields are kept as sorted (value, doc_id) lists, so a range query
+  is two bisects.
+
+Writes go through `update(before, after)`, which only touches the terms and
+values of the one document that changed. Results are ordered newest first
+from a sorted (uploaded_at, id) list, so large result sets are paged by
+walking that list instead of sorting the matches.
+"""
+import bisect
+import functools
+import heapq
+import math
+import re
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import applicant_schema
+
+TEXT_FIELDS = ["name", "filename"]
+CATEGORICAL_FIELDS = applicant_schema.CATEGORICAL_FIELDS
+NUMERIC_FIELDS = applicant_schema.NUMERIC_FIELDS
+# Fields returned per hit (same summary as GET /documents)
+SUMMARY_FIELDS = ["id", "filename", "name", "uploaded_at", "model_prediction", "human_prediction"]
+
+# A prefix expanding to more terms than this is too unspecific to be useful
+MAX_PREFIX_TERMS = 5000
+# Result sets smaller than this are sorted directly; larger ones are paged by
+# walking the recency list
+SORT_DIRECTLY_BELOW = 2000
+
+_TOKEN_RE = re.compile(r"[0-9a-zà-ÿ]+")
+
+
+def tokenize(text: Any) -> List[str]:
+    if text is None:
+        return []
+    return _TOKEN_RE.findall(str(text).lower())
+
+
+def _category(value: Any) -> Optional[str]:
+    if value is None or value == "":
+        return None
+    return str(value).lower()
+
+
+def _number(value: Any) -> Optional[float]:
+    if value is None or value == "" or isinstance(value, bool):
+        return None
+    try:
+        v = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(v) else v
+
+
+@functools.lru_cache(maxsize=4096)
+def _categorical_terms(field: str, value: str) -> Tuple[str, ...]:
+    # Categorical values repeat across documents, so their terms are cached
+    return (f"{field}:{value}", *tokenize(value))
+
+
+def document_terms(doc: Dict[str, Any]) -> Set[str]:
+    terms: Set[str] = set()
+    for field in TEXT_FIELDS:
+        terms.update(tokenize(doc.get(field)))
+    for field in CATEGORICAL_FIELDS:
+        value = _category(doc.get(field))
+        if value is not None:
+            terms.update(_categorical_terms(field, value))
+    return terms
+
+
+def document_numbers(doc: Dict[str, Any]) -> Dict[str, float]:
+    out = {}
+    for field in NUMERIC_FIELDS:
+        v = _number(doc.get(field))
+        if v is not None:
+            out[field] = v
+    return out
+
+
+class SearchIndex:
+    """Inverted index + sorted numeric columns, updated one document at a time."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self) -> None:
+        self._postings: Dict[str, Set[str]] = {}
+        self._vocabulary: List[str] = []  # sorted keys of _postings
+        self._numeric: Dict[str, List[Tuple[float, str]]] = {f: [] for f in NUMERIC_FIELDS}
+        self._by_time: List[Tuple[str, str]] = []  # sorted (uploaded_at, id)
+        self._summaries: Dict[str, Dict[str, Any]] = {}
+
+    def __len__(self) -> int:
+        return len(self._summaries)
+
+    # ----- updates -----
+
+    def _add(self, doc: Dict[str, Any], bulk: bool = False) -> None:
+        """Index one document; in bulk mode sorted lists are appended to and sorted later."""
+        insert = list.append if bulk else bisect.insort
+        doc_id = doc["id"]
+        for term in document_terms(doc):
+            posting = self._postings.get(term)
+            if posting is None:
+                posting = self._postings[term] = set()
+                if not bulk:
+                    bisect.insort(self._vocabulary, term)
+            posting.add(doc_id)
+        for field, v in document_numbers(doc).items():
+            insert(self._numeric[field], (v, doc_id))
+        summary = {f: doc.get(f) for f in SUMMARY_FIELDS}
+        insert(self._by_time, (summary["uploaded_at"] or "", doc_id))
+        self._summaries[doc_id] = summary
+
+    def _remove(self, doc: Dict[str, Any]) -> None:
+        doc_id = doc["id"]
+        for term in document_terms(doc):
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            posting.discard(doc_id)
+            if not posting:
+                del self._postings[term]
+                i = bisect.bisect_left(self._vocabulary, term)
+                if i < len(self._vocabulary) and self._vocabulary[i] == term:
+                    del self._vocabulary[i]
+        for field, v in document_numbers(doc).items():
+            self._discard(self._numeric[field], (v, doc_id))
+        summary = self._summaries.pop(doc_id, None)
+        if summary is not None:
+            self._discard(self._by_time, (summary["uploaded_at"] or "", doc_id))
+
+    @staticmethod
+    def _discard(column: List[tuple], item: tuple) -> None:
+        i = bisect.bisect_left(column, item)
+        if i < len(column) and column[i] == item:
+            del column[i]
+
+    def add(self, doc: Dict[str, Any]) -> None:
+        with self._lock:
+            self._add(doc)
+
+    def update(self, before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]) -> None:
+        """Account for one document changing from `before` to `after` (None = absent)."""
+        with self._lock:
+            if before and before.get("id"):
+                self._remove(before)
+            if after and after.get("id"):
+                self._add(after)
+
+    def load(self, documents: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """Replace the index with `documents`, passing each one through.
+
+        Lets a caller build other state from the same single pass over the
+        store. Sorted lists are built once at the end instead of per insert.
+        """
+        with self._lock:
+            self.clear()
+            for doc in documents:
+                if doc.get("id"):
+                    self._add(doc, bulk=True)
+                yield doc
+            self._vocabulary = sorted(self._postings)
+            for column in self._numeric.values():
+                column.sort()
+            self._by_time.sort()
+
+    def rebuild(self, documents: Iterable[Dict[str, Any]]) -> int:
+        for _ in self.load(documents):
+            pass
+        return len(self._summaries)
+
+    # ----- queries -----
+
+    def _prefix_terms(self, prefix: str) -> List[str]:
+        lo = bisect.bisect_left(self._vocabulary, prefix)
+        hi = bisect.bisect_left(self._vocabulary, prefix + "\uffff")
+        return self._vocabulary[lo:min(hi, lo + MAX_PREFIX_TERMS)]
+
+    def _term_ids(self, term: str, prefix: bool) -> Set[str]:
+        if not prefix:
+            return self._postings.get(term, set())
+        ids: Set[str] = set()
+        for t in self._prefix_terms(term):
+            ids |= self._postings[t]
+        return ids
+
+    def _range_ids(self, field: str, lo: Optional[float], hi: Optional[float]) -> Set[str]:
+        column = self._numeric[field]
+        start = 0 if lo is None else bisect.bisect_left(column, (lo, ""))
+        end = len(column) if hi is None else bisect.bisect_right(column, (hi, "\uffff"))
+        return {doc_id for _, doc_id in column[start:end]}
+
+    def _match(
+        self,
+        text: Optional[str],
+        filters: Optional[Dict[str, str]],
+        ranges: Optional[Dict[str, Tuple[Optional[float], Optional[float]]]],
+    ) -> Optional[Set[str]]:
+        """Ids matching every condition, or None when there are no conditions."""
+        sets: List[Set[str]] = []
+        tokens = tokenize(text)
+        for i, token in enumerate(tokens):
+            sets.append(self._term_ids(token, prefix=i == len(tokens) - 1))
+        for field, value in (filters or {}).items():
+            sets.append(self._postings.get(f"{field}:{_category(value)}", set()))
+        for field, (lo, hi) in (ranges or {}).items():
+            sets.append(self._range_ids(field, lo, hi))
+        if not sets:
+            return None
+
+        sets.sort(key=len)
+        ids = set(sets[0])
+        for s in sets[1:]:
+            if not ids:
+                break
+            ids &= s
+        return ids
+
+    def matching_ids(
+        self,
+        text: Optional[str] = None,
+        filters: Optional[Dict[str, str]] = None,
+        ranges: Optional[Dict[str, Tuple[Optional[float], Optional[float]]]] = None,
+    ) -> List[str]:
+        """All matching ids, oldest first (all documents when there are no conditions)."""
+        with self._lock:
+            ids = self._match(text, filters, ranges)
+            return [d for _, d in self._by_time if ids is None or d in ids]
+
+    def search(
+        self,
+        text: Optional[str] = None,
+        filters: Optional[Dict[str, str]] = None,
+        ranges: Optional[Dict[str, Tuple[Optional[float], Optional[float]]]] = None,
+        limit: int = 50,
+        offset: int = 0,
+    ) -> Dict[str, Any]:
+        """Documents matching all terms, filters and ranges, newest first.
+
+        The last text term is matched as a prefix (type-ahead); earlier terms
+        must match exactly.
+        """
+        with self._lock:
+            ids = self._match(text, filters, ranges)
+            if ids is None:
+                end = max(len(self._by_time) - offset, 0)
+                page = [d for _, d in reversed(self._by_time[max(end - limit, 0):end])]
+                return {"total": len(self._summaries), "results": [dict(self._summaries[d]) for d in page]}
+
+            wanted = offset + limit
+            if len(ids) < SORT_DIRECTLY_BELOW:
+                top = heapq.nlargest(wanted, ids, key=lambda d: (self._summaries[d]["uploaded_at"] or "", d))
+            else:
+                top = []
+                for _, d in reversed(self._by_time):
+                    if d in ids:
+                        top.append(d)
+                        if len(top) == wanted:
+                            break
+            return {
+                "total": len(ids),
+                "results": [dict(self._summaries[d]) for d in top[offset:]],
+            }
+
+    def suggest(self, prefix: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Most frequent vocabulary terms starting with `prefix`."""
+        prefix = prefix.lower()
+        with self._lock:
+            terms = self._prefix_terms(prefix)
+            best = heapq.nlargest(limit, terms, key=lambda t: len(self._postings[t]))
+            return [{"term": t, "documents": len(self._postings[t])} for t in best]
@@ -0,0 +1,119 @@
+"""
+Storage and wire encoding for documents.
+
+Records are stored as compact JSON wrapped in a small versioned envelope,
+``{"_v": 2, "record": {...}}``. Files written before the envelope existed
+(pretty-printed plain objects, format 1) are read transparently and rewritten
+in the current format on their next save.
+
+orjson is used when installed (several times faster than the stdlib json
+module for both directions); otherwise the stdlib with compact separators
+produces the same bytes modulo float formatting.
+
+    python serialization.py [data_dir]   # size and throughput benchmark
+"""
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+FORMAT_VERSION = 2
+VERSION_KEY = "_v"
+RECORD_KEY = "record"
+
+# Responses at least this large are gzip-compressed for clients that accept it
+GZIP_MINIMUM_SIZE = 16 * 1024
+
+
+def dumps(obj: Any) -> bytes:
+    """Compact JSON bytes."""
+    if HAS_ORJSON:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data: bytes) -> Any:
+    if HAS_ORJSON:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps_record(record: Dict[str, Any]) -> bytes:
+    """Encode a stored record in the current format."""
+    return dumps({VERSION_KEY: FORMAT_VERSION, RECORD_KEY: record})
+
+
+def loads_record(data: bytes) -> Dict[str, Any]:
+    """Decode a stored record of any known format version."""
+    obj = loads(data)
+    version = obj.get(VERSION_KEY, 1) if isinstance(obj, dict) else None
+    if version == 1:
+        return obj
+    if version == FORMAT_VERSION:
+        return obj[RECORD_KEY]
+    raise ValueError(f"Unsupported record format version: {version!r}")
+
+
+def read_record(path: Path) -> Dict[str, Any]:
+    with open(path, "rb") as f:
+        return loads_record(f.read())
+
+
+def write_record(path: Path, record: Dict[str, Any]) -> None:
+    with open(path, "wb") as f:
+        f.write(dumps_record(record))
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson when available (numpy values included)."""
+
+    def render(self, content: Any) -> bytes:
+        if HAS_ORJSON:
+            return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+        return super().render(content)
+
+
+def benchmark(data_dir: Path, repeat: int = 20) -> Dict[str, Any]:
+    """Compare format 1 (indented stdlib JSON) with the current format on the stored documents."""
+    records = [read_record(p) for p in sorted(data_dir.glob("*.json"))]
+    if not records:
+        raise SystemExit(f"No documents in {data_dir}")
+
+    def measure(encode, decode) -> Dict[str, Any]:
+        blobs = [encode(r) for r in records]
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            blobs = [encode(r) for r in records]
+        t_enc = (time.perf_counter() - t0) / repeat
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            for b in blobs:
+                decode(b)
+        t_dec = (time.perf_counter() - t0) / repeat
+        return {
+            "bytes_per_record": round(sum(map(len, blobs)) / len(blobs), 1),
+            "encode_records_per_s": round(len(records) / t_enc),
+            "decode_records_per_s": round(len(records) / t_dec),
+        }
+
+    return {
+        "records": len(records),
+        "orjson": HAS_ORJSON,
+        # What main.py did before: json.dump(indent=2) / json.load
+        "format_1_indented_stdlib": measure(lambda r: json.dumps(r, indent=2).encode("utf-8"), json.loads),
+        f"format_{FORMAT_VERSION}": measure(dumps_record, loads_record),
+    }
+
+
+if __name__ == "__main__":
+    data_dir = Path(sys.argv[1]) if len(sys.argv) > 1 else Path(__file__).parent / "data"
+    print(json.dumps(benchmark(data_dir), indent=2))
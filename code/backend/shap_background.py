@@ -0,0 +1,254 @@
+"""
+Summarized SHAP backgrounds: fewer background rows, faster explanations.
+
+A permutation explanation scores every masked sample against every
+background row, so its cost grows linearly with the background size. The
+exported background (`shap_background.npy`) is reduced here to ``size``
+weighted rows:
+
+- ``kmeans``: k-means on standardized columns; each cluster is represented
+  by its medoid (a real row, so one-hot blocks stay valid) weighted by the
+  cluster's share of the background.
+- ``sample``: a uniform random sample with equal weights.
+
+Weights are honoured exactly: SHAP values are linear in the background
+distribution, so scaling each background row's model output by its weight
+gives the attributions of the weighted background. This needs the output of
+every background row, which `WeightedMasker` guarantees by opting out of
+shap's invariant-row and delta-masking shortcuts.
+Uniform weights keep shap's stock masker and its invariant-row shortcut.
+
+Summaries are deterministic for a given seed and cached per model version.
+`python shap_background.py` reports attribution error and latency for
+each background size on held-out rows.
+"""
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import shap
+
+METHODS = ("kmeans", "sample")
+# Chosen with `python shap_background.py`: about 4.5x faster than the full
+# 200-row background at ~16% attribution error (permutation noise alone is ~10%).
+# k-means is more accurate per row but loses shap's invariant-row shortcut.
+DEFAULT_METHOD = "sample"
+# Background rows used for explanations; 0 keeps the exported background as-is
+DEFAULT_SIZE = 50
+SEED = 0
+# Fixed permutation seed: repeated explanations of one row give identical values
+EXPLAINER_SEED = 0
+
+
+def summarize(
+    background: np.ndarray, size: int, method: str = DEFAULT_METHOD, seed: int = SEED
+) -> Tuple[np.ndarray, np.ndarray]:
+    """(rows, weights) summarizing `background` with at most `size` rows; weights sum to 1."""
+    background = np.asarray(background, dtype=float)
+    n = len(background)
+    if method not in METHODS:
+        raise ValueError(f"Unknown background method {method!r}; expected one of {', '.join(METHODS)}")
+    if size <= 0 or size >= n:
+        return background, np.full(n, 1.0 / n)
+
+    if method == "sample":
+        idx = np.sort(np.random.default_rng(seed).choice(n, size=size, replace=False))
+        return background[idx], np.full(size, 1.0 / size)
+
+    from sklearn.cluster import KMeans
+
+    # Standardize so that income does not outweigh every one-hot column
+    std = background.std(axis=0)
+    scaled = (background - background.mean(axis=0)) / np.where(std > 0, std, 1.0)
+    km = KMeans(n_clusters=size, n_init=4, random_state=seed).fit(scaled)
+    rows, weights = [], []
+    for cluster in range(size):
+        members = np.flatnonzero(km.labels_ == cluster)
+        if len(members) == 0:
+            continue
+        dist = ((scaled[members] - km.cluster_centers_[cluster]) ** 2).sum(axis=1)
+        rows.append(background[members[np.argmin(dist)]])
+        weights.append(len(members) / n)
+    return np.vstack(rows), np.asarray(weights)
+
+
+def cache_file(cache_dir: Path, version: str, size: int, method: str) -> Path:
+    safe = "".join(ch if ch.isalnum() else "_" for ch in version)
+    return cache_dir / f"shap_background_{safe}_{method}_{size}.npz"
+
+
+def load_or_summarize(
+    background: np.ndarray, size: int, method: str, cache_dir: Path, version: str
+) -> Tuple[np.ndarray, np.ndarray]:
+    """`summarize`, computed once per model version, method and size and kept in `cache_dir`."""
+    path = cache_file(cache_dir, version, size, method)
+    if path.exists():
+        try:
+            with np.load(path) as cached:
+                return cached["rows"], cached["weights"]
+        except Exception as e:
+            print(f"Ignoring unreadable background cache {path.name}: {e}")
+    rows, weights = summarize(background, size, method)
+    cache_dir.mkdir(exist_ok=True)
+    tmp = path.with_suffix(".tmp.npz")
+    np.savez(tmp, rows=rows, weights=weights)
+    tmp.replace(path)
+    return rows, weights
+
+
+class WeightedMasker(shap.maskers.Independent):
+    """Independent masker whose masked samples always reach the model as whole blocks of background rows."""
+
+    # Without `invariants` shap evaluates every row of each masked sample, in background order
+    invariants = None
+
+    def __init__(self, data: np.ndarray) -> None:
+        super().__init__(data, max_samples=len(data))
+        # Delta masking would skip rows it considers unchanged
+        self.supports_delta_masking = False
+
+
+def make_explainer(
+    predict_fn: Callable[[np.ndarray], np.ndarray],
+    rows: np.ndarray,
+    weights: np.ndarray,
+    seed: int = EXPLAINER_SEED,
+) -> shap.Explainer:
+    """Permutation explainer over the weighted background (rows, weights)."""
+    n = len(rows)
+    if np.allclose(weights, 1.0 / n):
+        masker = shap.maskers.Independent(rows, max_samples=n)
+        return shap.Explainer(predict_fn, masker, seed=seed)
+
+    # shap averages each masked sample's n outputs; scaling by n * w makes that the weighted mean
+    scale = (n * np.asarray(weights, dtype=float))[:, None]
+
+    def weighted_predict(X: np.ndarray) -> np.ndarray:
+        out = np.asarray(predict_fn(X), dtype=float)
+        if len(X) % n:
+            raise ValueError(f"Expected whole blocks of {n} background rows, got {len(X)} rows")
+        return (out.reshape(len(X) // n, n, -1) * scale).reshape(out.shape)
+
+    return shap.Explainer(weighted_predict, WeightedMasker(rows), seed=seed)
+
+
+def _attributions(explainer: shap.Explainer, X: np.ndarray) -> Tuple[np.ndarray, float]:
+    """SHAP values (rows, features, classes) and mean seconds per row."""
+    values, started = [], time.perf_counter()
+    for row in X:
+        values.append(np.asarray(explainer(row[None, :]).values)[0])
+    return np.stack(values), (time.perf_counter() - started) / len(X)
+
+
+def evaluate(
+    predict_fn: Callable[[np.ndarray], np.ndarray],
+    background: np.ndarray,
+    holdout: np.ndarray,
+    sizes: Sequence[int],
+    methods: Sequence[str] = METHODS,
+    top_k: int = 5,
+) -> Dict[str, Any]:
+    """
+    Attribution error and latency of each (method, size) against the full background.
+
+    Errors are over the predicted class of each held-out row: mean absolute
+    error, the same relative to the mean |attribution| of the reference, and
+    the overlap of the `top_k` features by |attribution|. The full background
+    explained with another permutation seed gives the sampling-noise floor.
+    """
+    uniform = np.full(len(background), 1.0 / len(background))
+    # Warm-up: shap compiles its numba kernels on first use
+    make_explainer(predict_fn, background[:2], np.full(2, 0.5))(holdout[:1])
+    reference, reference_latency = _attributions(make_explainer(predict_fn, background, uniform), holdout)
+    predicted = np.argmax(predict_fn(holdout), axis=1)
+    ref = reference[np.arange(len(holdout)), :, predicted]
+    ref_scale = float(np.abs(ref).mean()) or 1.0
+    ref_top = np.argsort(-np.abs(ref), axis=1)[:, :top_k]
+
+    def compare(method: str, values: np.ndarray, latency: float, size: int, summarize_s: float) -> Dict[str, Any]:
+        got = values[np.arange(len(holdout)), :, predicted]
+        err = np.abs(got - ref)
+        top = np.argsort(-np.abs(got), axis=1)[:, :top_k]
+        overlap = np.mean([len(set(a) & set(b)) / top_k for a, b in zip(top, ref_top)])
+        return {
+            "method": method,
+            "size": size,
+            "mae": float(err.mean()),
+            "relative_error": float(err.mean() / ref_scale),
+            "max_error": float(err.max()),
+            f"top{top_k}_overlap": float(overlap),
+            "latency_ms": latency * 1000,
+            "speedup": reference_latency / latency,
+            "summarize_ms": summarize_s * 1000,
+        }
+
+    values, latency = _attributions(make_explainer(predict_fn, background, uniform, seed=EXPLAINER_SEED + 1), holdout)
+    results: List[Dict[str, Any]] = [compare("noise", values, latency, len(background), 0.0)]
+    for method in methods:
+        for size in sizes:
+            if size >= len(background):
+                continue
+            started = time.perf_counter()
+            rows, weights = summarize(background, size, method)
+            summarize_s = time.perf_counter() - started
+            values, latency = _attributions(make_explainer(predict_fn, rows, weights), holdout)
+            results.append(compare(method, values, latency, len(rows), summarize_s))
+    return {
+        "background_rows": len(background),
+        "holdout_rows": len(holdout),
+        "reference_latency_ms": reference_latency * 1000,
+        "results": results,
+    }
+
+
+def _load_holdout(path: Optional[str], background: np.ndarray, rows: int, artifacts: Dict[str, Any]) -> Tuple[np.ndarray, np.ndarray, str]:
+    """(background, holdout, description): generated applicants if given, else a split of the background."""
+    if path:
+        import pandas as pd
+        import model_artifacts
+
+        df = pd.read_json(path, lines=path.endswith(".ndjson")).head(rows)
+        X = artifacts["preprocessor"].transform(model_artifacts.select_input_columns(artifacts["feature_meta"], df))
+        return background, np.asarray(X, dtype=float), f"{len(df)} rows of {path}"
+    idx = np.random.default_rng(SEED).permutation(len(background))
+    return background[idx[rows:]], background[idx[:rows]], f"{rows} background rows held out of the rest"
+
+
+def main() -> None:
+    import argparse
+    import xgboost as xgb
+    import model_artifacts
+
+    parser = argparse.ArgumentParser(description="Attribution error and latency per SHAP background size")
+    parser.add_argument("--model-dir", default=str(Path(__file__).parent / "data" / "model"))
+    parser.add_argument("--holdout", help="NDJSON/JSON applicants to explain (default: split off the background)")
+    parser.add_argument("--rows", type=int, default=10, help="held-out rows to explain")
+    parser.add_argument("--sizes", default="5,10,20,50", help="comma-separated background sizes")
+    parser.add_argument("--methods", default=",".join(METHODS))
+    args = parser.parse_args()
+
+    artifacts = model_artifacts.load_artifacts(Path(args.model_dir))
+    booster, background = artifacts["booster"], artifacts["shap_background"]
+
+    def predict_fn(X: np.ndarray) -> np.ndarray:
+        return booster.predict(xgb.DMatrix(X))
+
+    background, holdout, described = _load_holdout(args.holdout, background, args.rows, artifacts)
+    print(f"Reference: full background of {len(background)} rows; explaining {described}")
+    report = evaluate(
+        predict_fn, background, holdout,
+        sizes=[int(s) for s in args.sizes.split(",")],
+        methods=args.methods.split(","),
+    )
+    print(f"full background: {report['reference_latency_ms']:.0f} ms per explanation")
+    print(f"{'method':<8} {'size':>5} {'MAE':>9} {'rel.err':>8} {'max err':>9} {'top5':>6} {'ms/expl':>9} {'speedup':>8}")
+    for r in report["results"]:
+        print(
+            f"{r['method']:<8} {r['size']:>5} {r['mae']:>9.5f} {r['relative_error']:>8.1%} {r['max_error']:>9.5f} "
+            f"{r['top5_overlap']:>6.0%} {r['latency_ms']:>9.0f} {r['speedup']:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
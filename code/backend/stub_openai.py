@@ -0,0 +1,188 @@
+"""
+Local stand-in for the parts of AsyncOpenAI the extraction workflow uses.
+
+`StubOpenAI().chat.completions.create(...)` answers with a canned
+`extract_form_data` tool call. With ``stream=True`` the arguments arrive as
+deltas of ``delta_chars`` characters, ``delta_delay`` seconds apart, after
+``first_token_delay``; without it the whole response arrives after the same
+total time. Pacing is configurable so time-to-first-field can be measured
+without the API (see `python bench/extraction.py --help`), and the backend uses
+it instead of the API when started with OPENAI_STUB=1.
+
+`files.create(...)` / `files.delete(...)` stand in for the provider's file
+store: requests may reference an uploaded PDF by ``file_id`` and fail with
+a 404 for unknown IDs. `received_bytes` counts what reached the stub
+(uploaded files plus request bodies), to check transfer reports against.
+
+Like the API, the stub answers only the fields of the tool schema it is
+given, reports token usage (an estimate: ~4 characters per text token and
+`PAGE_TOKENS` per PDF page) and spends `page_delay` seconds per PDF page
+before the first token, so reduced schemas and page subsets show their
+savings.
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import re
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Dict, Optional
+
+FIRST_TOKEN_DELAY = 1.5
+DELTA_DELAY = 0.03
+DELTA_CHARS = 6
+PAGE_DELAY = 0.1
+# Roughly what a PDF page (text plus page image) costs as model input
+PAGE_TOKENS = 1000
+CHARS_PER_TOKEN = 4
+_PAGE = re.compile(rb"/Type\s*/Page(?![a-zA-Z])")
+
+# Shaped like real model output: every value a string, per the tool schema
+CANNED_ARGUMENTS: Dict[str, Any] = {
+    "gender": "f",
+    "age": "42",
+    "marital_status": "married",
+    "height_cm": "168",
+    "weight_kg": "64.5",
+    "bmi": "22.9",
+    "smoking": "false",
+    "packs_per_week": "",
+    "drug_use": "false",
+    "drug_frequency": "",
+    "drug_type": "",
+    "staying_abroad": "true",
+    "abroad_type": "safe",
+    "dangerous_sports": "false",
+    "sport_type": "",
+    "medical_issue": "true",
+    "medical_type": "warning",
+    "doctor_visits": "true",
+    "visit_type": "specialist",
+    "regular_medication": "true",
+    "medication_type": "safe",
+    "sports_activity_h_per_week": "3.5",
+    "earning_chf": "98000",
+    "birthdate": "1983-05-17",
+}
+
+
+class StubAPIError(Exception):
+    """Shaped like openai.APIStatusError: carries the HTTP status."""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(f"Error code: {status_code} - {message}")
+        self.status_code = status_code
+
+
+def _tool_call(arguments: str, first: bool) -> SimpleNamespace:
+    return SimpleNamespace(
+        index=0,
+        id="call_stub" if first else None,
+        type="function" if first else None,
+        function=SimpleNamespace(name="extract_form_data" if first else None, arguments=arguments),
+    )
+
+
+def _pages(pdf: bytes) -> int:
+    return max(1, len(_PAGE.findall(pdf)))
+
+
+class _Completions:
+    def __init__(self, stub: "StubOpenAI"):
+        self._stub = stub
+
+    def _pdf_pages(self, kwargs: Dict[str, Any]) -> int:
+        """Pages of the PDFs in the request; 404 for a file ID the stub does not have."""
+        pages = 0
+        for message in kwargs.get("messages", []):
+            for part in message["content"] if isinstance(message["content"], list) else []:
+                if part.get("type") != "file":
+                    continue
+                file = part["file"]
+                if "file_id" in file:
+                    if file["file_id"] not in self._stub.files.stored:
+                        raise StubAPIError(404, f"No such File object: {file['file_id']}")
+                    pages += _pages(self._stub.files.stored[file["file_id"]])
+                else:
+                    pages += _pages(base64.b64decode(file["file_data"].partition(",")[2]))
+        return pages
+
+    def _usage(self, kwargs: Dict[str, Any], pages: int, arguments: str) -> SimpleNamespace:
+        text = json.dumps(kwargs, separators=(",", ":"))
+        # The PDF is billed per page, not per character of its encoding
+        for match in re.findall(r'"file_data":"[^"]*"', text):
+            text = text.replace(match, "")
+        prompt = -(-len(text) // CHARS_PER_TOKEN) + pages * PAGE_TOKENS
+        completion = -(-len(arguments) // CHARS_PER_TOKEN)
+        return SimpleNamespace(prompt_tokens=prompt, completion_tokens=completion, total_tokens=prompt + completion)
+
+    async def create(self, stream: bool = False, **kwargs: Any):
+        self._stub.received_bytes += len(json.dumps(kwargs, separators=(",", ":")).encode())
+        pages = self._pdf_pages(kwargs)
+        # Answer the fields the tool schema asks for, like the model would
+        tools = kwargs.get("tools") or []
+        wanted = tools[0]["function"]["parameters"]["properties"] if tools else self._stub.arguments
+        arguments = json.dumps({k: v for k, v in self._stub.arguments.items() if k in wanted})
+        usage = self._usage(kwargs, pages, arguments)
+        prefill = self._stub.first_token_delay + pages * self._stub.page_delay
+        if stream:
+            include_usage = (kwargs.get("stream_options") or {}).get("include_usage", False)
+            return self._stream(arguments, prefill, usage if include_usage else None)
+        n_deltas = -(-len(arguments) // self._stub.delta_chars)
+        await asyncio.sleep(prefill + n_deltas * self._stub.delta_delay)
+        message = SimpleNamespace(role="assistant", content=None, tool_calls=[_tool_call(arguments, True)])
+        return SimpleNamespace(
+            choices=[SimpleNamespace(index=0, message=message, finish_reason="tool_calls")], usage=usage
+        )
+
+    async def _stream(self, arguments: str, prefill: float, usage: Optional[SimpleNamespace]) -> AsyncIterator[SimpleNamespace]:
+        stub = self._stub
+        await asyncio.sleep(prefill)
+        yield SimpleNamespace(choices=[SimpleNamespace(index=0, delta=SimpleNamespace(
+            role="assistant", content=None, tool_calls=[_tool_call("", True)]), finish_reason=None)])
+        for i in range(0, len(arguments), stub.delta_chars):
+            await asyncio.sleep(stub.delta_delay)
+            yield SimpleNamespace(choices=[SimpleNamespace(index=0, delta=SimpleNamespace(
+                role=None, content=None, tool_calls=[_tool_call(arguments[i:i + stub.delta_chars], False)]),
+                finish_reason=None)])
+        yield SimpleNamespace(choices=[SimpleNamespace(index=0, delta=SimpleNamespace(
+            role=None, content=None, tool_calls=None), finish_reason="tool_calls")])
+        if usage is not None:
+            yield SimpleNamespace(choices=[], usage=usage)
+
+
+class _Files:
+    def __init__(self, stub: "StubOpenAI"):
+        self._stub = stub
+        self.stored: Dict[str, bytes] = {}
+
+    async def create(self, file: Any, purpose: str, **kwargs: Any) -> SimpleNamespace:
+        filename, content = (file[0], file[1]) if isinstance(file, tuple) else ("upload", file)
+        self._stub.received_bytes += len(content)
+        file_id = "file-" + hashlib.sha256(content).hexdigest()[:24]
+        self.stored[file_id] = content
+        return SimpleNamespace(id=file_id, object="file", bytes=len(content), filename=filename, purpose=purpose)
+
+    async def delete(self, file_id: str) -> SimpleNamespace:
+        if self.stored.pop(file_id, None) is None:
+            raise StubAPIError(404, f"No such File object: {file_id}")
+        return SimpleNamespace(id=file_id, object="file", deleted=True)
+
+
+class StubOpenAI:
+    def __init__(
+        self,
+        first_token_delay: float = FIRST_TOKEN_DELAY,
+        delta_delay: float = DELTA_DELAY,
+        delta_chars: int = DELTA_CHARS,
+        arguments: Optional[Dict[str, Any]] = None,
+        page_delay: float = PAGE_DELAY,
+    ):
+        self.first_token_delay = first_token_delay
+        self.delta_delay = delta_delay
+        self.delta_chars = max(1, delta_chars)
+        self.page_delay = page_delay
+        self.arguments = CANNED_ARGUMENTS if arguments is None else arguments
+        self.received_bytes = 0
+        self.chat = SimpleNamespace(completions=_Completions(self))
+        self.files = _Files(self)
@@ -0,0 +1,47 @@
+"""Background work on an admission limiter yields to queued requests."""
+import asyncio
+
+from admission import Limiter
+
+
+def test_acquire_idle_waits_for_release_and_lets_queued_requests_go_first():
+    async def run():
+        limiter = Limiter("explain", concurrency=1, queue=4, timeout=5)
+        order = []
+        assert limiter.try_acquire()
+
+        async def background():
+            await limiter.acquire_idle()
+            order.append("background")
+            limiter.release()
+
+        async def request():
+            async with limiter.enter():
+                order.append("request")
+
+        worker = asyncio.create_task(background())
+        await asyncio.sleep(0)
+        queued = asyncio.create_task(request())
+        await asyncio.sleep(0)
+        assert order == [] and limiter.stats()["idle_waiters"] == 1
+
+        limiter.release()
+        await asyncio.gather(worker, queued)
+        assert order == ["request", "background"]
+        assert limiter.in_flight == 0 and limiter.stats()["idle_waiters"] == 0
+
+    asyncio.run(run())
+
+
+def test_cancelled_acquire_idle_leaves_no_waiter():
+    async def run():
+        limiter = Limiter("explain", concurrency=1, queue=4, timeout=5)
+        assert limiter.try_acquire()
+        worker = asyncio.create_task(limiter.acquire_idle())
+        await asyncio.sleep(0)
+        worker.cancel()
+        await asyncio.gather(worker, return_exceptions=True)
+        limiter.release()
+        assert limiter.in_flight == 0 and limiter.stats()["idle_waiters"] == 0
+
+    asyncio.run(run())
@@ -0,0 +1,130 @@
+"""Crash recovery of the mutation-log document store."""
+import random
+
+import pytest
+
+import document_store
+from document_store import DocumentStore, encode_record
+
+
+def _ops():
+    rng = random.Random(7)
+    ops = []
+    for i in range(300):
+        doc_id = f"doc-{rng.randrange(40)}"
+        kind = rng.choice(["put", "patch", "patch", "delete"])
+        if kind == "put":
+            ops.append(("put", {"id": doc_id, "filename": f"{doc_id}.pdf", "name": f"v{i}"}))
+        elif kind == "patch":
+            ops.append(("patch", doc_id, {"name": f"p{i}", "human_prediction": rng.choice(["Accepted", "Rejected"])}))
+        else:
+            ops.append(("delete", doc_id))
+    return ops
+
+
+OPS = _ops()
+
+
+def _expected_after(ops):
+    state = {}
+    for op in ops:
+        if op[0] == "put":
+            state[op[1]["id"]] = op[1]
+        elif op[0] == "patch" and op[1] in state:
+            state[op[1]] = {**state[op[1]], **op[2]}
+        elif op[0] == "delete":
+            state.pop(op[1], None)
+    return state
+
+
+EXPECTED = _expected_after(OPS)
+
+
+def _run(store, ops):
+    for op in ops:
+        if op[0] == "put":
+            store.put(op[1])
+        elif op[0] == "patch":
+            store.patch(op[1], op[2])
+        else:
+            store.delete(op[1])
+
+
+def _open(root, **kwargs):
+    store = DocumentStore(root, compact_after=kwargs.pop("compact_after", 10**9), **kwargs)
+    store.open()
+    return store
+
+
+def _reopened_state(root):
+    """(documents, recovery info) of a fresh store opened on `root`."""
+    store = DocumentStore(root, compact_after=10**9)
+    info = store.open()
+    state = {doc["id"]: doc for doc in store.iter_documents()}
+    store.close()
+    return state, info
+
+
+def test_crash_without_close_keeps_acknowledged_writes(tmp_path):
+    store = _open(tmp_path)
+    _run(store, OPS)
+    assert _reopened_state(tmp_path)[0] == EXPECTED
+
+
+def test_torn_tail_is_truncated(tmp_path):
+    store = _open(tmp_path)
+    _run(store, OPS)
+    store.close()
+    with open(store._segments()[-1], "ab") as f:
+        f.write(encode_record({"seq": 10**6, "ts": "", "op": "put", "id": "ghost", "doc": {"id": "ghost"}})[:-7])
+
+    state, info = _reopened_state(tmp_path)
+    assert state == EXPECTED
+    assert info["truncated_bytes"] > 0
+
+
+def test_crash_while_writing_snapshots(tmp_path, monkeypatch):
+    store = _open(tmp_path)
+    _run(store, OPS[:200])
+    real = document_store._write_atomic
+    calls = {"n": 0}
+
+    def failing(path, data):
+        calls["n"] += 1
+        if calls["n"] > 5:
+            raise OSError("simulated crash")
+        real(path, data)
+
+    # Fails before the checkpoint is written
+    monkeypatch.setattr(document_store, "_write_atomic", failing)
+    with pytest.raises(OSError):
+        store.compact()
+    monkeypatch.setattr(document_store, "_write_atomic", real)
+
+    _run(store, OPS[200:])
+    assert _reopened_state(tmp_path)[0] == EXPECTED
+    # A later compaction still writes what the failed one did not
+    store.compact()
+    assert _reopened_state(tmp_path)[0] == EXPECTED
+    assert {p.stem for p in tmp_path.glob("*.json")} == set(EXPECTED)
+
+
+def test_crash_before_retired_segments_are_deleted(tmp_path):
+    store = _open(tmp_path)
+    _run(store, OPS[:150])
+    segments = {p.name: p.read_bytes() for p in store._segments()}
+    store.compact()
+    for name, data in segments.items():
+        (store.log_dir / name).write_bytes(data)
+
+    _run(store, OPS[150:])
+    assert _reopened_state(tmp_path)[0] == EXPECTED
+
+
+def test_history_survives_compaction(tmp_path):
+    store = _open(tmp_path, compact_after=25)
+    _run(store, OPS)
+    store.compact()
+    logged = sum(1 for op in OPS if (op[1] if isinstance(op[1], str) else op[1]["id"]) == "doc-3")
+    assert 0 < len(store.history("doc-3")) <= logged
+    assert _reopened_state(tmp_path)[0] == EXPECTED
@@ -0,0 +1,29 @@
+"""Loading the model a training run left behind when it stopped mid-swap."""
+import json
+
+import model_artifacts
+
+
+def _write_model(path, version):
+    path.mkdir()
+    (path / model_artifacts.MANIFEST_FILE).write_text(json.dumps({"version": version}))
+
+
+def test_missing_model_dir_falls_back_to_the_newest_previous_model(tmp_path):
+    model_dir = tmp_path / "model"
+    _write_model(model_artifacts.previous_model_dir(model_dir, "20260101000000"), "older")
+    _write_model(model_artifacts.previous_model_dir(model_dir, "20260102000000"), "newer")
+
+    assert model_artifacts.load_artifacts(model_dir)["manifest"] == {"version": "newer"}
+
+
+def test_model_dir_wins_over_previous_models(tmp_path):
+    model_dir = tmp_path / "model"
+    _write_model(model_dir, "current")
+    _write_model(model_artifacts.previous_model_dir(model_dir, "20260101000000"), "older")
+
+    assert model_artifacts.load_artifacts(model_dir)["manifest"] == {"version": "current"}
+
+
+def test_no_model_at_all(tmp_path):
+    assert model_artifacts.load_artifacts(tmp_path / "model") == {}
@@ -0,0 +1,113 @@
+"""Provider file lifecycle of workflow_agent.PdfFiles against the stub client."""
+import asyncio
+import json
+
+from stub_openai import StubOpenAI
+from workflow_agent import PdfFiles
+
+PDF_A = b"%PDF-1.4 applicant a"
+PDF_B = b"%PDF-1.4 applicant b"
+
+
+def _files(tmp_path, **kwargs):
+    stub = StubOpenAI(first_token_delay=0, delta_delay=0, page_delay=0)
+    return stub, PdfFiles(stub, "file", tmp_path / "provider_files.json", **kwargs)
+
+
+def test_release_deletes_the_file_of_the_last_document(tmp_path):
+    async def run():
+        stub, files = _files(tmp_path)
+        file_id = await files.file_id(PDF_A)
+        files.attach("doc-1", PDF_A)
+        files.attach("doc-2", PDF_A)
+
+        # Another document still uses the same PDF
+        assert await files.release("doc-1") is None
+        assert file_id in stub.files.stored
+
+        assert await files.release("doc-2") == file_id
+        assert file_id not in stub.files.stored
+        index = json.loads((tmp_path / "provider_files.json").read_text())
+        assert index == {"files": {}, "documents": {}}
+
+    asyncio.run(run())
+
+
+def test_release_of_unknown_document_is_a_no_op(tmp_path):
+    async def run():
+        stub, files = _files(tmp_path)
+        file_id = await files.file_id(PDF_A)
+        assert await files.release("never-attached") is None
+        assert file_id in stub.files.stored
+
+    asyncio.run(run())
+
+
+def test_release_tolerates_files_already_gone(tmp_path):
+    async def run():
+        stub, files = _files(tmp_path)
+        file_id = await files.file_id(PDF_A)
+        files.attach("doc-1", PDF_A)
+        del stub.files.stored[file_id]
+        assert await files.release("doc-1") == file_id
+        assert files.stats()["files"] == 0
+
+    asyncio.run(run())
+
+
+def test_sweep_deletes_orphans_after_the_grace_period(tmp_path):
+    async def run():
+        stub, files = _files(tmp_path)
+        used = await files.file_id(PDF_A)
+        orphan = await files.file_id(PDF_B)
+        files.attach("doc-1", PDF_A)
+
+        # Too recent: an extraction may still be about to store its document
+        report = await files.sweep(lambda doc_id: True)
+        assert report["deleted_files"] == 0
+
+        for digest in list(files._uploaded_at):
+            files._uploaded_at[digest] -= files.ORPHAN_GRACE_S
+        report = await files.sweep(lambda doc_id: True)
+        assert report["deleted_files"] == 1
+        assert orphan not in stub.files.stored and used in stub.files.stored
+
+        # A document deleted behind the index's back leaves its file orphaned
+        report = await files.sweep(lambda doc_id: False)
+        assert report == {"forgotten_documents": 1, "deleted_files": 1, "files": 0}
+        assert stub.files.stored == {}
+
+    asyncio.run(run())
+
+
+def test_sweep_expires_files_in_use_after_max_age(tmp_path):
+    async def run():
+        stub, files = _files(tmp_path, max_age_s=60)
+        file_id = await files.file_id(PDF_A)
+        files.attach("doc-1", PDF_A)
+        files._uploaded_at[files._documents["doc-1"]] -= 61
+
+        assert (await files.sweep(lambda doc_id: True))["deleted_files"] == 1
+        assert file_id not in stub.files.stored
+        # The next extraction uploads the PDF again and the document attaches to the new file
+        assert await files.file_id(PDF_A) in stub.files.stored
+        assert files.stats()["documents"] == 0
+
+    asyncio.run(run())
+
+
+def test_index_survives_restarts_and_reads_the_old_format(tmp_path):
+    async def run():
+        stub, files = _files(tmp_path)
+        file_id = await files.file_id(PDF_A)
+        files.attach("doc-1", PDF_A)
+
+        reopened = PdfFiles(stub, "file", tmp_path / "provider_files.json")
+        assert await reopened.release("doc-1") == file_id
+
+        digest = "0" * 64
+        (tmp_path / "provider_files.json").write_text(json.dumps({digest: "file-old"}))
+        legacy = PdfFiles(stub, "file", tmp_path / "provider_files.json")
+        assert legacy.stats()["files"] == 1 and legacy.stats()["documents"] == 0
+
+    asyncio.run(run())
@@ -0,0 +1,97 @@
+"""Crash recovery and repacking of the tiered PDF store."""
+import time
+
+import pytest
+
+import pdf_store
+from pdf_store import PdfStore
+
+CORPUS = pdf_store._sample_pdfs(12)
+IDS = [f"doc-{i}" for i in range(len(CORPUS))]
+
+
+def _open(root):
+    store = PdfStore(root)
+    return store, store.open()
+
+
+def _packed(root, count=8):
+    """A store whose first `count` sample PDFs were compacted into a pack."""
+    store, _ = _open(root)
+    for doc_id, pdf in zip(IDS[:count], CORPUS[:count]):
+        store.hot_path(doc_id).write_bytes(pdf)
+    store.compact(lambda doc_id, age: True)
+    return store
+
+
+def _crash_before_indexing(root):
+    """Objects appended to the pack but not indexed, a torn tail, and the hot copies still there."""
+    store = _packed(root)
+    for doc_id, pdf in zip(IDS[8:], CORPUS[8:]):
+        store.hot_path(doc_id).write_bytes(pdf)
+    store._write_objects([(doc_id, pdf, time.time(), None) for doc_id, pdf in zip(IDS[8:], CORPUS[8:])])
+    with open(store._pack_path(store._pack_no), "ab") as f:
+        f.write(pdf_store.MAGIC + b"torn")
+    store.close()
+
+
+def test_crash_before_indexing_recovers_objects_and_truncates_the_torn_tail(tmp_path):
+    _crash_before_indexing(tmp_path)
+
+    store, recovery = _open(tmp_path)
+    assert recovery["recovered_objects"] == 4
+    assert recovery["truncated_bytes"] == 8
+    # The hot copies left by the crash are duplicates of indexed objects now
+    assert store.compact(lambda doc_id, age: True)["removed_duplicates"] == 4
+    assert [store.read(doc_id) for doc_id in IDS] == CORPUS
+    assert not any(store.hot_path(doc_id).exists() for doc_id in IDS)
+    store.close()
+
+
+def test_deleted_objects_stay_deleted_after_repack_and_reopen(tmp_path):
+    _crash_before_indexing(tmp_path)
+    store, _ = _open(tmp_path)
+    store.compact(lambda doc_id, age: True)
+    for doc_id in IDS[:9]:
+        assert store.delete(doc_id)
+    assert store.repack()["packs_rewritten"] >= 1
+    store.close()
+
+    store, recovery = _open(tmp_path)
+    assert recovery["objects"] == 3
+    assert recovery["recovered_objects"] == 0
+    assert all(store.read(doc_id) is None for doc_id in IDS[:9])
+    assert [store.read(doc_id) for doc_id in IDS[9:]] == CORPUS[9:]
+    store.close()
+
+
+@pytest.mark.parametrize("mapped_before", [False, True])
+def test_cold_read_racing_repack_finds_the_moved_object(tmp_path, mapped_before):
+    store = _packed(tmp_path)
+    for doc_id in IDS[:6]:
+        store.delete(doc_id)
+    doc_id, pdf = IDS[7], CORPUS[7]
+    if mapped_before:
+        bytes(store.cold_view(doc_id, store.cold_entry(doc_id)))
+        store._decompressed.clear()
+
+    # The reader took the entry, then repack moved the object and removed its pack
+    entry = store.cold_entry(doc_id)
+    assert store.repack()["objects_moved"] == 2
+    assert not store._pack_path(entry["pack"]).exists()
+
+    assert bytes(store.cold_view(doc_id, entry)) == pdf
+    store.close()
+
+
+def test_cold_read_of_an_object_deleted_during_repack_is_not_found(tmp_path):
+    store = _packed(tmp_path)
+    for doc_id in IDS[:6]:
+        store.delete(doc_id)
+    entry = store.cold_entry(IDS[7])
+    store.delete(IDS[7])
+    store.repack()
+
+    with pytest.raises(FileNotFoundError):
+        store.cold_view(IDS[7], entry)
+    store.close()
@@ -0,0 +1,106 @@
+"""Incremental parsing of streamed tool arguments and targeted re-extraction."""
+import asyncio
+import json
+
+import pytest
+
+import stub_openai
+from stub_openai import StubOpenAI
+from workflow_agent import (
+    IncrementalObjectParser,
+    extract_from_pdf_bytes,
+    low_confidence_fields,
+    reextract_fields,
+    stream_from_pdf_bytes,
+)
+
+PDF = b"%PDF-1.4 stub"
+ARGUMENTS = json.dumps({
+    "name": "Jane \"J\" Doe \\ 2nd",
+    "age": 42,
+    "ratio": -1.5e3,
+    "smoking": False,
+    "notes": None,
+    "visits": [{"type": "specialist", "dates": ["2024-01-02", "}"]}],
+    "address": {"city": "Zürich", "zip": "8001"},
+    "last": 7,
+}, ensure_ascii=False, indent=1)
+
+
+def _stub(arguments=None):
+    return StubOpenAI(first_token_delay=0, delta_delay=0, delta_chars=1, arguments=arguments, page_delay=0)
+
+
+def _feed_in_pieces(text, size):
+    parser = IncrementalObjectParser()
+    members = []
+    for i in range(0, len(text), size):
+        members.extend(parser.feed(text[i:i + size]))
+    return parser, members
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 16, 64, len(ARGUMENTS)])
+def test_parser_yields_every_member_whatever_the_chunking(size):
+    parser, members = _feed_in_pieces(ARGUMENTS, size)
+    assert parser.done
+    assert members == list(json.loads(ARGUMENTS).items())
+
+
+def test_parser_yields_members_as_soon_as_they_are_complete():
+    parser = IncrementalObjectParser()
+    assert parser.feed('{"a": "x') == []
+    assert parser.feed('y", "b": 12') == [("a", "xy")]
+    # A number is only complete at the delimiter that follows it
+    assert parser.feed("3") == []
+    assert parser.feed("}") == [("b", 123)]
+    assert parser.done
+
+
+def test_parser_rejects_arguments_that_are_not_an_object():
+    with pytest.raises(ValueError):
+        IncrementalObjectParser().feed('["a"]')
+
+
+def test_streaming_matches_buffered_extraction():
+    async def run():
+        client = _stub()
+        buffered = await extract_from_pdf_bytes(client, PDF)
+        streamed = {key: value async for key, value in stream_from_pdf_bytes(client, PDF)}
+        return buffered, streamed
+
+    buffered, streamed = asyncio.run(run())
+    assert streamed == buffered
+    assert len(streamed) == len(stub_openai.CANNED_ARGUMENTS)
+
+
+def test_reextraction_asks_only_for_low_confidence_fields():
+    first_pass = {
+        **stub_openai.CANNED_ARGUMENTS,
+        "height_cm": "",
+        "medication_type": "unknown",
+        "earning_chf": "unknown",
+        "gender": "x",
+    }
+
+    async def run():
+        fields = await extract_from_pdf_bytes(_stub(first_pass), PDF)
+        low = low_confidence_fields(fields)
+
+        client = _stub()
+        requested = []
+        create = client.chat.completions.create
+
+        async def recording_create(**kwargs):
+            requested.append(sorted(kwargs["tools"][0]["function"]["parameters"]["properties"]))
+            return await create(**kwargs)
+
+        client.chat.completions.create = recording_create
+        report = {}
+        values = await reextract_fields(client, PDF, low, report=report)
+        return low, requested, values, {**fields, **values}
+
+    low, requested, values, merged = asyncio.run(run())
+    assert sorted(low) == ["earning_chf", "gender", "height_cm", "medication_type"]
+    assert requested == [sorted(low)]
+    assert sorted(values) == sorted(low)
+    assert low_confidence_fields(merged) == []
@@ -0,0 +1,69 @@
+"""
+Small first-page previews of uploaded documents.
+
+Rendering uses pypdfium2 when it is installed. Without it, a scanned PDF's
+first page is usually a single embedded image, which PyPDF2 can extract;
+image uploads are thumbnailed from the original image directly.
+"""
+import io
+from typing import Optional
+
+try:
+    from PIL import Image
+    HAS_PIL = True
+except ImportError:
+    HAS_PIL = False
+
+try:
+    import pypdfium2 as pdfium
+    HAS_PDFIUM = True
+except ImportError:
+    HAS_PDFIUM = False
+
+try:
+    from PyPDF2 import PdfReader
+    HAS_PYPDF2 = True
+except ImportError:
+    HAS_PYPDF2 = False
+
+THUMBNAIL_WIDTH = 240
+JPEG_QUALITY = 80
+
+
+def _first_page_image(pdf_bytes: bytes) -> Optional["Image.Image"]:
+    if HAS_PDFIUM:
+        pdf = pdfium.PdfDocument(pdf_bytes)
+        try:
+            page = pdf[0]
+            # Render at just the scale needed for the thumbnail width
+            scale = THUMBNAIL_WIDTH / max(page.get_width(), 1)
+            return page.render(scale=max(scale, 0.05)).to_pil()
+        finally:
+            pdf.close()
+    if HAS_PYPDF2:
+        page = PdfReader(io.BytesIO(pdf_bytes)).pages[0]
+        images = list(page.images)
+        if images:
+            largest = max(images, key=lambda im: len(im.data))
+            return Image.open(io.BytesIO(largest.data))
+    return None
+
+
+def render_thumbnail(pdf_bytes: Optional[bytes] = None, image_bytes: Optional[bytes] = None) -> Optional[bytes]:
+    """JPEG thumbnail of an uploaded image, else of the PDF's first page; None if no renderer can read it."""
+    if not HAS_PIL:
+        return None
+    if image_bytes is not None:
+        img = Image.open(io.BytesIO(image_bytes))
+    elif pdf_bytes is not None:
+        img = _first_page_image(pdf_bytes)
+    else:
+        img = None
+    if img is None:
+        return None
+
+    img = img.convert("RGB")
+    img.thumbnail((THUMBNAIL_WIDTH, THUMBNAIL_WIDTH * 4))
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+    return out.getvalue()
@@ -2,39 +2,25 @@
 Agent-based PDF extraction workflow using OpenAI SDK.
 Replicates the TypeScript agent workflow for extracting insurance form data from PDFs.
 """
+import asyncio
+import base64
+import hashlib
 import json
-from typing import Dict, Any
+import re
+import time
+from pathlib import Path
+from typing import Dict, Any, AsyncIterator, Callable, List, Optional, Tuple
 from openai import AsyncOpenAI
-from pydantic import BaseModel, Field
-from typing import Optional
-
-
-class FormDataSchema(BaseModel):
-	"""Schema for the extracted form data matching the agent's output schema."""
-	gender: Optional[str] = Field(None, description="Gender: 'm', 'f', or 'other'")
-	age: Optional[str] = Field(None, description="Age in years")
-	marital_status: Optional[str] = Field(None, description="Marital status: 'single', 'married', 'divorced', 'widowed'")
-	height_cm: Optional[str] = Field(None, description="Height in centimeters")
-	weight_kg: Optional[str] = Field(None, description="Weight in kilograms")
-	bmi: Optional[str] = Field(None, description="BMI (Body Mass Index)")
-	smoking: Optional[str] = Field(None, description="Smoking status: 'true' or 'false'")
-	packs_per_week: Optional[str] = Field(None, description="Number of cigarette packs per week")
-	drug_use: Optional[str] = Field(None, description="Drug use: 'true' or 'false'")
-	drug_frequency: Optional[str] = Field(None, description="Frequency of drug use")
-	drug_type: Optional[str] = Field(None, description="Drug risk type: 'safe', 'warning', 'danger', 'unknown'")
-	staying_abroad: Optional[str] = Field(None, description="Staying abroad: 'true' or 'false'")
-	abroad_type: Optional[str] = Field(None, description="Abroad risk type: 'safe', 'warning', 'danger', 'unknown'")
-	dangerous_sports: Optional[str] = Field(None, description="Dangerous sports: 'true' or 'false'")
-	sport_type: Optional[str] = Field(None, description="Sport risk type: 'safe', 'warning', 'danger', 'unknown'")
-	medical_issue: Optional[str] = Field(None, description="Medical issues: 'true' or 'false'")
-	medical_type: Optional[str] = Field(None, description="Medical risk type: 'safe', 'warning', 'danger', 'unknown'")
-	doctor_visits: Optional[str] = Field(None, description="Doctor visits: 'true' or 'false'")
-	visit_type: Optional[str] = Field(None, description="Visit type: 'physician', 'specialist', 'hospital'")
-	regular_medication: Optional[str] = Field(None, description="Regular medication: 'true' or 'false'")
-	medication_type: Optional[str] = Field(None, description="Medication risk type: 'safe', 'warning', 'danger', 'unknown'")
-	sports_activity_h_per_week: Optional[str] = Field(None, description="Sports activity hours per week")
-	earning_chf: Optional[str] = Field(None, description="Annual earning in CHF")
-	birthdate: Optional[str] = Field(None, description="Birthdate in YYYY-MM-DD format")
+import applicant_schema
+try:
+	from PyPDF2 import PdfReader, PdfWriter
+	HAS_PYPDF2 = True
+except ImportError:
+	HAS_PYPDF2 = False
+
+
+# Generated from the applicant schema (see applicant_schema.py)
+FormDataSchema = applicant_schema.form_data_model()
 
 
 AGENT_INSTRUCTIONS = """You are an expert data extractor. 
@@ -66,62 +52,102 @@ Now, read the provided PDF content and call the function `extract_form_data` wit
 """
 
 
-async def run_extraction_agent(client: AsyncOpenAI, pdf_base64: str) -> Dict[str, Any]:
-	"""
-	Run the extraction agent to extract form data from PDF text.
-	
-	Args:
-		client: AsyncOpenAI client instance
-		pdf_text: Extracted text content from the PDF
-		
-	Returns:
-		Dict containing the extracted form data
-	"""
-	
-	# Define the function schema for structured output
-	tools = [
-		{
-			"type": "function",
-			"function": {
-				"name": "extract_form_data",
-				"description": "Extract structured insurance form data from the PDF content",
-				"parameters": {
-					"type": "object",
-					"properties": {
-						"gender": {"type": "string", "description": "Gender: 'm', 'f', or 'other'"},
-						"age": {"type": "string", "description": "Age in years"},
-						"marital_status": {"type": "string", "description": "Marital status: 'single', 'married', 'divorced', 'widowed'"},
-						"height_cm": {"type": "string", "description": "Height in centimeters"},
-						"weight_kg": {"type": "string", "description": "Weight in kilograms"},
-						"bmi": {"type": "string", "description": "BMI (Body Mass Index)"},
-						"smoking": {"type": "string", "description": "Smoking status: 'true' or 'false'"},
-						"packs_per_week": {"type": "string", "description": "Number of cigarette packs per week"},
-						"drug_use": {"type": "string", "description": "Drug use: 'true' or 'false'"},
-						"drug_frequency": {"type": "string", "description": "Frequency of drug use"},
-						"drug_type": {"type": "string", "description": "Drug risk type: 'safe', 'warning', 'danger', 'unknown'"},
-						"staying_abroad": {"type": "string", "description": "Staying abroad: 'true' or 'false'"},
-						"abroad_type": {"type": "string", "description": "Abroad risk type: 'safe', 'warning', 'danger', 'unknown'"},
-						"dangerous_sports": {"type": "string", "description": "Dangerous sports: 'true' or 'false'"},
-						"sport_type": {"type": "string", "description": "Sport risk type: 'safe', 'warning', 'danger', 'unknown'"},
-						"medical_issue": {"type": "string", "description": "Medical issues: 'true' or 'false'"},
-						"medical_type": {"type": "string", "description": "Medical risk type: 'safe', 'warning', 'danger', 'unknown'"},
-						"doctor_visits": {"type": "string", "description": "Doctor visits: 'true' or 'false'"},
-						"visit_type": {"type": "string", "description": "Visit type: 'physician', 'specialist', 'hospital'"},
-						"regular_medication": {"type": "string", "description": "Regular medication: 'true' or 'false'"},
-						"medication_type": {"type": "string", "description": "Medication risk type: 'safe', 'warning', 'danger', 'unknown'"},
-						"sports_activity_h_per_week": {"type": "string", "description": "Sports activity hours per week"},
-						"earning_chf": {"type": "string", "description": "Annual earning in CHF"},
-						"birthdate": {"type": "string", "description": "Birthdate in YYYY-MM-DD format"}
-					},
-					"required": []  # All fields are optional
-				}
+# Function schema for structured output
+EXTRACTION_TOOLS = [
+	{
+		"type": "function",
+		"function": {
+			"name": "extract_form_data",
+			"description": "Extract structured insurance form data from the PDF content",
+			"parameters": {
+				"type": "object",
+				"properties": applicant_schema.tool_properties(),
+				"required": []  # All fields are optional
 			}
 		}
-	]
-	print(f"PDF text length: {len(pdf_base64)} characters")
-	print(f"First 500 chars: {pdf_base64[:50]}")
-	# Create the chat completion with function calling
-	response = await client.chat.completions.create(
+	}
+]
+
+
+NUMERIC_FIELDS = applicant_schema.NUMERIC_FIELDS
+normalize_field = applicant_schema.normalize_field
+
+EXTRACTION_FIELDS = applicant_schema.FIELD_NAMES
+BOOLEAN_FIELDS = applicant_schema.BOOLEAN_FIELDS
+FIELD_CHOICES = applicant_schema.FIELD_CHOICES
+FIELD_RANGES = applicant_schema.FIELD_RANGES
+GATED_BY = applicant_schema.GATED_BY
+_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+CONFIDENT = 1.0
+IMPLAUSIBLE = 0.5
+UNKNOWN = 0.2
+MISSING = 0.0
+
+
+def field_confidence(key: str, value: Any, fields: Dict[str, Any]) -> float:
+	"""
+	Confidence in one normalized extracted value, from what the value looks
+	like: missing (0), "unknown" (0.2), outside its type, choices or plausible
+	range (0.5), else 1. A detail field whose yes/no field is false is not
+	applicable and counts as confident when empty.
+	"""
+	gate = GATED_BY.get(key)
+	if gate and fields.get(gate) is False and value in (None, "", "unknown"):
+		return CONFIDENT
+	if value is None or value == "":
+		return MISSING
+	if value == "unknown":
+		return UNKNOWN
+	if key in BOOLEAN_FIELDS:
+		return CONFIDENT if isinstance(value, bool) else IMPLAUSIBLE
+	if key in FIELD_CHOICES:
+		return CONFIDENT if value in FIELD_CHOICES[key] else IMPLAUSIBLE
+	if key in FIELD_RANGES:
+		low, high = FIELD_RANGES[key]
+		ok = isinstance(value, (int, float)) and not isinstance(value, bool) and low <= value <= high
+		return CONFIDENT if ok else IMPLAUSIBLE
+	if key == "birthdate":
+		return CONFIDENT if isinstance(value, str) and _DATE.match(value) else IMPLAUSIBLE
+	return CONFIDENT
+
+
+def extraction_confidence(fields: Dict[str, Any]) -> Dict[str, float]:
+	"""Confidence per extraction field (see field_confidence)."""
+	return {key: field_confidence(key, fields.get(key), fields) for key in EXTRACTION_FIELDS}
+
+
+def low_confidence_fields(fields: Dict[str, Any], threshold: float = CONFIDENT) -> List[str]:
+	"""Extraction fields whose confidence is below `threshold` (by default: not fully confident)."""
+	return [key for key, confidence in extraction_confidence(fields).items() if confidence < threshold]
+
+
+def extraction_tools(fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+	"""The extraction tool schema, reduced to `fields` if given."""
+	if fields is None:
+		return EXTRACTION_TOOLS
+	unknown = [key for key in fields if key not in EXTRACTION_FIELDS]
+	if unknown:
+		raise ValueError(f"Unknown extraction fields: {', '.join(unknown)}")
+	function = EXTRACTION_TOOLS[0]["function"]
+	properties = function["parameters"]["properties"]
+	parameters = {**function["parameters"], "properties": {key: properties[key] for key in fields}}
+	return [{"type": "function", "function": {**function, "parameters": parameters}}]
+
+
+def _extraction_request(file: Dict[str, str], fields: Optional[List[str]] = None) -> Dict[str, Any]:
+	"""
+	Arguments of the chat completion call (shared by the buffered and streaming modes).
+	`file` is the PDF's content part: {"file_id": ...} or {"filename": ..., "file_data": <data URL>}.
+	With `fields`, only those fields are asked for (targeted re-extraction).
+	"""
+	text = "Extract the form data from this PDF content."
+	if fields is not None:
+		text = (
+			f"Extract only these fields from this PDF content: {', '.join(fields)}. "
+			"An earlier pass left them empty, unknown or implausible; read the relevant parts carefully."
+		)
+	return dict(
 		model="gpt-5-chat-latest",
 		messages=[
 			{"role": "system", "content": AGENT_INSTRUCTIONS},
@@ -129,25 +155,306 @@ async def run_extraction_agent(client: AsyncOpenAI, pdf_base64: str) -> Dict[str
 				"role": "user",
 				"content": [
 					{
-         				"type": "text",
-						"text": "Extract the form data from this PDF content."
+						"type": "text",
+						"text": text
 					},
 					{
 						"type": "file",
-						"file": {
-							"filename": "eqwdw.pdf",
-							"file_data": f"data:application/pdf;base64,{pdf_base64}",
-						}
+						"file": file,
 					}
 				]
 			}
 		],
-		tools=tools,
+		tools=extraction_tools(fields),
 		tool_choice={"type": "function", "function": {"name": "extract_form_data"}},
 		temperature=1.03,
 		top_p=1,
 		max_tokens=5433
 	)
+
+
+def inline_file(pdf_content: bytes) -> Dict[str, str]:
+	"""Content part carrying the whole PDF as a base64 data URL (encoded once, straight into the URL)."""
+	return {
+		"filename": "eqwdw.pdf",
+		"file_data": "data:application/pdf;base64," + base64.b64encode(pdf_content).decode("ascii"),
+	}
+
+
+def _json_bytes(value: Any) -> int:
+	"""Size of `value` as the JSON the SDK sends."""
+	return len(json.dumps(value, separators=(",", ":")).encode())
+
+
+def _new_report(pdf_content: bytes) -> Dict[str, Any]:
+	return {
+		"mode": None, "file_id": None, "pdf_bytes": len(pdf_content), "uploaded_bytes": 0, "request_bytes": 0,
+		"bytes_sent": 0, "calls": 0, "prompt_tokens": None, "completion_tokens": None, "latency_s": None,
+	}
+
+
+def _count_request(report: Optional[Dict[str, Any]], request: Dict[str, Any]) -> None:
+	if report is not None:
+		report["request_bytes"] += _json_bytes(request)
+		report["bytes_sent"] = report["uploaded_bytes"] + report["request_bytes"]
+		report["calls"] += 1
+
+
+def _count_usage(report: Optional[Dict[str, Any]], usage: Any) -> None:
+	"""Add a response's token usage to the report (left None if the provider reports none)."""
+	if report is None or usage is None:
+		return
+	report["prompt_tokens"] = (report["prompt_tokens"] or 0) + usage.prompt_tokens
+	report["completion_tokens"] = (report["completion_tokens"] or 0) + usage.completion_tokens
+
+
+class PdfFiles:
+	"""
+	PDFs uploaded once to the provider's file store and referenced by file ID.
+
+	Uploads are keyed by the SHA-256 of the PDF, so retries, re-extractions
+	and duplicate uploads of the same document send only a file ID instead
+	of the base64 PDF (+33%) in every request. Concurrent requests for one
+	PDF share a single upload. With `index_path` the hash -> file ID index
+	survives restarts; a file the provider no longer has is uploaded again.
+
+	The PDFs hold applicants' health data, so they are not left with the
+	provider: documents `attach()` the file of their PDF and `release()` it
+	when deleted, which deletes the file once no document uses it. `sweep()`
+	deletes files no document uses (after `ORPHAN_GRACE_S`, e.g. of failed
+	uploads) and, with `max_age_s`, every file older than that.
+
+	Modes: ``file`` always references uploaded files (upload errors are
+	raised); ``inline`` always sends data URLs; ``auto`` uses the file store
+	and falls back to inline data for `RETRY_AFTER_S` seconds after a failed
+	upload (e.g. a provider or key without the files API).
+	"""
+
+	MODES = ("auto", "file", "inline")
+	RETRY_AFTER_S = 300.0
+	# Files no document uses are kept this long, so an extraction in progress can store its document
+	ORPHAN_GRACE_S = 3600.0
+	PURPOSE = "user_data"
+
+	def __init__(self, client: Any, mode: str = "auto", index_path: Optional[Path] = None,
+			max_age_s: Optional[float] = None) -> None:
+		if mode not in self.MODES:
+			raise ValueError(f"Unknown file mode {mode!r}; expected one of {', '.join(self.MODES)}")
+		self.client = client
+		self.mode = mode
+		self.index_path = index_path
+		self.max_age_s = max_age_s
+		# sha256 -> file ID, sha256 -> upload time (epoch seconds), doc_id -> sha256
+		self._ids: Dict[str, str] = {}
+		self._uploaded_at: Dict[str, float] = {}
+		self._documents: Dict[str, str] = {}
+		self._uploads: Dict[str, asyncio.Future] = {}
+		self._unavailable_until = 0.0
+		self.counters = {"extractions": 0, "uploads": 0, "reused": 0, "inline": 0, "upload_failures": 0, "stale": 0,
+			"deleted": 0, "delete_failures": 0, "bytes_sent": 0, "inline_bytes": 0}
+		if index_path is not None and index_path.exists():
+			try:
+				self._load_index(json.loads(index_path.read_text()))
+			except (OSError, ValueError, AttributeError, KeyError, TypeError) as e:
+				print(f"Ignoring unreadable file index {index_path.name}: {e}")
+
+	def _load_index(self, index: Dict[str, Any]) -> None:
+		now = time.time()
+		if "files" not in index:
+			# Older index: {sha256: file ID}, no upload times or documents (the files count as orphans)
+			index = {"files": {digest: {"file_id": fid} for digest, fid in index.items()}, "documents": {}}
+		for digest, entry in index["files"].items():
+			self._ids[digest] = entry["file_id"]
+			self._uploaded_at[digest] = entry.get("uploaded_at", now)
+		self._documents = {doc_id: digest for doc_id, digest in index["documents"].items() if digest in self._ids}
+
+	def _save_index(self) -> None:
+		if self.index_path is None:
+			return
+		index = {
+			"files": {digest: {"file_id": fid, "uploaded_at": self._uploaded_at.get(digest)} for digest, fid in self._ids.items()},
+			"documents": self._documents,
+		}
+		self.index_path.parent.mkdir(parents=True, exist_ok=True)
+		tmp = self.index_path.with_suffix(".tmp")
+		tmp.write_text(json.dumps(index))
+		tmp.replace(self.index_path)
+
+	def _drop(self, digest: str) -> None:
+		"""Forget the file of `digest` and the documents using it (they attach again after a new upload)."""
+		self._ids.pop(digest, None)
+		self._uploaded_at.pop(digest, None)
+		self._documents = {doc_id: d for doc_id, d in self._documents.items() if d != digest}
+
+	async def _upload(self, digest: str, pdf_content: bytes) -> str:
+		uploaded = await self.client.files.create(
+			file=(f"{digest[:16]}.pdf", pdf_content, "application/pdf"), purpose=self.PURPOSE
+		)
+		self._ids[digest] = uploaded.id
+		self._uploaded_at[digest] = time.time()
+		self._save_index()
+		self.counters["uploads"] += 1
+		return uploaded.id
+
+	async def file_id(self, pdf_content: bytes, report: Optional[Dict[str, Any]] = None) -> str:
+		"""File ID of `pdf_content`, uploading it unless it was uploaded before."""
+		digest = hashlib.sha256(pdf_content).hexdigest()
+		if digest in self._ids:
+			self.counters["reused"] += 1
+			return self._ids[digest]
+		pending = self._uploads.get(digest)
+		uploading = pending is None
+		if uploading:
+			pending = self._uploads[digest] = asyncio.ensure_future(self._upload(digest, pdf_content))
+			pending.add_done_callback(lambda _: self._uploads.pop(digest, None))
+		else:
+			self.counters["reused"] += 1
+		file_id = await asyncio.shield(pending)
+		if uploading and report is not None:
+			report["uploaded_bytes"] += len(pdf_content)
+		return file_id
+
+	async def file_part(self, pdf_content: bytes, report: Optional[Dict[str, Any]] = None) -> Dict[str, str]:
+		"""The content part referencing `pdf_content`: by file ID where possible, else inline."""
+		if self.mode == "file" or (self.mode == "auto" and time.monotonic() >= self._unavailable_until):
+			try:
+				file = {"file_id": await self.file_id(pdf_content, report)}
+				if report is not None:
+					report.update(mode="file", file_id=file["file_id"])
+				return file
+			except Exception as e:
+				self.counters["upload_failures"] += 1
+				if self.mode == "file":
+					raise
+				self._unavailable_until = time.monotonic() + self.RETRY_AFTER_S
+				print(f"File upload failed, sending PDFs inline for {self.RETRY_AFTER_S:.0f}s: {e}")
+		self.counters["inline"] += 1
+		if report is not None:
+			report.update(mode="inline", file_id=None)
+		return inline_file(pdf_content)
+
+	def forget(self, file_id: str) -> None:
+		"""Drop a file ID the provider no longer knows, so its PDF is uploaded again."""
+		self.counters["stale"] += 1
+		for digest in [digest for digest, fid in self._ids.items() if fid == file_id]:
+			self._drop(digest)
+		self._save_index()
+
+	def attach(self, doc_id: str, pdf_content: bytes) -> None:
+		"""Record that document `doc_id` uses the uploaded file of `pdf_content` (if there is one)."""
+		digest = hashlib.sha256(pdf_content).hexdigest()
+		if digest in self._ids and self._documents.get(doc_id) != digest:
+			self._documents[doc_id] = digest
+			self._save_index()
+
+	async def release(self, doc_id: str) -> Optional[str]:
+		"""Document `doc_id` was deleted: delete its file unless another document uses it. Returns the deleted file ID."""
+		digest = self._documents.pop(doc_id, None)
+		if digest is None:
+			return None
+		self._save_index()
+		if digest in self._documents.values():
+			return None
+		return await self._delete(digest)
+
+	async def _delete(self, digest: str) -> Optional[str]:
+		file_id = self._ids.get(digest)
+		if file_id is None:
+			return None
+		try:
+			await self.client.files.delete(file_id)
+		except Exception as e:
+			# Already gone is fine; otherwise keep the entry so that the next sweep retries
+			if getattr(e, "status_code", None) != 404:
+				self.counters["delete_failures"] += 1
+				print(f"Could not delete provider file {file_id}: {e}")
+				return None
+		self._drop(digest)
+		self._save_index()
+		self.counters["deleted"] += 1
+		return file_id
+
+	async def sweep(self, is_live: Callable[[str], bool]) -> Dict[str, int]:
+		"""
+		Forget documents for which `is_live(doc_id)` is false, then delete the
+		files no document uses (uploaded more than ORPHAN_GRACE_S ago) and,
+		with `max_age_s`, the files uploaded longer ago than that.
+		"""
+		now = time.time()
+		gone = [doc_id for doc_id in self._documents if not is_live(doc_id)]
+		for doc_id in gone:
+			del self._documents[doc_id]
+		if gone:
+			self._save_index()
+		used = set(self._documents.values())
+		due = []
+		for digest in self._ids:
+			age = now - self._uploaded_at.get(digest, now)
+			orphaned = digest not in used and age >= self.ORPHAN_GRACE_S
+			if orphaned or (self.max_age_s is not None and age >= self.max_age_s):
+				due.append(digest)
+		deleted = 0
+		for digest in due:
+			if await self._delete(digest) is not None:
+				deleted += 1
+		return {"forgotten_documents": len(gone), "deleted_files": deleted, "files": len(self._ids)}
+
+	def record(self, report: Dict[str, Any]) -> None:
+		"""Add one extraction's transfer report to the totals."""
+		self.counters["extractions"] += 1
+		self.counters["bytes_sent"] += report["bytes_sent"]
+		# What the same calls would have sent inline: the data URL instead of the reference, per call
+		inline_part = _json_bytes(inline_file(b"")) + -(-report["pdf_bytes"] // 3) * 4
+		ref_part = _json_bytes({"file_id": report["file_id"]}) if report["file_id"] else inline_part
+		self.counters["inline_bytes"] += report["request_bytes"] + report["calls"] * (inline_part - ref_part)
+
+	def stats(self) -> Dict[str, Any]:
+		return {
+			"mode": self.mode,
+			"files": len(self._ids),
+			"documents": len(self._documents),
+			"max_age_s": self.max_age_s,
+			"inline_fallback_s": max(0.0, round(self._unavailable_until - time.monotonic(), 1)),
+			**self.counters,
+		}
+
+
+async def _pdf_file(client: Any, pdf_content: bytes, files: Optional[PdfFiles], report: Optional[Dict[str, Any]]) -> Dict[str, str]:
+	if files is None:
+		if report is not None:
+			report.update(mode="inline", file_id=None)
+		return inline_file(pdf_content)
+	return await files.file_part(pdf_content, report)
+
+
+def _stale_reference(file: Dict[str, str], error: Exception) -> bool:
+	"""Whether a request failed because the provider no longer has the referenced file."""
+	return "file_id" in file and getattr(error, "status_code", None) in (400, 404) and file["file_id"] in str(error)
+
+
+async def run_extraction_agent(
+	client: AsyncOpenAI,
+	file: Dict[str, str],
+	report: Optional[Dict[str, Any]] = None,
+	fields: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+	"""
+	Run the extraction agent to extract form data from a PDF.
+	
+	Args:
+		client: AsyncOpenAI client instance
+		file: The PDF's content part (see _extraction_request)
+		report: Transfer report to add the request's size and token usage to
+		fields: Only extract these fields (default: all)
+		
+	Returns:
+		Dict containing the extracted form data
+	"""
+	request = _extraction_request(file, fields)
+	_count_request(report, request)
+	# Create the chat completion with function calling
+	response = await client.chat.completions.create(**request)
+	_count_usage(report, getattr(response, "usage", None))
 	# Extract the function call result
 	message = response.choices[0].message
 	
@@ -156,47 +463,307 @@ async def run_extraction_agent(client: AsyncOpenAI, pdf_base64: str) -> Dict[str
 		arguments = json.loads(function_call.arguments)
 		
 		# Convert string booleans to actual booleans for our backend
-		result = {}
-		for key, value in arguments.items():
-			if value in ["true", "false"]:
-				result[key] = value == "true"
-			elif value == "":
-				result[key] = None
-			elif value == "unknown":
-				result[key] = "unknown"
-			else:
-				# Try to convert numeric strings to numbers
-				if key in ["age", "height_cm", "weight_kg", "bmi", "packs_per_week", 
-						"drug_frequency", "sports_activity_h_per_week", "earning_chf"]:
-					try:
-						if "." in str(value):
-							result[key] = float(value)
-						else:
-							result[key] = int(value)
-					except (ValueError, TypeError):
-						result[key] = value
-				else:
-					result[key] = value
-		
-		return result
+		return applicant_schema.normalize_fields(arguments)
 	
 	# If no function call, return empty dict
 	return {}
 
 
-async def extract_from_pdf_bytes(client: AsyncOpenAI, pdf_content: bytes) -> Dict[str, Any]:
+class IncrementalObjectParser:
+	"""
+	Incremental parser for a JSON object arriving in arbitrary pieces.
+	
+	feed() returns the top-level members completed by the new text, as
+	(key, value) pairs. A string value is complete at its closing quote; a
+	number or literal at the delimiter that follows it; an array or object at
+	its closing bracket. Incomplete tokens are re-scanned on the next feed
+	(values here are short, so this stays linear in practice).
 	"""
-	EPDF page to base64 extraction and runs the extraction agent.
+	
+	_STRING_END = re.compile(r'["\\]')
+	_SCALAR_END = re.compile(r'[,}\]\s]')
+	
+	def __init__(self):
+		self._buf = ""
+		self._pos = 0
+		self._state = "object"  # object -> key -> colon -> value -> comma -> ... -> done
+		self._key: Optional[str] = None
+	
+	@property
+	def done(self) -> bool:
+		return self._state == "done"
+	
+	def _skip_ws(self) -> None:
+		while self._pos < len(self._buf) and self._buf[self._pos] in " \t\r\n":
+			self._pos += 1
+	
+	def _string_end(self, start: int) -> int:
+		"""Index of the closing quote of the string opening at `start`, or -1 if not arrived yet."""
+		i = start + 1
+		while True:
+			m = self._STRING_END.search(self._buf, i)
+			if m is None:
+				return -1
+			if m.group() == '"':
+				return m.start()
+			i = m.start() + 2  # skip the escaped character
+	
+	def _container_end(self, start: int) -> int:
+		depth = 0
+		i = start
+		while i < len(self._buf):
+			c = self._buf[i]
+			if c == '"':
+				i = self._string_end(i)
+				if i < 0:
+					return -1
+			elif c in "[{":
+				depth += 1
+			elif c in "]}":
+				depth -= 1
+				if depth == 0:
+					return i
+			i += 1
+		return -1
+	
+	def _value_end(self, start: int) -> int:
+		"""Index just past the value starting at `start`, or -1 if it is not complete yet."""
+		c = self._buf[start]
+		if c == '"':
+			end = self._string_end(start)
+		elif c in "[{":
+			end = self._container_end(start)
+		else:
+			m = self._SCALAR_END.search(self._buf, start)
+			return m.start() if m else -1
+		return end + 1 if end >= 0 else -1
+	
+	def feed(self, text: str) -> List[Tuple[str, Any]]:
+		self._buf += text
+		out: List[Tuple[str, Any]] = []
+		while self._state != "done":
+			self._skip_ws()
+			if self._pos >= len(self._buf):
+				break
+			c = self._buf[self._pos]
+			if self._state == "object":
+				if c != "{":
+					raise ValueError(f"Expected '{{' at start of tool arguments, got {c!r}")
+				self._pos += 1
+				self._state = "key"
+			elif self._state in ("key", "comma"):
+				if c == "}":
+					self._pos += 1
+					self._state = "done"
+				elif self._state == "comma":
+					if c != ",":
+						raise ValueError(f"Expected ',' or '}}' in tool arguments, got {c!r}")
+					self._pos += 1
+					self._state = "key"
+				else:
+					end = self._string_end(self._pos) if c == '"' else -2
+					if end == -2:
+						raise ValueError(f"Expected a key in tool arguments, got {c!r}")
+					if end < 0:
+						break
+					self._key = json.loads(self._buf[self._pos:end + 1])
+					self._pos = end + 1
+					self._state = "colon"
+			elif self._state == "colon":
+				if c != ":":
+					raise ValueError(f"Expected ':' in tool arguments, got {c!r}")
+				self._pos += 1
+				self._state = "value"
+			else:  # value
+				end = self._value_end(self._pos)
+				if end < 0:
+					break
+				out.append((self._key, json.loads(self._buf[self._pos:end])))
+				self._pos = end
+				self._state = "comma"
+		# Drop consumed text; _pos always rests at a token boundary
+		self._buf = self._buf[self._pos:]
+		self._pos = 0
+		return out
+
+
+async def stream_extraction_agent(
+	client: AsyncOpenAI,
+	file: Dict[str, str],
+	report: Optional[Dict[str, Any]] = None,
+	fields: Optional[List[str]] = None,
+) -> AsyncIterator[Tuple[str, Any]]:
+	"""
+	Streaming variant of run_extraction_agent: yields (field, normalized value)
+	as soon as each field of the tool call's arguments has been received.
+	"""
+	request = _extraction_request(file, fields)
+	_count_request(report, request)
+	# The usage arrives in a last chunk without choices
+	stream = await client.chat.completions.create(**request, stream=True, stream_options={"include_usage": True})
+	parser = IncrementalObjectParser()
+	seen_call = False
+	async for chunk in stream:
+		if not chunk.choices:
+			_count_usage(report, getattr(chunk, "usage", None))
+			continue
+		tool_calls = chunk.choices[0].delta.tool_calls
+		# Only the first tool call is used (tool_choice forces a single one)
+		for call in tool_calls or []:
+			if call.index != 0 or call.function is None or not call.function.arguments:
+				continue
+			seen_call = True
+			for key, value in parser.feed(call.function.arguments):
+				yield key, normalize_field(key, value)
+	if seen_call and not parser.done:
+		raise ValueError("Tool call arguments ended before the JSON object was complete")
+
+
+async def extract_from_pdf_bytes(
+	client: AsyncOpenAI,
+	pdf_content: bytes,
+	files: Optional[PdfFiles] = None,
+	report: Optional[Dict[str, Any]] = None,
+	fields: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+	"""
+	Run the extraction agent on a PDF.
 	
 	Args:
 		client: AsyncOpenAI client instance
 		pdf_content: Raw PDF bytes
+		files: File store to reference the PDF from (None sends it inline)
+		report: Filled with the extraction's transfer report (mode, file_id,
+			bytes sent, token usage, latency)
+		fields: Only extract these fields (default: all)
 		
 	Returns:
 		Dict containing the extracted form data
 	"""
-	import base64
+	report = {} if report is None else report
+	report.update(_new_report(pdf_content))
+	started = time.perf_counter()
+	file = await _pdf_file(client, pdf_content, files, report)
+	try:
+		result = await run_extraction_agent(client, file, report, fields)
+	except Exception as e:
+		if not _stale_reference(file, e):
+			raise
+		files.forget(file["file_id"])
+		file = await _pdf_file(client, pdf_content, files, report)
+		result = await run_extraction_agent(client, file, report, fields)
+	report["latency_s"] = round(time.perf_counter() - started, 3)
+	if files is not None:
+		files.record(report)
+	print(f"Extraction sent {report['bytes_sent']} bytes ({report['mode']}, PDF {report['pdf_bytes']} bytes)")
+	return result
+
+
+async def stream_from_pdf_bytes(
+	client: AsyncOpenAI,
+	pdf_content: bytes,
+	files: Optional[PdfFiles] = None,
+	report: Optional[Dict[str, Any]] = None,
+) -> AsyncIterator[Tuple[str, Any]]:
+	"""Streaming variant of extract_from_pdf_bytes (see stream_extraction_agent)."""
+	report = {} if report is None else report
+	report.update(_new_report(pdf_content))
+	started = time.perf_counter()
+	file = await _pdf_file(client, pdf_content, files, report)
+	yielded = False
+	try:
+		async for key, value in stream_extraction_agent(client, file, report):
+			yielded = True
+			yield key, value
+	except Exception as e:
+		# A stale reference fails the request before any field has arrived
+		if yielded or not _stale_reference(file, e):
+			raise
+		files.forget(file["file_id"])
+		file = await _pdf_file(client, pdf_content, files, report)
+		async for key, value in stream_extraction_agent(client, file, report):
+			yield key, value
+	report["latency_s"] = round(time.perf_counter() - started, 3)
+	if files is not None:
+		files.record(report)
+	print(f"Extraction sent {report['bytes_sent']} bytes ({report['mode']}, PDF {report['pdf_bytes']} bytes)")
+
+
+# Words of the form labels (English and German) that locate each field on a page
+FIELD_KEYWORDS = {
+	"gender": ["gender", "sex", "geschlecht"],
+	"age": ["age", "alter"],
+	"birthdate": ["birth", "geburt"],
+	"marital_status": ["marital", "civil status", "zivilstand"],
+	"height_cm": ["height", "grösse", "größe"],
+	"weight_kg": ["weight", "gewicht"],
+	"bmi": ["bmi", "body mass"],
+	"smoking": ["smok", "cigarette", "rauch", "zigarette"],
+	"drug_use": ["drug", "droge", "betäubungsmittel"],
+	"staying_abroad": ["abroad", "ausland"],
+	"dangerous_sports": ["sport"],
+	"medical_issue": ["medical", "illness", "disease", "krankheit", "medizin"],
+	"doctor_visits": ["doctor", "physician", "hospital", "arzt", "spital"],
+	"regular_medication": ["medication", "medikament"],
+	"sports_activity_h_per_week": ["sport"],
+	"earning_chf": ["income", "earning", "salary", "einkommen", "lohn"],
+}
+for _detail, _gate in GATED_BY.items():
+	FIELD_KEYWORDS[_detail] = FIELD_KEYWORDS[_gate]
+
+
+def relevant_pages(pdf_content: bytes, fields: List[str]) -> Optional[List[int]]:
+	"""
+	1-based pages whose text mentions one of `fields` (by FIELD_KEYWORDS), or
+	None if that cannot be told: no PyPDF2, no text layer (scans), or no match.
+	"""
+	if not HAS_PYPDF2:
+		return None
+	import io
 
-	pdf_base64 = base64.b64encode(pdf_content).decode("ascii")
-	print("PDF base64 encoded successfully, length:", len(pdf_base64))
-	return await run_extraction_agent(client, pdf_base64)
\ No newline at end of file
+	keywords = [word for key in fields for word in FIELD_KEYWORDS.get(key, [key.replace("_", " ")])]
+	try:
+		texts = [(page.extract_text() or "").lower() for page in PdfReader(io.BytesIO(pdf_content)).pages]
+	except Exception:
+		return None
+	if not any(texts):
+		return None
+	pages = [i + 1 for i, text in enumerate(texts) if any(word in text for word in keywords)]
+	return pages or None
+
+
+def select_pages(pdf_content: bytes, pages: List[int]) -> bytes:
+	"""A PDF of the given 1-based pages of `pdf_content` (needs PyPDF2)."""
+	import io
+
+	reader = PdfReader(io.BytesIO(pdf_content))
+	bad = [p for p in pages if not 1 <= p <= len(reader.pages)]
+	if bad:
+		raise ValueError(f"Page(s) {', '.join(map(str, bad))} out of range 1-{len(reader.pages)}")
+	writer = PdfWriter()
+	for page in pages:
+		writer.add_page(reader.pages[page - 1])
+	buffer = io.BytesIO()
+	writer.write(buffer)
+	return buffer.getvalue()
+
+
+async def reextract_fields(
+	client: AsyncOpenAI,
+	pdf_content: bytes,
+	fields: List[str],
+	files: Optional[PdfFiles] = None,
+	pages: Optional[List[int]] = None,
+	report: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+	"""
+	Extract only `fields`, with the tool schema reduced to them and, with
+	`pages`, from a PDF of just those pages. Returns the normalized values of
+	the requested fields the model answered.
+	"""
+	if pages:
+		if not HAS_PYPDF2:
+			raise ValueError("Restricting re-extraction to pages needs PyPDF2")
+		pdf_content = select_pages(pdf_content, pages)
+	result = await extract_from_pdf_bytes(client, pdf_content, files, report, fields=fields)
+	return {key: value for key, value in result.items() if key in fields}
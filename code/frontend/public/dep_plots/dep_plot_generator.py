@@ -1,6 +1,9 @@
+import json
+import os
+import urllib.request
+
 import numpy as np
 import matplotlib.pyplot as plt
-import os
 
 # ==== 1. Applicant data ====
 applicant = {
@@ -8,29 +11,22 @@ applicant = {
     "bmi": 27.7,
     "smoking": True,  # categorical
     "drug_frequency": 0.0,
-    "sport_hours": 3.0,
+    "sports_activity_h_per_week": 3.0,
 }
 
-# ==== 2. Generate sample data and fake model risk functions ====
-np.random.seed(42)
+# ==== 2. Partial-dependence curves from the deployed model ====
+# The backend computes them once per model version (GET /partial-dependence);
+# this script only draws static PNGs from that JSON.
+API_BASE = os.getenv("PAX_API_BASE", "http://localhost:8000")
+RISK_CLASS = "reject"  # probability plotted as "risk"
 
-age = np.linspace(18, 80, 50)
-bmi = np.linspace(15, 40, 50)
-smoking = np.array([0, 1])  # 0=No, 1=Yes
-drug_frequency = np.linspace(0, 7, 8)  # times per week
-sport_hours = np.linspace(0, 7, 8)  # hours per week
+threshold = 0.5
 
-def risk_function(x, base=0.2, scale=0.05):
-    return 1 / (1 + np.exp(-(x - base) / scale))
 
-risk_age = risk_function((age - 40) / 40)
-risk_bmi = risk_function((bmi - 25) / 7)
-risk_smoking = np.array([0.3, 0.8])  # categorical risk
-risk_drug = risk_function(drug_frequency / 7
-)
-risk_sport = 1 - risk_function(sport_hours / 7)
+def fetch_curve(feature):
+    with urllib.request.urlopen(f"{API_BASE}/partial-dependence/{feature}") as resp:
+        return json.load(resp)
 
-threshold = 0.5
 
 # ==== 3. Plot helper ====
 def plot_dependency(x, y, feature_name, xlabel, applicant_value, categorical=False):
@@ -64,7 +60,7 @@ def plot_dependency(x, y, feature_name, xlabel, applicant_value, categorical=Fal
         plt.text(applicant_value, app_y + 0.05, f"Applicant\n({applicant_value})", ha="center", fontsize=9)
 
     plt.xlabel(xlabel, fontsize=12)
-    plt.ylabel("Predicted Risk (0–1)", fontsize=12)
+    plt.ylabel(f"P({RISK_CLASS}) (0–1)", fontsize=12)
     plt.ylim(0, 1)
     plt.legend(loc="lower right")
     plt.grid(alpha=0.2)
@@ -76,9 +72,20 @@ def plot_dependency(x, y, feature_name, xlabel, applicant_value, categorical=Fal
     plt.close()
     print(f"✅ Saved: {path}")
 
+
+def plot_feature(feature, feature_name, xlabel):
+    curve = fetch_curve(feature)
+    y = np.asarray(curve["pd"][RISK_CLASS])
+    if curve["kind"] == "categorical":
+        x = np.arange(len(curve["grid"]))
+        plot_dependency(x, y, feature_name, xlabel, applicant[feature], categorical=True)
+    else:
+        plot_dependency(np.asarray(curve["grid"]), y, feature_name, xlabel, applicant[feature])
+
+
 # ==== 4. Run for each feature ====
-# plot_dependency(age, risk_age, "Age", "Age (years)", applicant["age"], categorical=False)
-# plot_dependency(bmi, risk_bmi, "BMI", "Body Mass Index", applicant["bmi"], categorical=False)
-# plot_dependency(smoking, risk_smoking, "Smoking", "Smoker (0=No, 1=Yes)", applicant["smoking"], categorical=True)
-# plot_dependency(drug_frequency, risk_drug, "Drug Frequency", "Drug Use Frequency (per week)", applicant["drug_frequency"], categorical=False)
-plot_dependency(sport_hours, risk_sport, "Sport Hours", "Sport Activity (hours per week)", applicant["sport_hours"], categorical=False)
\ No newline at end of file
+# plot_feature("age", "Age", "Age (years)")
+# plot_feature("bmi", "BMI", "Body Mass Index")
+# plot_feature("smoking", "Smoking", "Smoker (0=No, 1=Yes)")
+# plot_feature("drug_frequency", "Drug Frequency", "Drug Use Frequency (per week)")
+plot_feature("sports_activity_h_per_week", "Sport Hours", "Sport Activity (hours per week)")
@@ -0,0 +1,238 @@
+"""
+Chunked writers and readers for the synthetic life-insurance dataset.
+
+The generator used to materialize the whole portfolio and dump it as one
+indented JSON array. These helpers stream fixed-size chunks instead, so memory
+stays bounded by ``chunk_size`` regardless of the portfolio size N.
+
+Supported formats (picked from the file suffix):
+- ``.ndjson`` / ``.jsonl``: one compact JSON record per line
+- ``.parquet``: columnar file with explicit dtypes (requires pyarrow)
+- ``.json``: legacy JSON array (streamed on write, fully loaded on read)
+
+A directory is read as a sharded dataset: its ``part-*`` files in name order.
+"""
+import json
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+DEFAULT_CHUNK_SIZE = 50_000
+SHARD_MANIFEST = "_manifest.json"
+
+FORMATS = {
+    ".ndjson": "ndjson",
+    ".jsonl": "ndjson",
+    ".parquet": "parquet",
+    ".json": "json",
+}
+
+# Column dtypes for the columnar format, in generator field order.
+if HAS_PYARROW:
+    _dict = pa.dictionary(pa.int8(), pa.string())
+    PARQUET_SCHEMA = pa.schema([
+        ("gender", _dict),
+        ("age", pa.int16()),
+        ("marital_status", _dict),
+        ("height_cm", pa.float64()),
+        ("weight_kg", pa.float64()),
+        ("bmi", pa.float64()),
+        ("smoking", pa.bool_()),
+        ("packs_per_week", pa.int8()),
+        ("drug_use", pa.bool_()),
+        ("drug_frequency", pa.float64()),
+        ("drug_type", _dict),
+        ("staying_abroad", pa.bool_()),
+        ("abroad_type", _dict),
+        ("dangerous_sports", pa.bool_()),
+        ("sport_type", _dict),
+        ("medical_issue", pa.bool_()),
+        ("medical_type", _dict),
+        ("doctor_visits", pa.bool_()),
+        ("visit_type", _dict),
+        ("regular_medication", pa.bool_()),
+        ("medication_type", _dict),
+        ("sports_activity_h_per_week", pa.int16()),
+        ("earning_chf", pa.int32()),
+        ("application_year", pa.int16()),
+        ("risk_multiplier", pa.float64()),
+        ("risk_score", pa.float64()),
+        ("underwriter_score", pa.float64()),
+        ("underwriter_decision", _dict),
+        ("premium_loading", pa.float64()),
+    ])
+else:
+    PARQUET_SCHEMA = None
+
+
+def dataset_files(path: Path) -> List[Path]:
+    """Return the data files behind a dataset path (the shards if it is a directory)."""
+    path = Path(path)
+    if path.is_dir():
+        parts = sorted(p for p in path.glob("part-*") if p.suffix.lower() in FORMATS)
+        if not parts:
+            raise FileNotFoundError(f"No part-* files in sharded dataset {path}")
+        return parts
+    return [path]
+
+
+def detect_format(path: Path) -> str:
+    """Return the dataset format for a path based on its suffix."""
+    path = Path(path)
+    if path.is_dir():
+        path = dataset_files(path)[0]
+    fmt = FORMATS.get(path.suffix.lower())
+    if fmt is None:
+        raise ValueError(f"Unsupported dataset format: {path} (expected one of {sorted(FORMATS)})")
+    return fmt
+
+
+def _chunked(records: Iterable[Dict[str, Any]], chunk_size: int) -> Iterator[List[Dict[str, Any]]]:
+    chunk: List[Dict[str, Any]] = []
+    for rec in records:
+        chunk.append(rec)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def write_records(
+    records: Iterable[Dict[str, Any]],
+    path: Path,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    fmt: Optional[str] = None,
+) -> int:
+    """Stream records to ``path`` in chunks of ``chunk_size``. Returns the row count.
+
+    The file is written under a temporary name and renamed when complete, so a
+    half-written dataset never shows up under the final name.
+    """
+    path = Path(path)
+    fmt = fmt or detect_format(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    n = 0
+
+    if fmt == "parquet":
+        if not HAS_PYARROW:
+            raise RuntimeError("Parquet output requires pyarrow: pip install pyarrow")
+        with pq.ParquetWriter(tmp_path, PARQUET_SCHEMA, compression="zstd") as writer:
+            for chunk in _chunked(records, chunk_size):
+                writer.write_table(pa.Table.from_pylist(chunk, schema=PARQUET_SCHEMA))
+                n += len(chunk)
+    elif fmt == "ndjson":
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for chunk in _chunked(records, chunk_size):
+                f.write("\n".join(json.dumps(r, ensure_ascii=False, separators=(",", ":")) for r in chunk))
+                f.write("\n")
+                n += len(chunk)
+    elif fmt == "json":
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("[")
+            for chunk in _chunked(records, chunk_size):
+                f.write("," if n else "\n")
+                f.write(",\n".join(json.dumps(r, ensure_ascii=False, separators=(",", ":")) for r in chunk))
+                n += len(chunk)
+            f.write("\n]\n")
+    else:
+        raise ValueError(f"Unknown format: {fmt}")
+
+    tmp_path.replace(path)
+    return n
+
+
+def iter_record_chunks(path: Path, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[List[Dict[str, Any]]]:
+    """Yield lists of at most ``chunk_size`` record dicts from a dataset file.
+
+    NDJSON and Parquet are read incrementally. The legacy JSON array has to be
+    parsed in one go, so memory is only bounded for the two streaming formats.
+    """
+    path = Path(path)
+    if path.is_dir():
+        for part in dataset_files(path):
+            yield from iter_record_chunks(part, chunk_size)
+        return
+    fmt = detect_format(path)
+    if fmt == "parquet":
+        if not HAS_PYARROW:
+            raise RuntimeError("Reading Parquet requires pyarrow: pip install pyarrow")
+        pf = pq.ParquetFile(path)
+        for batch in pf.iter_batches(batch_size=chunk_size):
+            yield batch.to_pylist()
+    elif fmt == "ndjson":
+        # Parse each chunk of lines as one JSON array: a single json.loads call
+        # is much cheaper than one call per line.
+        with open(path, "r", encoding="utf-8") as f:
+            lines: List[str] = []
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                lines.append(line)
+                if len(lines) >= chunk_size:
+                    yield json.loads("[" + ",".join(lines) + "]")
+                    lines = []
+            if lines:
+                yield json.loads("[" + ",".join(lines) + "]")
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        for i in range(0, len(data), chunk_size):
+            yield data[i:i + chunk_size]
+
+
+def iter_dataframe_chunks(path: Path, chunk_size: int = DEFAULT_CHUNK_SIZE, columns: Optional[List[str]] = None):
+    """Yield pandas DataFrames of at most ``chunk_size`` rows from a dataset file."""
+    import pandas as pd
+
+    path = Path(path)
+    if path.is_dir():
+        for part in dataset_files(path):
+            yield from iter_dataframe_chunks(part, chunk_size, columns)
+        return
+    if detect_format(path) == "parquet" and HAS_PYARROW:
+        pf = pq.ParquetFile(path)
+        for batch in pf.iter_batches(batch_size=chunk_size, columns=columns):
+            df = batch.to_pandas()
+            # Dictionary columns come back as pandas categoricals; the
+            # preprocessor and notebooks expect plain object columns.
+            for col in df.columns:
+                if isinstance(df[col].dtype, pd.CategoricalDtype):
+                    df[col] = df[col].astype(object)
+            yield df
+        return
+
+    for chunk in iter_record_chunks(path, chunk_size):
+        df = pd.DataFrame(chunk)
+        yield df[columns] if columns else df
+
+
+def read_dataframe(path: Path, chunk_size: int = DEFAULT_CHUNK_SIZE, columns: Optional[List[str]] = None):
+    """Load a whole dataset file into one DataFrame, chunk by chunk."""
+    import pandas as pd
+
+    chunks = list(iter_dataframe_chunks(path, chunk_size, columns))
+    if not chunks:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(chunks, ignore_index=True)
+
+
+def count_rows(path: Path) -> int:
+    """Count records without materializing them (cheap for Parquet metadata)."""
+    path = Path(path)
+    if path.is_dir():
+        return sum(count_rows(part) for part in dataset_files(path))
+    fmt = detect_format(path)
+    if fmt == "parquet" and HAS_PYARROW:
+        return pq.ParquetFile(path).metadata.num_rows
+    if fmt == "ndjson":
+        with open(path, "rb") as f:
+            return sum(1 for line in f if line.strip())
+    return sum(len(c) for c in iter_record_chunks(path))
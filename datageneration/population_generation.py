@@ -1,36 +1,47 @@
+import argparse
+import hashlib
 import json
 import random
 import math
+import time
+from multiprocessing import Pool
 from pathlib import Path
 
 # typing hints (optional)
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Iterator
+
+import numpy as np
+
+from dataset_io import DEFAULT_CHUNK_SIZE, FORMATS, SHARD_MANIFEST, write_records
 
 # ----------------------------
 # PARAMETERS
 # ----------------------------
 N = 10_000
 TIME_WINDOW_YEARS = 20
+SEED = 42
+# Rows per shard in sharded mode. Shard boundaries (and therefore seeds) depend
+# only on this value, never on the number of worker processes.
+SHARD_SIZE = 250_000
 
 # Output file; write next to this script
-OUTPUT_FILE = str(Path(__file__).with_name(f"synthetic_life_insurance_{N}.json"))
-
-random.seed(42)
+OUTPUT_FORMAT = "ndjson"
+OUTPUT_FILE = str(Path(__file__).with_name(f"synthetic_life_insurance_{N}.{OUTPUT_FORMAT}"))
 
 # ----------------------------
 # DISTRIBUTIONS & HELPERS
 # ----------------------------
-def truncated_normal(mean, sd, low, high):
+def truncated_normal(mean, sd, low, high, rng=random):
     """Sample from truncated normal distribution."""
     while True:
-        x = random.gauss(mean, sd)
+        x = rng.gauss(mean, sd)
         if low <= x <= high:
             return x
 
-def weighted_choice(options):
+def weighted_choice(options, rng=random):
     """Return a random key from a dict of {option: weight}."""
     total = sum(options.values())
-    r = random.uniform(0, total)
+    r = rng.uniform(0, total)
     upto = 0
     for k, w in options.items():
         if upto + w >= r:
@@ -144,44 +155,44 @@ def compute_risk_multiplier(person: Dict[str, Any]) -> float:
 # ----------------------------
 # PERSON GENERATION (attributes only)
 # ----------------------------
-def generate_person() -> Dict[str, Any]:
+def generate_person(rng: random.Random = random) -> Dict[str, Any]:
     # --- Demographics ---
-    gender = random.choice(["m", "f"])
-    age = random.randint(18, 85)
-    marital_status = random.choice(["single", "married", "divorced", "widowed"])
-    height_cm = round(truncated_normal(mean=170, sd=10, low=145, high=210), 1)
+    gender = rng.choice(["m", "f"])
+    age = rng.randint(18, 85)
+    marital_status = rng.choice(["single", "married", "divorced", "widowed"])
+    height_cm = round(truncated_normal(mean=170, sd=10, low=145, high=210, rng=rng), 1)
 
     # --- Body metrics ---
-    bmi = truncated_normal(mean=25.5, sd=4.0, low=16, high=45)
+    bmi = truncated_normal(mean=25.5, sd=4.0, low=16, high=45, rng=rng)
     weight_kg = round(bmi * (height_cm / 100) ** 2, 1)
 
     # --- Lifestyle ---
-    smoking = random.random() < 0.25
-    packs_per_week = random.randint(0, 3) if smoking else 0
+    smoking = rng.random() < 0.25
+    packs_per_week = rng.randint(0, 3) if smoking else 0
 
-    drug_use = random.random() < 0.1
-    drug_type = weighted_choice({"safe": 0.6, "warning": 0.3, "danger": 0.1})
-    drug_frequency = round(random.uniform(0.5, 5.0), 1) if drug_use else 0.0
+    drug_use = rng.random() < 0.1
+    drug_type = weighted_choice({"safe": 0.6, "warning": 0.3, "danger": 0.1}, rng)
+    drug_frequency = round(rng.uniform(0.5, 5.0), 1) if drug_use else 0.0
 
-    staying_abroad = random.random() < 0.05
-    abroad_type = weighted_choice({"safe": 0.7, "warning": 0.2, "danger": 0.1})
+    staying_abroad = rng.random() < 0.05
+    abroad_type = weighted_choice({"safe": 0.7, "warning": 0.2, "danger": 0.1}, rng)
 
-    dangerous_sports = random.random() < 0.15
-    sport_type = weighted_choice({"safe": 0.5, "warning": 0.35, "danger": 0.15})
+    dangerous_sports = rng.random() < 0.15
+    sport_type = weighted_choice({"safe": 0.5, "warning": 0.35, "danger": 0.15}, rng)
 
     # --- Health ---
-    medical_issue = random.random() < 0.2
-    medical_type = weighted_choice({"safe": 0.5, "warning": 0.35, "danger": 0.15})
+    medical_issue = rng.random() < 0.2
+    medical_type = weighted_choice({"safe": 0.5, "warning": 0.35, "danger": 0.15}, rng)
 
-    doctor_visits = random.random() < 0.5
-    visit_type = random.choice(["doctor", "physician", "therapist"])
+    doctor_visits = rng.random() < 0.5
+    visit_type = rng.choice(["doctor", "physician", "therapist"])
 
-    regular_medication = random.random() < 0.25
-    medication_type = weighted_choice({"safe": 0.6, "warning": 0.3, "danger": 0.1})
+    regular_medication = rng.random() < 0.25
+    medication_type = weighted_choice({"safe": 0.6, "warning": 0.3, "danger": 0.1}, rng)
 
     # --- Sports & Income ---
-    sports_activity_h_per_week = random.randint(0, 10)
-    earning_chf = random.randint(30_000, 250_000)
+    sports_activity_h_per_week = rng.randint(0, 10)
+    earning_chf = rng.randint(30_000, 250_000)
 
     # ----------------------------
     # Record assembly (attributes only)
@@ -213,31 +224,13 @@ def generate_person() -> Dict[str, Any]:
     }
 
     # Some operational fields to mimic past business records
-    person["application_year"] = random.randint(2005, 2010)  # fully observed 20y by 2025
+    person["application_year"] = rng.randint(2005, 2010)  # fully observed 20y by 2025
 
     # store raw multiplier for percentile mapping later
     person["risk_multiplier"] = compute_risk_multiplier(person)
 
     return person
 
-# ----------------------------
-# GENERATE DATA
-# ----------------------------
-raw_people: List[Dict[str, Any]] = [generate_person() for _ in range(N)]
-
-# ----------------------------
-# MAP RISK MULTIPLIER → RISK SCORE [0,1]
-# ----------------------------
-# We map each person's risk_multiplier to a portfolio-relative score by
-# percentile rank. This preserves ordering without assuming a particular
-# real-world calibration (e.g., absolute mortality). It also gives a nice
-# uniform spread 0..1 which is convenient for thresholding decisions.
-multipliers = [p["risk_multiplier"] for p in raw_people]
-order = sorted(range(len(raw_people)), key=lambda i: multipliers[i])
-den = max(1, N - 1)
-for rank, idx in enumerate(order):
-    raw_people[idx]["risk_score"] = rank / den
-
 # ----------------------------
 # UNDERWRITER DECISIONS
 # ----------------------------
@@ -266,37 +259,234 @@ def decide_underwriter(risk_est: float) -> Dict[str, Any]:
     return {"decision": "reject", "premium_loading": 0.0}
 
 
-# Finalize outcomes using calibrated probabilities and simulated underwriting
-dataset: List[Dict[str, Any]] = []
-decisions_count: Dict[str, int] = {"accept": 0, "accept_with_premium": 0, "needs_more_info": 0, "reject": 0}
+# ----------------------------
+# MAP RISK MULTIPLIER → RISK SCORE [0,1]
+# ----------------------------
+# We map each person's risk_multiplier to a portfolio-relative score by
+# percentile rank. This preserves ordering without assuming a particular
+# real-world calibration (e.g., absolute mortality). It also gives a nice
+# uniform spread 0..1 which is convenient for thresholding decisions.
+def percentile_ranks(multipliers: np.ndarray) -> np.ndarray:
+    """Return the 0-based rank of every multiplier (ties keep input order)."""
+    ranks = np.empty(len(multipliers), dtype=np.int64)
+    ranks[np.argsort(multipliers, kind="stable")] = np.arange(len(multipliers), dtype=np.int64)
+    return ranks
+
+
+def finalize_record(person: Dict[str, Any], risk_score: float, noise_rng: random.Random) -> Dict[str, Any]:
+    """Attach the risk score and a simulated underwriting decision to a person."""
+    person["risk_score"] = risk_score
 
-for person in raw_people:
     # Underwriter estimates risk with multiplicative noise to mimic imperfect
     # judgement or incomplete information. We clamp to keep within reasonable
     # bounds and then cap the product to [0, 1].
-    noise = random.gauss(1.0, 0.15)  # ~15% std; clamped below
+    noise = noise_rng.gauss(1.0, 0.15)  # ~15% std; clamped below
     noise = max(0.6, min(noise, 1.6))
-    risk_est = max(0.0, min(person["risk_score"] * noise, 1.0))
+    risk_est = max(0.0, min(risk_score * noise, 1.0))
 
     decision_pack = decide_underwriter(risk_est)
-    decisions_count[decision_pack["decision"]] += 1
-
-    record = dict(person)
-    record.update({
+    person.update({
         "underwriter_score": round(risk_est, 4),
         "underwriter_decision": decision_pack["decision"],
         "premium_loading": decision_pack["premium_loading"],
     })
+    return person
 
-    dataset.append(record)
 
 # ----------------------------
-# SAVE
+# GENERATE DATA
+# ----------------------------
+def generate_dataset(n: int = N, seed: int = SEED) -> Iterator[Dict[str, Any]]:
+    """Yield the n final records in order without holding the portfolio in memory.
+
+    risk_score is a portfolio-wide percentile, so we make two passes over the
+    same seeded stream: the first only keeps the multipliers (8 bytes/row) to
+    rank them, the second regenerates the people and emits them one by one.
+    The underwriter noise is drawn from the RNG state reached after the first
+    pass, which reproduces the original single-stream output exactly.
+    """
+    rng = random.Random(seed)
+    multipliers = np.empty(n, dtype=np.float64)
+    for i in range(n):
+        multipliers[i] = generate_person(rng)["risk_multiplier"]
+    noise_rng = random.Random()
+    noise_rng.setstate(rng.getstate())
+
+    ranks = percentile_ranks(multipliers)
+    del multipliers
+    den = max(1, n - 1)
+
+    rng = random.Random(seed)
+    for i in range(n):
+        yield finalize_record(generate_person(rng), int(ranks[i]) / den, noise_rng)
+
+
 # ----------------------------
-with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-    json.dump(dataset, f, ensure_ascii=False, indent=2)
+# SHARDED GENERATION
+# ----------------------------
+# For stress-test portfolios the work is split into fixed-size shards. Each
+# shard draws from its own seed streams derived from (seed, shard index), so a
+# shard's people are the same whichever worker process generates it. The
+# percentile rank is the only portfolio-wide step: workers send back their
+# multipliers, the parent ranks the concatenation once, and each worker then
+# regenerates its shard and writes it with the global ranks applied.
+def shard_seed(seed: int, shard: int, stream: str) -> int:
+    """Derive an independent, reproducible seed for one shard stream."""
+    digest = hashlib.sha256(f"{seed}:{shard}:{stream}".encode()).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+def shard_bounds(n: int, shard_size: int) -> List[tuple]:
+    """Return (start, count) for every shard of an n-row portfolio."""
+    return [(start, min(shard_size, n - start)) for start in range(0, n, shard_size)]
+
+
+def _shard_multipliers(task: tuple) -> np.ndarray:
+    seed, shard, count = task
+    rng = random.Random(shard_seed(seed, shard, "people"))
+    out = np.empty(count, dtype=np.float64)
+    for i in range(count):
+        out[i] = generate_person(rng)["risk_multiplier"]
+    return out
+
+
+def _write_shard(task: tuple) -> Dict[str, Any]:
+    seed, shard, ranks, den, path, fmt, chunk_size = task
+    rng = random.Random(shard_seed(seed, shard, "people"))
+    noise_rng = random.Random(shard_seed(seed, shard, "noise"))
+    decisions: Dict[str, int] = {}
+
+    def records() -> Iterator[Dict[str, Any]]:
+        for rank in ranks:
+            rec = finalize_record(generate_person(rng), int(rank) / den, noise_rng)
+            decisions[rec["underwriter_decision"]] = decisions.get(rec["underwriter_decision"], 0) + 1
+            yield rec
+
+    rows = write_records(records(), path, chunk_size=chunk_size, fmt=fmt)
+    return {"shard": shard, "file": Path(path).name, "rows": rows, "decisions": decisions}
+
+
+def generate_sharded(
+    n: int,
+    seed: int,
+    out_dir: Path,
+    fmt: str = OUTPUT_FORMAT,
+    workers: int = 1,
+    shard_size: int = SHARD_SIZE,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Dict[str, Any]:
+    """Generate n records as one file per shard under out_dir, using `workers` processes.
+
+    The output is byte-identical for a given (n, seed, shard_size) whatever the
+    worker count. It is a different sample from the single-stream mode, which
+    draws everything from one RNG. Shards and manifest left in out_dir by an
+    earlier run are removed first.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    # dataset_io reads every part-* file, so a run with fewer shards must not
+    # leave the earlier run's extra parts behind
+    stale = sorted(out_dir.glob("part-*"))
+    for path in stale + [out_dir / SHARD_MANIFEST]:
+        path.unlink(missing_ok=True)
+    if stale:
+        print(f"Removed {len(stale)} shard files of an earlier run from {out_dir}")
+    bounds = shard_bounds(n, shard_size)
+
+    with Pool(processes=max(1, workers)) as pool:
+        # Pass 1: multipliers per shard, concatenated in shard order so ties
+        # are broken identically regardless of scheduling.
+        multipliers = np.concatenate(
+            pool.map(_shard_multipliers, [(seed, i, count) for i, (_, count) in enumerate(bounds)], chunksize=1)
+        ) if bounds else np.empty(0)
+
+        # Global rank step: one exact argsort over n floats in the parent.
+        ranks = percentile_ranks(multipliers)
+        del multipliers
+        den = max(1, n - 1)
+
+        # Pass 2: regenerate each shard and write it with its slice of ranks.
+        tasks = [
+            (seed, i, ranks[start:start + count], den, out_dir / f"part-{i:05d}.{fmt}", fmt, chunk_size)
+            for i, (start, count) in enumerate(bounds)
+        ]
+        shards = pool.map(_write_shard, tasks, chunksize=1)
+
+    manifest = {
+        "n": n,
+        "seed": seed,
+        "shard_size": shard_size,
+        "format": fmt,
+        "shards": shards,
+    }
+    with open(out_dir / SHARD_MANIFEST, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
 
-print(f"Generated {N} synthetic records → {OUTPUT_FILE}")
-print("Decision mix:", decisions_count)
-print("Example record:")
-print(json.dumps(dataset[0], indent=2))
+# ----------------------------
+# SAVE
+# ----------------------------
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate the synthetic life-insurance portfolio.")
+    parser.add_argument("-n", type=int, default=N, help="number of people to generate")
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--format", choices=["ndjson", "parquet", "json"], default=OUTPUT_FORMAT,
+                        help="ndjson/parquet stream in chunks; json is the legacy array")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("-o", "--output", help="output path (default: next to this script)")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="generate shards across this many processes (0 = single stream)")
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE, help="rows per shard in sharded mode")
+    args = parser.parse_args()
+
+    if args.workers > 0:
+        if args.format == "json":
+            parser.error("sharded mode writes ndjson or parquet shards")
+        out_dir = Path(args.output) if args.output else Path(__file__).with_name(
+            f"synthetic_life_insurance_{args.n}.shards"
+        )
+        t0 = time.perf_counter()
+        manifest = generate_sharded(args.n, args.seed, out_dir, fmt=args.format, workers=args.workers,
+                                    shard_size=args.shard_size, chunk_size=args.chunk_size)
+        elapsed = time.perf_counter() - t0
+        decisions_total: Dict[str, int] = {}
+        for shard in manifest["shards"]:
+            for k, v in shard["decisions"].items():
+                decisions_total[k] = decisions_total.get(k, 0) + v
+        print(f"Generated {args.n} synthetic records in {len(manifest['shards'])} shards → {out_dir} "
+              f"({elapsed:.1f}s, {args.workers} workers, {args.n / max(elapsed, 1e-9):,.0f} rows/s)")
+        print("Decision mix:", decisions_total)
+        return
+
+    output = Path(args.output) if args.output else Path(__file__).with_name(
+        f"synthetic_life_insurance_{args.n}.{args.format}"
+    )
+    # Readers pick the format from the suffix
+    if FORMATS.get(output.suffix.lower()) != args.format:
+        parser.error(f"--output {output} does not have a suffix for --format {args.format}")
+
+    decisions_count: Dict[str, int] = {"accept": 0, "accept_with_premium": 0, "needs_more_info": 0, "reject": 0}
+    example: Dict[str, Any] = {}
+
+    def counted(records: Iterator[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        for rec in records:
+            decisions_count[rec["underwriter_decision"]] += 1
+            if not example:
+                example.update(rec)
+            yield rec
+
+    t0 = time.perf_counter()
+    n_written = write_records(counted(generate_dataset(args.n, args.seed)), output,
+                              chunk_size=args.chunk_size, fmt=args.format)
+    elapsed = time.perf_counter() - t0
+
+    print(f"Generated {n_written} synthetic records → {output} ({elapsed:.1f}s, "
+          f"{output.stat().st_size / 1e6:.1f} MB)")
+    print("Decision mix:", decisions_count)
+    print("Example record:")
+    print(json.dumps(example, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,478 @@
+"""
+Command-line training pipeline for the underwriting model.
+
+Produces the serving artifacts in code/backend/data/model/ (preprocessor, label
+encoder, booster JSON, feature names, SHAP background, drift reference profile
+and manifest) from the generator output, without going through
+xgboost_shap.ipynb.
+
+    python train_model.py synthetic_life_insurance_10000.ndjson
+    python train_model.py synthetic_life_insurance_5000000.shards --chunk-size 200000
+
+The dataset is read in chunks (any format understood by dataset_io) and only
+the encoded float32 matrices are kept in memory. Artifacts are written to a
+staging directory that replaces the model directory in one rename.
+
+For portfolios larger than RAM, ``--external-memory`` encodes each chunk to
+float32 pages on disk once and trains from those pages through an XGBoost
+data iterator, so memory is bounded by the page size rather than N:
+
+    python train_model.py synthetic_life_insurance_50000000.shards --external-memory
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import joblib
+import numpy as np
+import xgboost as xgb
+from sklearn.compose import ColumnTransformer
+from sklearn.metrics import accuracy_score, confusion_matrix, log_loss
+from sklearn.preprocessing import LabelEncoder, OneHotEncoder
+
+from dataset_io import DEFAULT_CHUNK_SIZE, iter_dataframe_chunks
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+MODEL_DIR = REPO_ROOT / "code" / "backend" / "data" / "model"
+
+sys.path.insert(0, str(REPO_ROOT / "code" / "backend"))
+import drift  # noqa: E402
+import model_artifacts  # noqa: E402
+
+# Same feature split as the notebook: fields that leak policy or are
+# outcomes/constructed scores are excluded from the features.
+TARGET_COL = "underwriter_decision"
+EXCLUDE_COLS = {
+    TARGET_COL, "underwriter_score", "risk_score", "risk_multiplier",
+    "premium_loading", "application_year",
+}
+NUMERIC_COLS = [
+    "age", "height_cm", "weight_kg", "bmi", "packs_per_week",
+    "drug_frequency", "sports_activity_h_per_week", "earning_chf",
+]
+
+# Split fractions (test first, then validation out of the remainder), as in the notebook.
+TEST_FRACTION = 0.2
+VALID_FRACTION = 0.2
+
+XGB_PARAMS = {
+    "max_depth": 4,
+    "learning_rate": 0.05,
+    "subsample": 0.8,
+    "colsample_bytree": 0.8,
+    "objective": "multi:softprob",
+    "eval_metric": "mlogloss",
+    "tree_method": "hist",
+}
+
+SHAP_BACKGROUND_SIZE = 200
+
+
+def peak_rss_mb(who: int = resource.RUSAGE_SELF) -> float:
+    """Peak resident set size in MB (Linux reports KB) of this process, or with
+    RUSAGE_CHILDREN of its largest child that has exited and been waited for."""
+    return resource.getrusage(who).ru_maxrss / 1024
+
+
+def scan_schema(path: Path, chunk_size: int, profile: Optional[drift.ReferenceBuilder] = None
+                ) -> Tuple[List[str], Dict[str, List[Any]], List[str], int]:
+    """One streaming pass: categorical columns, their categories, class labels and row count.
+
+    With `profile`, the same pass also collects the drift reference profile.
+    """
+    categorical_cols: List[str] = []
+    categories: Dict[str, set] = {}
+    classes: set = set()
+    n_rows = 0
+    for df in iter_dataframe_chunks(path, chunk_size):
+        if not categorical_cols:
+            feature_cols = [c for c in df.columns if c not in EXCLUDE_COLS]
+            categorical_cols = [c for c in feature_cols if c not in NUMERIC_COLS]
+            categories = {c: set() for c in categorical_cols}
+        for col in categorical_cols:
+            categories[col].update(df[col].dropna().unique().tolist())
+        classes.update(df[TARGET_COL].astype(str).unique().tolist())
+        if profile is not None:
+            profile.update(df, categorical_cols)
+        n_rows += len(df)
+    if not n_rows:
+        raise ValueError(f"Dataset is empty: {path}")
+    return categorical_cols, {c: sorted(v) for c, v in categories.items()}, sorted(classes), n_rows
+
+
+def fit_preprocessor(path: Path, chunk_size: int, profile: Optional[drift.ReferenceBuilder] = None
+                     ) -> Tuple[ColumnTransformer, LabelEncoder, List[str], int]:
+    """Fit the one-hot preprocessor and label encoder from a streaming scan.
+
+    Categories are collected over the whole dataset and passed explicitly, so
+    fitting on the first chunk gives the same encoder as fitting on all rows.
+    """
+    categorical_cols, categories, classes, n_rows = scan_schema(path, chunk_size, profile)
+    first = next(iter_dataframe_chunks(path, min(chunk_size, 10_000)))
+    ohe = OneHotEncoder(
+        categories=[categories[c] for c in categorical_cols],
+        handle_unknown="ignore",
+        sparse_output=False,
+    )
+    pre = ColumnTransformer(transformers=[("cat", ohe, categorical_cols)], remainder="passthrough")
+    pre.fit(first[categorical_cols + NUMERIC_COLS])
+    le = LabelEncoder().fit(classes)
+    return pre, le, categorical_cols, n_rows
+
+
+def split_assignments(n: int, rng: np.random.Generator) -> np.ndarray:
+    """Assign each row to 0=train, 1=valid, 2=test."""
+    u = rng.random(n)
+    out = np.zeros(n, dtype=np.int8)
+    out[u < TEST_FRACTION + (1 - TEST_FRACTION) * VALID_FRACTION] = 1
+    out[u < TEST_FRACTION] = 2
+    return out
+
+
+def iter_encoded_chunks(path: Path, pre: ColumnTransformer, le: LabelEncoder, categorical_cols: List[str],
+                        chunk_size: int, seed: int):
+    """Yield (X float32, y int32, split int8) per chunk, with a deterministic split."""
+    rng = np.random.default_rng(seed)
+    for df in iter_dataframe_chunks(path, chunk_size):
+        X = pre.transform(df[categorical_cols + NUMERIC_COLS]).astype(np.float32, copy=False)
+        y = le.transform(df[TARGET_COL].astype(str)).astype(np.int32)
+        yield X, y, split_assignments(len(df), rng)
+
+
+def load_encoded(path: Path, pre: ColumnTransformer, le: LabelEncoder, categorical_cols: List[str],
+                 chunk_size: int, seed: int) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+    """Encode the dataset chunk by chunk into train/valid/test float32 matrices."""
+    parts: Dict[int, Tuple[List[np.ndarray], List[np.ndarray]]] = {0: ([], []), 1: ([], []), 2: ([], [])}
+    for X, y, split in iter_encoded_chunks(path, pre, le, categorical_cols, chunk_size, seed):
+        for s, (xs, ys) in parts.items():
+            mask = split == s
+            xs.append(X[mask])
+            ys.append(y[mask])
+    names = {0: "train", 1: "valid", 2: "test"}
+    return {names[s]: (np.vstack(xs), np.concatenate(ys)) for s, (xs, ys) in parts.items()}
+
+
+def evaluate(booster: xgb.Booster, X: np.ndarray, y: np.ndarray, class_names: List[str]) -> Dict[str, Any]:
+    """Accuracy, log loss and confusion matrix for one split."""
+    if len(y) == 0:
+        return {"rows": 0}
+    probs = booster.predict(xgb.DMatrix(X))
+    pred = probs.argmax(axis=1)
+    labels = list(range(len(class_names)))
+    return {
+        "rows": int(len(y)),
+        "accuracy": round(float(accuracy_score(y, pred)), 4),
+        "mlogloss": round(float(log_loss(y, probs, labels=labels)), 4),
+        "confusion_matrix": confusion_matrix(y, pred, labels=labels).tolist(),
+    }
+
+
+def train_in_memory(splits: Dict[str, Tuple[np.ndarray, np.ndarray]], n_classes: int, max_rounds: int,
+                    early_stopping: int, seed: int) -> Tuple[xgb.Booster, int]:
+    """Train with the hist method on all cores, early-stopping on the validation split.
+
+    Returns the booster truncated to the best iteration (the backend predicts
+    with every tree in the saved model) and that iteration.
+    """
+    X_train, y_train = splits["train"]
+    X_valid, y_valid = splits["valid"]
+    model = xgb.XGBClassifier(
+        n_estimators=max_rounds,
+        num_class=n_classes,
+        early_stopping_rounds=early_stopping,
+        n_jobs=os.cpu_count(),
+        random_state=seed,
+        **XGB_PARAMS,
+    )
+    model.fit(X_train, y_train, eval_set=[(X_valid, y_valid)], verbose=False)
+    best = int(model.best_iteration)
+    return model.get_booster()[: best + 1], best
+
+
+class EncodedPages:
+    """Encoded float32 pages of one split on disk (one .npy pair per source chunk)."""
+
+    def __init__(self, root: Path, name: str):
+        self.dir = Path(root) / name
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.pages: List[Tuple[Path, Path]] = []
+        self.rows = 0
+        self.n_features = 0
+
+    def append(self, X: np.ndarray, y: np.ndarray) -> None:
+        if len(y) == 0:
+            return
+        i = len(self.pages)
+        x_path, y_path = self.dir / f"X-{i:06d}.npy", self.dir / f"y-{i:06d}.npy"
+        np.save(x_path, X)
+        np.save(y_path, y)
+        self.pages.append((x_path, y_path))
+        self.rows += len(y)
+        self.n_features = X.shape[1]
+
+    def __iter__(self):
+        for x_path, y_path in self.pages:
+            yield np.load(x_path, mmap_mode="r"), np.load(y_path)
+
+
+class PageIterator(xgb.DataIter):
+    """Feeds the pages of one split to XGBoost one at a time."""
+
+    def __init__(self, pages: EncodedPages, cache_prefix: str):
+        self._pages = pages
+        self._it = None
+        super().__init__(cache_prefix=cache_prefix)
+
+    def reset(self) -> None:
+        self._it = iter(self._pages)
+
+    def next(self, input_data) -> bool:
+        if self._it is None:
+            self.reset()
+        try:
+            X, y = next(self._it)
+        except StopIteration:
+            return False
+        input_data(data=np.ascontiguousarray(X), label=y)
+        return True
+
+
+def encode_to_pages(path: Path, pre: ColumnTransformer, le: LabelEncoder, categorical_cols: List[str],
+                    chunk_size: int, seed: int, cache_dir: Path) -> Dict[str, EncodedPages]:
+    """One streaming pass writing every chunk's rows to the page set of its split."""
+    pages = {name: EncodedPages(cache_dir, name) for name in ("train", "valid", "test")}
+    names = {0: "train", 1: "valid", 2: "test"}
+    for X, y, split in iter_encoded_chunks(path, pre, le, categorical_cols, chunk_size, seed):
+        for s, name in names.items():
+            mask = split == s
+            pages[name].append(X[mask], y[mask])
+    return pages
+
+
+def evaluate_pages(booster: xgb.Booster, pages: EncodedPages, class_names: List[str]) -> Dict[str, Any]:
+    """Streaming version of evaluate(): accumulates counts and log loss page by page."""
+    k = len(class_names)
+    if pages.rows == 0:
+        return {"rows": 0}
+    cm = np.zeros((k, k), dtype=np.int64)
+    loss = 0.0
+    for X, y in pages:
+        probs = booster.predict(xgb.DMatrix(np.ascontiguousarray(X)))
+        pred = probs.argmax(axis=1)
+        np.add.at(cm, (y, pred), 1)
+        loss -= float(np.log(np.clip(probs[np.arange(len(y)), y], 1e-15, 1.0)).sum())
+    return {
+        "rows": int(pages.rows),
+        "accuracy": round(float(np.trace(cm) / cm.sum()), 4),
+        "mlogloss": round(loss / pages.rows, 4),
+        "confusion_matrix": cm.tolist(),
+    }
+
+
+def sample_background(pages: EncodedPages, size: int, seed: int) -> np.ndarray:
+    """Uniform sample of `size` training rows without loading the pages together."""
+    rng = np.random.default_rng(seed)
+    p = min(1.0, 2.0 * size / max(1, pages.rows))
+    picked = [np.asarray(X[rng.random(len(y)) < p]) for X, y in pages]
+    rows = np.vstack(picked) if picked else np.empty((0, pages.n_features), dtype=np.float32)
+    if len(rows) > size:
+        rows = rows[rng.choice(len(rows), size=size, replace=False)]
+    return rows
+
+
+def train_external_memory(pages: Dict[str, EncodedPages], n_classes: int, max_rounds: int,
+                          early_stopping: int, seed: int, cache_dir: Path) -> Tuple[xgb.Booster, int]:
+    """Train from on-disk pages with ExtMemQuantileDMatrix (hist), early-stopping on valid."""
+    dtrain = xgb.ExtMemQuantileDMatrix(PageIterator(pages["train"], str(cache_dir / "xgb-train")),
+                                       nthread=os.cpu_count())
+    evals = []
+    if pages["valid"].rows:
+        dvalid = xgb.ExtMemQuantileDMatrix(PageIterator(pages["valid"], str(cache_dir / "xgb-valid")),
+                                           ref=dtrain, nthread=os.cpu_count())
+        evals = [(dvalid, "valid")]
+    params = {**XGB_PARAMS, "num_class": n_classes, "nthread": os.cpu_count(), "seed": seed}
+    booster = xgb.train(
+        params,
+        dtrain,
+        num_boost_round=max_rounds,
+        evals=evals,
+        early_stopping_rounds=early_stopping if evals else None,
+        verbose_eval=False,
+    )
+    best = int(booster.best_iteration) if evals else max_rounds - 1
+    return booster[: best + 1], best
+
+
+def write_artifacts(model_dir: Path, pre: ColumnTransformer, le: LabelEncoder, booster: xgb.Booster,
+                    categorical_cols: List[str], shap_bg: np.ndarray, manifest: Dict[str, Any],
+                    drift_reference: Dict[str, Any]) -> None:
+    """Write every artifact into a staging directory, then swap it in place of model_dir.
+
+    The swap is two renames: the current model_dir to a backup, then the
+    staging directory to model_dir. No reader sees a half-written model or a
+    mix of two models' files, but a crash between the renames leaves no
+    model_dir; model_artifacts.load_artifacts then loads the backup, and the
+    next run replaces it.
+    """
+    model_dir = Path(model_dir)
+    model_dir.parent.mkdir(parents=True, exist_ok=True)
+    stamp = time.strftime("%Y%m%d%H%M%S")
+    staging = model_dir.parent / f".{model_dir.name}.staging-{stamp}"
+    backup = model_artifacts.previous_model_dir(model_dir, stamp)
+    if staging.exists():
+        shutil.rmtree(staging)
+    staging.mkdir()
+
+    class_names = [str(c) for c in le.classes_]
+    onehot_names = list(pre.named_transformers_["cat"].get_feature_names_out(categorical_cols))
+
+    joblib.dump(pre, staging / "preprocessor.joblib")
+    joblib.dump(le, staging / "label_encoder.joblib")
+    booster.save_model(str(staging / "xgboost_model.json"))
+    with open(staging / "feature_names.json", "w", encoding="utf-8") as f:
+        json.dump({
+            "numeric_cols": NUMERIC_COLS,
+            "categorical_cols": categorical_cols,
+            "onehot_feature_names": onehot_names,
+            "all_feature_names_after_pre": onehot_names + NUMERIC_COLS,
+            "class_names": class_names,
+        }, f, indent=2)
+    np.save(staging / "shap_background.npy", shap_bg)
+    with open(staging / "drift_reference.json", "w", encoding="utf-8") as f:
+        json.dump(drift_reference, f)
+    with open(staging / "manifest.json", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    for p in staging.iterdir():
+        with open(p, "rb") as f:
+            os.fsync(f.fileno())
+
+    if model_dir.exists():
+        os.rename(model_dir, backup)
+    os.rename(staging, model_dir)
+    # Including backups left by a run that stopped between the renames
+    for previous in model_artifacts.previous_model_dirs(model_dir):
+        shutil.rmtree(previous)
+
+
+def build_manifest(le: LabelEncoder, categorical_cols: List[str], shapes: Dict[str, List[int]],
+                   training: Dict[str, Any]) -> Dict[str, Any]:
+    """Manifest in the notebook's layout, plus a `training` block with timings and metrics."""
+    class_names = [str(c) for c in le.classes_]
+    return {
+        "model_type": "xgboost.XGBClassifier",
+        "objective": "multi:softprob",
+        "n_classes": len(class_names),
+        "class_names": class_names,
+        "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "training_data": shapes,
+        "feature_schema": {
+            "numeric_cols": NUMERIC_COLS,
+            "categorical_cols": categorical_cols,
+        },
+        "artifacts": {
+            "preprocessor": "preprocessor.joblib",
+            "label_encoder": "label_encoder.joblib",
+            "model_json": "xgboost_model.json",
+            "feature_names": "feature_names.json",
+            "shap_background": "shap_background.npy",
+            "drift_reference": "drift_reference.json",
+        },
+        "training": training,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Train the underwriting model and export serving artifacts.")
+    parser.add_argument("data", type=Path, help="generator output (.ndjson/.parquet/.json or a shard directory)")
+    parser.add_argument("--model-dir", type=Path, default=MODEL_DIR)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--max-rounds", type=int, default=2000, help="upper bound on boosting rounds")
+    parser.add_argument("--early-stopping", type=int, default=50, help="rounds without validation improvement")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--external-memory", action="store_true",
+                        help="train from encoded pages on disk instead of in-memory matrices")
+    parser.add_argument("--cache-dir", type=Path, default=None,
+                        help="where to put encoded pages and XGBoost caches (default: a temp dir)")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    profile = drift.ReferenceBuilder(NUMERIC_COLS, seed=args.seed)
+    pre, le, categorical_cols, n_rows = fit_preprocessor(args.data, args.chunk_size, profile)
+    t_fit_pre = time.perf_counter() - t0
+    print(f"Scanned {n_rows} rows, fitted preprocessor ({t_fit_pre:.1f}s)")
+    class_names = [str(c) for c in le.classes_]
+    n_features = len(pre.get_feature_names_out())
+
+    if args.external_memory:
+        cache_dir = Path(tempfile.mkdtemp(prefix="pax-train-", dir=args.cache_dir))
+        try:
+            pages = encode_to_pages(args.data, pre, le, categorical_cols, args.chunk_size, args.seed, cache_dir)
+            t_encode = time.perf_counter() - t0 - t_fit_pre
+            print("Encoded pages:", {k: v.rows for k, v in pages.items()}, f"({t_encode:.1f}s)")
+
+            t_train0 = time.perf_counter()
+            booster, best_iteration = train_external_memory(pages, len(class_names), args.max_rounds,
+                                                            args.early_stopping, args.seed, cache_dir)
+            t_train = time.perf_counter() - t_train0
+            print(f"Trained {best_iteration + 1} rounds ({t_train:.1f}s)")
+
+            metrics = {name: evaluate_pages(booster, pages[name], class_names) for name in ("valid", "test")}
+            shap_bg = sample_background(pages["train"], SHAP_BACKGROUND_SIZE, args.seed)
+            split_rows = {name: p.rows for name, p in pages.items()}
+        finally:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+    else:
+        splits = load_encoded(args.data, pre, le, categorical_cols, args.chunk_size, args.seed)
+        t_encode = time.perf_counter() - t0 - t_fit_pre
+        print("Encoded splits:", {k: v[0].shape for k, v in splits.items()}, f"({t_encode:.1f}s)")
+
+        t_train0 = time.perf_counter()
+        booster, best_iteration = train_in_memory(splits, len(class_names), args.max_rounds, args.early_stopping,
+                                                  args.seed)
+        t_train = time.perf_counter() - t_train0
+        print(f"Trained {best_iteration + 1} rounds ({t_train:.1f}s)")
+
+        metrics = {name: evaluate(booster, *splits[name], class_names) for name in ("valid", "test")}
+        X_train = splits["train"][0]
+        rng = np.random.default_rng(args.seed)
+        bg_idx = rng.choice(X_train.shape[0], size=min(SHAP_BACKGROUND_SIZE, X_train.shape[0]), replace=False)
+        shap_bg = X_train[bg_idx]
+        split_rows = {name: len(y) for name, (_, y) in splits.items()}
+
+    shapes = {f"X_shape_{name}_t": [int(rows), n_features] for name, rows in split_rows.items()}
+    training = {
+        "mode": "external_memory" if args.external_memory else "in_memory",
+        "source": str(args.data),
+        "rows": n_rows,
+        "nthread": os.cpu_count(),
+        "params": XGB_PARAMS,
+        "max_rounds": args.max_rounds,
+        "early_stopping_rounds": args.early_stopping,
+        "best_iteration": best_iteration,
+        "seconds": {
+            "preprocessor": round(t_fit_pre, 2),
+            "encode": round(t_encode, 2),
+            "train": round(t_train, 2),
+            "total": round(time.perf_counter() - t0, 2),
+        },
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "metrics": metrics,
+    }
+    manifest = build_manifest(le, categorical_cols, shapes, training)
+    write_artifacts(args.model_dir, pre, le, booster, categorical_cols, shap_bg, manifest, profile.finish())
+
+    print("Validation:", {k: v for k, v in metrics["valid"].items() if k != "confusion_matrix"})
+    print("Test:", {k: v for k, v in metrics["test"].items() if k != "confusion_matrix"})
+    print(f"Peak RSS: {training['peak_rss_mb']} MB")
+    print("Artifacts saved to:", args.model_dir)
+
+
+if __name__ == "__main__":
+    main()